@@ -1,28 +1,77 @@
 from dotenv import load_dotenv
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Request
-from starlette.responses import StreamingResponse
+from starlette.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 import shutil
 import os
+import asyncio
 import logging
 from pathlib import Path
 import config
 import json
 from pydantic import BaseModel, Field
 import datetime
-from typing import Dict
-from assistant.multi_agent_system_v2 import builder
-
-from langgraph.checkpoint.memory import MemorySaver
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, Optional
+from assistant.llm_cache import bypass_cache
+from assistant.llm_scheduler import BATCH, priority, scheduler
+from assistant import http_pool, metrics
+from assistant.models import prewarm
+from assistant.multi_agent_system_v2 import get_graph
+from app.jobs import FINISHED, SUCCEEDED, JobManager, QueueFullError
+from app.sessions import SessionStore
+from app.streaming import current_chapter, graph_events, sse_format, sse_stream
 
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-thread = {"configurable": {"thread_id": "1"}}
-memory = MemorySaver()
-graph = builder.compile(checkpointer=memory)
+@lru_cache(maxsize=None)
+def sessions():
+    """The session store on the graph's checkpointer, built on first use, so
+    importing the API neither compiles the graph nor opens the checkpoints."""
+    return SessionStore(
+        get_graph().checkpointer,
+        ttl_seconds=config.SESSION_TTL_SECONDS,
+        max_sessions=config.SESSION_MAX_COUNT,
+        max_bytes=config.SESSION_MAX_BYTES,
+    )
+
+
+generation_slots = asyncio.Semaphore(config.MAX_CONCURRENT_GENERATIONS)
+
+
+
+async def run_job(job):
+    # Background jobs yield to the model calls of interactive requests.
+    with bypass_cache(job.no_cache), priority(BATCH):
+        async with sessions().use(job.session_id) as thread, metrics.queued(generation_slots, "generation", "batch"):
+            async for event, data in graph_events(get_graph(), job.values, thread):
+                job.record(event, data)
+
+
+jobs = JobManager(
+    run_job,
+    workers=config.JOB_WORKERS,
+    queue_size=config.JOB_QUEUE_SIZE,
+    result_ttl=config.JOB_RESULT_TTL_SECONDS,
+    max_results=config.JOB_RESULT_CACHE_SIZE,
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Compiled and opened at startup rather than by the first request.
+    sessions()
+    if config.LLM_PREWARM_CONNECTIONS:
+        await prewarm(config.LLM_PREWARM_CONNECTIONS)
+    await jobs.start()
+    yield
+    await jobs.stop()
+    await http_pool.close()
+
 
 router = APIRouter()
 
@@ -34,28 +83,144 @@ async def query():
         
     return assistant_response
 
+@router.post("/sessions/")
+async def create_session():
+    return {"session_id": sessions().create()}
+
+
 class StreamRequest(BaseModel):
     instruction: str
     details: str
     personas: Dict[str, str]  # Dictionary of string keys and string values
+    session_id: Optional[str] = None
+    no_cache: bool = False  # Re-roll instead of replaying cached LLM responses
+
+
+async def session_event_stream(session_id, values, no_cache):
+    with bypass_cache(no_cache):
+        async with sessions().use(session_id) as thread:
+            yield sse_format("session", {"session_id": session_id})
+            async for chunk in sse_stream(get_graph(), values, thread, generation_slots):
+                yield chunk
+
+
+def event_stream_response(session_id, values, no_cache):
+    return StreamingResponse(
+        session_event_stream(session_id, values, no_cache),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def generate(session_id, values, no_cache):
+    with bypass_cache(no_cache):
+        async with sessions().use(session_id) as thread, metrics.queued(generation_slots, "generation", "interactive"):
+            response = await get_graph().ainvoke(values, {**thread, "callbacks": [metrics.handler]})
+    return {**current_chapter(response), "session_id": session_id}
+
+
+def check_session(session_id):
+    if not sessions().exists(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+
 
 @router.post("/stream/")
-async def stream(request: StreamRequest, graph=graph):
-    graph = builder.compile(checkpointer=memory)
-    response = graph.invoke({"instruction": request.instruction, "details": request.details, "personas":request.personas}, thread)
-    chapter_graph = response.get("chapter_graph")
-    for chapter_id, chapter in chapter_graph.items():
-        return chapter
+async def stream(request: StreamRequest, sse: bool = False):
+    session_id = request.session_id or sessions().create()
+    check_session(session_id)
+    values = {"instruction": request.instruction, "details": request.details, "personas":request.personas}
+    if sse:
+        return event_stream_response(session_id, values, request.no_cache)
+    return await generate(session_id, values, request.no_cache)
 
 
-@router.post("/update/")
-async def update(action_type: str, instructions: str):
+def update_values(action_type, instructions, branches):
+    # The graph routes on which instructions are set, and the thread keeps the
+    # previous request's, so each action clears the other's.
     values = {}
     if action_type == "continue":
         values["continue_instructions"] = instructions
+        values["continue_branches"] = branches
+        values["rewrite_instructions"] = ""
     elif action_type == "rewrite":
         values["rewrite_instructions"] = instructions
-    response = graph.invoke(values, thread)
-    chapter_graph = response.get("chapter_graph")
-    for chapter_id, chapter in chapter_graph.items():
-        return chapter
\ No newline at end of file
+        values["continue_instructions"] = ""
+    return values
+
+
+@router.post("/update/")
+async def update(action_type: str, instructions: str, session_id: str, sse: bool = False, no_cache: bool = False, branches: int = 1):
+    check_session(session_id)
+    values = update_values(action_type, instructions, branches)
+    if sse:
+        return event_stream_response(session_id, values, no_cache)
+    return await generate(session_id, values, no_cache)
+
+
+@router.post("/view/")
+async def view(session_id: str, chapter_id: str):
+    """Switch the chapter a session is viewing, e.g. to another branch."""
+    check_session(session_id)
+    graph = get_graph()
+    async with sessions().use(session_id) as thread:
+        state = await graph.aget_state(thread)
+        if chapter_id not in (state.values.get("chapter_graph") or {}):
+            raise HTTPException(status_code=404, detail=f"Unknown chapter {chapter_id}")
+        await graph.aupdate_state(thread, {"chapter_id_viewing": chapter_id})
+    return {**current_chapter({**state.values, "chapter_id_viewing": chapter_id}), "session_id": session_id}
+
+
+def submit_job(session_id, values, no_cache):
+    try:
+        job = jobs.submit(session_id, values, no_cache)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+
+@router.post("/jobs/stream/", status_code=202)
+async def submit_stream_job(request: StreamRequest):
+    session_id = request.session_id or sessions().create()
+    check_session(session_id)
+    values = {"instruction": request.instruction, "details": request.details, "personas":request.personas}
+    return submit_job(session_id, values, request.no_cache)
+
+
+@router.post("/jobs/update/", status_code=202)
+async def submit_update_job(action_type: str, instructions: str, session_id: str, no_cache: bool = False, branches: int = 1):
+    check_session(session_id)
+    return submit_job(session_id, update_values(action_type, instructions, branches), no_cache)
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job(job_id).to_dict()
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = get_job(job_id)
+    if job.status not in FINISHED:
+        return JSONResponse(job.to_dict(), status_code=202)
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} {job.status}: {job.error}")
+    return job.result
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    get_job(job_id)
+    return jobs.cancel(job_id).to_dict()
+
+
+@router.get("/scheduler/")
+async def scheduler_metrics():
+    """Queue depth, in-flight calls and rate limiting per model provider."""
+    return scheduler.metrics()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+from assistant import metrics
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, session_id, values, no_cache=False):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.values = values
+        self.no_cache = no_cache
+        self.status = QUEUED
+        self.progress = None
+        self.content = ""
+        self.result = None
+        self.error = None
+        self.task = None
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+
+    def record(self, event, data):
+        """Fold one ``graph_events`` event into the job's observable state."""
+        if event == "node":
+            self.progress = data
+        elif event == "token" and data["branch"] == 0:
+            self.content += data["token"]
+        elif event == "chapter":
+            self.result = {**data, "session_id": self.session_id}
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "progress": self.progress,
+            "content": self.result["content"] if self.result else self.content,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Run story generations in the background on a pool of worker tasks.
+
+    Submitted jobs wait in a bounded queue; when it is full ``submit`` raises
+    :class:`QueueFullError` instead of accepting work it cannot start soon.
+    Finished jobs stay available for polling for ``result_ttl`` seconds, at
+    most ``max_results`` of them.
+    """
+
+    def __init__(self, run, workers, queue_size, result_ttl, max_results):
+        self.run = run
+        self.num_workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.jobs = {}
+        self.finished = OrderedDict()
+        self.workers = []
+
+    async def start(self):
+        self.workers = [
+            asyncio.create_task(self.worker()) for _ in range(self.num_workers)
+        ]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, session_id, values, no_cache=False):
+        self.prune()
+        job = Job(session_id, values, no_cache)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self.queue.maxsize} jobs are already waiting")
+        self.jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id):
+        self.prune()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued, the worker that picks it up will skip it.
+            self.finish(job, CANCELLED)
+        return job
+
+    def finish(self, job, status):
+        job.status = status
+        job.finished_at = time.monotonic()
+        self.finished[job.job_id] = job
+
+    def prune(self):
+        now = time.monotonic()
+        while self.finished:
+            job_id, job = next(iter(self.finished.items()))
+            if len(self.finished) <= self.max_results and now - job.finished_at <= self.result_ttl:
+                break
+            del self.finished[job_id]
+            del self.jobs[job_id]
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == QUEUED:
+                    await self.execute(job)
+            finally:
+                self.queue.task_done()
+
+    async def execute(self, job):
+        metrics.queue_seconds.observe("jobs", "batch", value=time.monotonic() - job.submitted_at)
+        job.status = RUNNING
+        job.task = asyncio.create_task(self.run(job))
+        await asyncio.wait({job.task})
+        if job.task.cancelled():
+            self.finish(job, CANCELLED)
+        elif job.task.exception() is not None:
+            logging.error("Job %s failed", job.job_id, exc_info=job.task.exception())
+            job.error = str(job.task.exception())
+            self.finish(job, FAILED)
+        else:
+            self.finish(job, SUCCEEDED)
+        job.task = None
@@ -0,0 +1,106 @@
+import asyncio
+import re
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class UnknownSessionError(KeyError):
+    pass
+
+
+class SessionStore:
+    """Issue story session ids and keep their graph threads within bounds.
+
+    Sessions are kept in least-recently-used order. After every generation and
+    every new session the store evicts sessions that have been idle for
+    longer than ``ttl_seconds`` and, oldest first, as many more as needed to
+    get back under ``max_sessions`` resident sessions and ``max_bytes`` of
+    checkpoint data. Evicted sessions are spilled to disk by the checkpointer
+    and restored on their next request, so an evicted session is never lost,
+    only cold; one evicted before its first generation has nothing to spill
+    and is forgotten. The sqlite checkpointer keeps no thread in memory, so
+    its threads count 0 bytes and only the count and idle time apply.
+    Generations of one session run one at a time, each on the state the
+    previous one left.
+    """
+
+    def __init__(self, checkpointer, ttl_seconds, max_sessions, max_bytes):
+        self.checkpointer = checkpointer
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        # session_id -> [last access time, resident bytes]
+        self.resident = OrderedDict()
+        self.active = {}
+        self.locks = {}
+
+    def create(self):
+        session_id = uuid.uuid4().hex
+        self.resident[session_id] = [time.monotonic(), 0]
+        # Even with a TTL of 0, the new session survives its own creation.
+        self.evict(keep=session_id)
+        return session_id
+
+    def exists(self, session_id):
+        if not SESSION_ID_PATTERN.fullmatch(session_id):
+            return False
+        return session_id in self.resident or self.checkpointer.has_thread(session_id)
+
+    @staticmethod
+    def thread(session_id):
+        return {"configurable": {"thread_id": session_id}}
+
+    @asynccontextmanager
+    async def use(self, session_id):
+        """Mark a session as in use for the duration of a generation, holding
+        its lock so concurrent requests to it wait for each other.
+
+        Yields the graph config for the session's thread.
+        """
+        if not self.exists(session_id):
+            raise UnknownSessionError(session_id)
+        # Counted while waiting for the lock too, so it is not evicted meanwhile.
+        self.active[session_id] = self.active.get(session_id, 0) + 1
+        lock = self.locks.setdefault(session_id, asyncio.Lock())
+        try:
+            async with lock:
+                if session_id not in self.resident:
+                    self.checkpointer.restore(session_id)
+                    self.resident[session_id] = [time.monotonic(), 0]
+                yield self.thread(session_id)
+        finally:
+            self.active[session_id] -= 1
+            if not self.active[session_id]:
+                del self.active[session_id]
+                del self.locks[session_id]
+            if session_id in self.resident:
+                self.resident[session_id] = [
+                    time.monotonic(),
+                    self.checkpointer.thread_size(session_id),
+                ]
+                self.resident.move_to_end(session_id)
+            self.evict()
+
+    def resident_bytes(self):
+        return sum(size for _, size in self.resident.values())
+
+    def evict(self, keep=None):
+        now = time.monotonic()
+        total_bytes = self.resident_bytes()
+        for session_id, (last_access, size) in list(self.resident.items()):
+            if session_id in self.active or session_id == keep:
+                continue
+            over_budget = (
+                len(self.resident) > self.max_sessions or total_bytes > self.max_bytes
+            )
+            if not over_budget and now - last_access <= self.ttl_seconds:
+                # Remaining sessions are more recent and we are within budget.
+                break
+            self.checkpointer.spill(session_id)
+            del self.resident[session_id]
+            total_bytes -= size
@@ -0,0 +1,84 @@
+import json
+import logging
+
+from assistant import metrics
+from assistant.chapter_tree import ChapterTree
+
+
+GRAPH_NODES = ("first", "rewrite", "continue")
+TOKEN_STREAM_ROLES = ("chapter_writer",)
+
+
+def sse_format(event, data):
+    """Serialise one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def current_chapter(values):
+    """Return the chapter the user is currently viewing in a graph state,
+    together with the ids of the chapters related to it."""
+    chapter_graph = values.get("chapter_graph") or {}
+    chapter_id = values.get("chapter_id_viewing")
+    chapter = chapter_graph.get(chapter_id)
+    if chapter is None:
+        return None
+    if values.get("chapter_tree"):
+        tree = ChapterTree.from_dict(values["chapter_tree"])
+        relations = {
+            "parent": str(tree.parent(int(chapter_id))),
+            "children": [str(i) for i in tree.children(int(chapter_id))],
+            "siblings": [str(i) for i in tree.siblings(int(chapter_id))],
+            "cousins": [str(i) for i in tree.cousins(int(chapter_id))],
+        }
+    else:
+        relations = {}
+    return {
+        **chapter,
+        **relations,
+        "chapter_id": chapter_id,
+        "story_title": values.get("story_title", ""),
+    }
+
+
+async def graph_events(graph, values, thread):
+    """Run the story graph and yield ``(event, data)`` pairs as it progresses.
+
+    ``node`` events mark the start and end of the graph nodes and of every
+    named chat model inside them, ``token`` events carry the ``chapter_writer``
+    output as it is generated (``branch`` tells apart alternative chapters
+    written at the same time) and a final ``chapter`` event holds the chapter
+    the user is now viewing.
+    """
+    run_config = {**thread, "callbacks": [metrics.handler]}
+    async for event in graph.astream_events(values, run_config, version="v2"):
+        kind = event["event"]
+        name = event.get("metadata", {}).get("name")
+        if kind in ("on_chain_start", "on_chain_end") and event["name"] in GRAPH_NODES:
+            status = "start" if kind == "on_chain_start" else "end"
+            yield "node", {"node": event["name"], "status": status}
+        elif kind in ("on_chat_model_start", "on_chat_model_end") and name:
+            status = "start" if kind == "on_chat_model_start" else "end"
+            yield "node", {"node": name, "status": status}
+        elif kind == "on_chat_model_stream" and name in TOKEN_STREAM_ROLES:
+            token = event["data"]["chunk"].content
+            if token:
+                branch = event["metadata"].get("branch", 0)
+                yield "token", {"node": name, "token": token, "branch": branch}
+
+    state = await graph.aget_state(thread)
+    yield "chapter", current_chapter(state.values)
+
+
+async def sse_stream(graph, values, thread, slots):
+    """Wrap :func:`graph_events` as an SSE byte stream, reporting failures in-band.
+
+    The generation only starts once a slot is free in the ``slots`` semaphore.
+    """
+    try:
+        async with metrics.queued(slots, "generation", "interactive"):
+            async for event, data in graph_events(graph, values, thread):
+                yield sse_format(event, data)
+    except Exception as e:
+        logging.exception("Story generation failed")
+        yield sse_format("error", {"detail": str(e)})
+    yield sse_format("done", {})
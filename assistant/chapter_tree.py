@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+
+ROOT = -1
+
+
+class ChapterTree:
+    """The shape of a story's chapter graph, stored as two flat int arrays.
+
+    Chapter ``i`` (1-based, the ids used as ``chapter_graph`` keys) has parent
+    ``parents[i - 1]`` (``ROOT`` for the first chapter) and belongs to the
+    rewrite group started by chapter ``origins[i - 1]``: a continuation starts
+    its own group, a rewrite joins the group of the chapter it rewrites.
+
+    Children, siblings (other versions of the same chapter), cousins (other
+    continuations of the same parent) and ancestor paths are derived on
+    demand; only the two arrays are stored in the graph state.
+    """
+
+    __slots__ = ("parents", "origins", "_continuations", "_versions")
+
+    def __init__(self, parents=(), origins=()):
+        self.parents = list(parents)
+        self.origins = list(origins)
+        self._continuations = None
+        self._versions = None
+
+    def __len__(self):
+        return len(self.parents)
+
+    def _index(self):
+        if self._continuations is None:
+            self._continuations = defaultdict(list)
+            self._versions = defaultdict(list)
+            for chapter_id in range(1, len(self) + 1):
+                self._link(chapter_id)
+
+    def _link(self, chapter_id):
+        origin = self.origins[chapter_id - 1]
+        if origin == chapter_id:
+            self._continuations[self.parents[chapter_id - 1]].append(chapter_id)
+        self._versions[origin].append(chapter_id)
+
+    def _append(self, parent, origin):
+        chapter_id = len(self) + 1
+        self.parents.append(parent)
+        self.origins.append(origin or chapter_id)
+        if self._continuations is not None:
+            self._link(chapter_id)
+        return chapter_id
+
+    def add_continuation(self, parent):
+        """Add a chapter following ``parent`` and return its id."""
+        return self._append(parent, None)
+
+    def add_rewrite(self, chapter_id):
+        """Add a new version of ``chapter_id`` and return its id."""
+        return self._append(self.parent(chapter_id), self.origins[chapter_id - 1])
+
+    def parent(self, chapter_id):
+        return self.parents[chapter_id - 1]
+
+    def children(self, chapter_id):
+        self._index()
+        return list(self._continuations.get(chapter_id, ()))
+
+    def siblings(self, chapter_id):
+        self._index()
+        return [
+            version
+            for version in self._versions[self.origins[chapter_id - 1]]
+            if version != chapter_id
+        ]
+
+    def cousins(self, chapter_id):
+        self._index()
+        origin = self.origins[chapter_id - 1]
+        return [
+            continuation
+            for continuation in self._continuations[self.parent(chapter_id)]
+            if continuation != origin
+        ]
+
+    def path(self, chapter_id):
+        """Chapter ids from the first chapter down to ``chapter_id``."""
+        path = []
+        while chapter_id != ROOT:
+            path.append(chapter_id)
+            chapter_id = self.parents[chapter_id - 1]
+        return path[::-1]
+
+    def to_dict(self):
+        return {"parents": self.parents, "origins": self.origins}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["parents"], data["origins"])
+
+    @classmethod
+    def from_chapter_graph(cls, chapter_graph):
+        """Rebuild the tree of a story saved with per-chapter relation lists."""
+        tree = cls()
+        for chapter_id in sorted(chapter_graph, key=int):
+            chapter = chapter_graph[chapter_id]
+            versions = [int(sibling) for sibling in chapter.get("siblings", [])]
+            tree.parents.append(int(chapter["parent"]))
+            tree.origins.append(min(versions + [int(chapter_id)]))
+        return tree
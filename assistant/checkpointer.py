@@ -0,0 +1,279 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+import config
+
+
+class SpillingMemorySaver(MemorySaver):
+    """A MemorySaver whose threads can be moved to disk while idle.
+
+    Spilled threads are written to ``spill_dir`` as they are stored in memory
+    (already serialised checkpoints) and transparently restored the next time
+    the thread is used.
+    """
+
+    def __init__(self, spill_dir, *, serde=None):
+        super().__init__(serde=serde)
+        self.spill_dir = Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def _spill_path(self, thread_id):
+        return self.spill_dir / f"{thread_id}.pkl"
+
+    def _thread_writes(self, thread_id):
+        return [key for key in self.writes if key[0] == thread_id]
+
+    def has_thread(self, thread_id):
+        return bool(self.storage.get(thread_id)) or self._spill_path(thread_id).exists()
+
+    def thread_size(self, thread_id):
+        """Approximate number of bytes a thread occupies in memory."""
+        with self.lock:
+            size = sum(
+                len(checkpoint) + len(metadata)
+                for checkpoint, metadata, _ in self.storage.get(thread_id, {}).values()
+            )
+            for key in self._thread_writes(thread_id):
+                size += sum(len(value) for _, _, value in self.writes[key])
+        return size
+
+    def spill(self, thread_id):
+        """Move a thread's checkpoints from memory to disk."""
+        with self.lock:
+            if not self.storage.get(thread_id):
+                return
+            writes = {key: self.writes.pop(key) for key in self._thread_writes(thread_id)}
+            checkpoints = self.storage.pop(thread_id)
+        path = self._spill_path(thread_id)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump((checkpoints, writes), file)
+        os.replace(tmp_path, path)
+
+    def restore(self, thread_id):
+        """Load a spilled thread back into memory, if it was spilled."""
+        path = self._spill_path(thread_id)
+        if not path.exists():
+            return
+        with open(path, "rb") as file:
+            checkpoints, writes = pickle.load(file)
+        with self.lock:
+            self.storage[thread_id].update(checkpoints)
+            for key, value in writes.items():
+                self.writes[key].extend(value)
+        path.unlink()
+
+    def delete_thread(self, thread_id):
+        """Forget a thread entirely, in memory and on disk."""
+        with self.lock:
+            self.storage.pop(thread_id, None)
+            for key in self._thread_writes(thread_id):
+                del self.writes[key]
+        self._spill_path(thread_id).unlink(missing_ok=True)
+
+
+class SqliteCheckpointSaver(SqliteSaver):
+    """A durable, file-backed checkpointer for story sessions.
+
+    Extends langgraph's SqliteSaver with async support (queries run on the
+    default executor, serialised on a single connection), a ``threads`` table
+    recording when each thread was last written, and periodic maintenance
+    that keeps only the latest ``keep_last`` checkpoints of every thread and
+    deletes threads that have not been written for ``ttl_seconds``.
+
+    Checkpoints live on disk, so the session store has nothing to spill.
+    """
+
+    def __init__(
+        self,
+        conn,
+        *,
+        keep_last=None,
+        ttl_seconds=None,
+        maintenance_interval=None,
+        serde=None,
+    ):
+        super().__init__(conn, serde=serde)
+        self.lock = threading.RLock()
+        self.keep_last = keep_last
+        self.ttl_seconds = ttl_seconds
+        self.maintenance_interval = maintenance_interval
+        self.last_maintenance = time.monotonic()
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        return cls(sqlite3.connect(path, check_same_thread=False), **kwargs)
+
+    def setup(self):
+        if self.is_setup:
+            return
+        # Must precede table creation to take effect on a new database.
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        super().setup()
+        self.conn.executescript(
+            """
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        with self.lock, super().cursor(transaction) as cur:
+            yield cur
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # Materialise the rows so the connection lock is not held while the
+        # caller iterates, possibly from another executor thread.
+        with self.lock:
+            checkpoints = [
+                *super().list(config, filter=filter, before=before, limit=limit)
+            ]
+        return iter(checkpoints)
+
+    def put(self, config, checkpoint, metadata):
+        saved_config = super().put(config, checkpoint, metadata)
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, updated_at) VALUES (?, ?)",
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+        if (
+            self.maintenance_interval is not None
+            and time.monotonic() - self.last_maintenance > self.maintenance_interval
+        ):
+            self.maintain()
+        return saved_config
+
+    async def aget_tuple(self, config):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.get_tuple, config
+        )
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)],
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.put, config, checkpoint, metadata
+        )
+
+    async def aput_writes(self, config, writes, task_id):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.put_writes, config, writes, task_id
+        )
+
+    def compact(self, keep_last):
+        """Delete all but the latest ``keep_last`` checkpoints of every thread."""
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id ORDER BY thread_ts DESC
+                        ) AS position
+                        FROM checkpoints
+                    )
+                    WHERE position > ?
+                )
+                """,
+                (keep_last,),
+            )
+            cur.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints
+                    WHERE checkpoints.thread_id = writes.thread_id
+                    AND checkpoints.thread_ts = writes.thread_ts
+                )
+                """
+            )
+
+    def expire(self, ttl_seconds):
+        """Delete threads that have not been written for ``ttl_seconds``."""
+        with self.cursor() as cur:
+            cur.execute(
+                "SELECT thread_id FROM threads WHERE updated_at < ?",
+                (time.time() - ttl_seconds,),
+            )
+            expired = [thread_id for thread_id, in cur.fetchall()]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return expired
+
+    def maintain(self):
+        """Run compaction and expiry, then return freed pages and fold the WAL
+        back into the database."""
+        self.last_maintenance = time.monotonic()
+        if self.keep_last is not None:
+            self.compact(self.keep_last)
+        if self.ttl_seconds is not None:
+            self.expire(self.ttl_seconds)
+        with self.lock:
+            # executescript steps the pragma to completion; a cursor would
+            # only free a single page.
+            self.conn.executescript("PRAGMA incremental_vacuum;")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def delete_thread(self, thread_id):
+        with self.cursor() as cur:
+            for table in ("checkpoints", "writes", "threads"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def has_thread(self, thread_id):
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT 1 FROM threads WHERE thread_id = ?", (thread_id,))
+            return cur.fetchone() is not None
+
+    def thread_size(self, thread_id):
+        # Threads are read from disk when used, none is held in memory.
+        return 0
+
+    def spill(self, thread_id):
+        pass
+
+    def restore(self, thread_id):
+        pass
+
+
+def database_size(path):
+    """The bytes of the SQLite database at ``path``, counting its write-ahead
+    log and shared-memory files, where recent writes sit until the WAL is
+    checkpointed."""
+    return sum(
+        os.path.getsize(f"{path}{suffix}")
+        for suffix in ("", "-wal", "-shm")
+        if os.path.exists(f"{path}{suffix}")
+    )
+
+
+def make_checkpointer():
+    """Build the checkpointer selected by ``config.CHECKPOINT_BACKEND``."""
+    if config.CHECKPOINT_BACKEND == "memory":
+        return SpillingMemorySaver(config.SESSION_SPILL_DIR)
+    return SqliteCheckpointSaver.from_path(
+        config.CHECKPOINT_DB_PATH,
+        keep_last=config.CHECKPOINT_KEEP_LAST,
+        ttl_seconds=config.CHECKPOINT_TTL_SECONDS,
+        maintenance_interval=config.CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS,
+    )
@@ -0,0 +1,65 @@
+import asyncio
+import importlib
+import logging
+import threading
+
+import httpx
+
+import config
+
+
+# One keep-alive connection pool per provider and I/O kind, shared by every
+# model client: (provider, "sync" | "async") -> client. The SDKs' default
+# clients keep their usual timeouts and redirect handling.
+clients = {}
+lock = threading.Lock()
+
+
+def limits():
+    return httpx.Limits(
+        max_connections=config.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=config.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=config.LLM_POOL_KEEPALIVE_SECONDS,
+    )
+
+
+def client(provider, kind):
+    with lock:
+        if (provider, kind) not in clients:
+            sdk = importlib.import_module(provider)
+            factory = sdk.DefaultHttpxClient if kind == "sync" else sdk.DefaultAsyncHttpxClient
+            clients[provider, kind] = factory(limits=limits())
+        return clients[provider, kind]
+
+
+def sync_client(provider):
+    """The shared blocking HTTP client of ``provider`` ("openai" or "anthropic")."""
+    return client(provider, "sync")
+
+
+def async_client(provider):
+    """The shared asyncio HTTP client of ``provider``."""
+    return client(provider, "async")
+
+
+async def warm(provider, url, connections):
+    """Open ``connections`` pooled connections to ``url``, so the first model
+    calls skip the TCP and TLS handshakes. Any response will do."""
+    http = async_client(provider)
+    results = await asyncio.gather(
+        *(http.head(url, timeout=10) for _ in range(connections)), return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        logging.warning("Pre-warming %s connections to %s failed: %r", provider, url, errors[0])
+
+
+async def close():
+    with lock:
+        opened = list(clients.items())
+        clients.clear()
+    for (provider, kind), http in opened:
+        if kind == "sync":
+            http.close()
+        else:
+            await http.aclose()
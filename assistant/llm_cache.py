@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+
+_bypass = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache(bypass=True):
+    """Skip the LLM cache for every model call made inside this block.
+
+    Used for creative re-rolls, where the same prompt should give a new answer.
+    """
+    token = _bypass.set(bypass)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cache_key(prompt, llm_string):
+    # llm_string identifies the model and its parameters, prompt is the
+    # rendered message list.
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+
+class TieredLLMCache(BaseCache):
+    """A content-addressed LangChain LLM cache with a memory and a disk tier.
+
+    Responses are kept in an in-memory LRU of ``memory_entries`` items backed
+    by a SQLite file that is trimmed, least recently used first, whenever it
+    grows beyond ``disk_bytes`` of cached responses. Disk hits are promoted
+    to memory. Hit and miss counts per tier are kept in ``stats``.
+    """
+
+    def __init__(self, path, memory_entries, disk_bytes):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+            """
+        )
+        self.disk_size = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def remember(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def lookup_memory(self, key):
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+            return value
+
+    def lookup_disk(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            self.stats["disk_hits"] += 1
+        value = loads(row[0])
+        self.remember(key, value)
+        return value
+
+    def store_disk(self, key, value):
+        serialized = dumps(value)
+        with self.lock:
+            old = self.conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, serialized, len(serialized), time.time()),
+            )
+            self.disk_size += len(serialized) - (old[0] if old else 0)
+            while self.disk_size > self.disk_bytes:
+                oldest = self.conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+                self.disk_size -= oldest[1]
+            self.conn.commit()
+
+    def lookup(self, prompt, llm_string):
+        if _bypass.get():
+            return None
+        key = cache_key(prompt, llm_string)
+        return self.lookup_memory(key) or self.lookup_disk(key)
+
+    def update(self, prompt, llm_string, return_val):
+        if _bypass.get():
+            return
+        key = cache_key(prompt, llm_string)
+        self.remember(key, return_val)
+        self.store_disk(key, return_val)
+
+    async def alookup(self, prompt, llm_string):
+        if _bypass.get():
+            return None
+        key = cache_key(prompt, llm_string)
+        return self.lookup_memory(key) or await asyncio.to_thread(self.lookup_disk, key)
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        if _bypass.get():
+            return
+        key = cache_key(prompt, llm_string)
+        self.remember(key, return_val)
+        await asyncio.to_thread(self.store_disk, key, return_val)
+
+    def clear(self, **kwargs):
+        with self.lock:
+            self.memory.clear()
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.disk_size = 0
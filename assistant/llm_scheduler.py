@@ -0,0 +1,356 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import config
+from assistant import metrics
+
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+_priority = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Schedule every model call made inside this block at ``level``."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(text, max_tokens):
+    # About four characters per token for English prompts, plus the most the
+    # response may use; settled against the real usage once it is known.
+    return len(text) // 4 + max_tokens
+
+
+def rate_limited(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def next_chunk(stream):
+    """The next item of an async iterator, or None once it is exhausted."""
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class TokenBucket:
+    """Refills at ``per_minute`` units a minute up to ``burst_seconds`` worth.
+
+    A request larger than the bucket waits for a full bucket and leaves it in
+    debt. A ``per_minute`` of 0 means no limit.
+    """
+
+    def __init__(self, per_minute, burst_seconds=10):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        if not self.rate:
+            return 0.0
+        self.refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class _Waiter:
+    def __init__(self, level, loop=None):
+        self.level = level
+        self.loop = loop
+        self.event = asyncio.Event() if loop else threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+    def grant(self):
+        self.granted = True
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class ProviderLimiter:
+    """Admission control for one provider's requests/min, tokens/min and
+    concurrent requests, shared by threads and event loops of one process.
+
+    Waiting calls are admitted strictly by priority, then in arrival order.
+    A 429 from the provider holds back every call to it for a jittered,
+    exponentially growing delay (or the provider's Retry-After), instead of
+    letting each caller retry on its own.
+    """
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute, max_concurrent):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.waiting = []
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+        self.queued = {level: 0 for level in PRIORITY_NAMES}
+        self.stats = {"admitted": 0, "rate_limited": 0, "wait_seconds": 0.0}
+
+    def delay(self, tokens, now):
+        if self.in_flight >= self.max_concurrent:
+            return math.inf  # until a running call releases its slot
+        return max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now),
+        )
+
+    def dispatch(self):
+        """Admit waiting calls while the limits allow it. Called with the lock
+        held; returns how long until the next waiting call may be admitted."""
+        now = time.monotonic()
+        while self.waiting:
+            _, _, tokens, waiter = self.waiting[0]
+            if waiter.cancelled:
+                heapq.heappop(self.waiting)
+                continue
+            delay = self.delay(tokens, now)
+            if delay > 0:
+                return delay
+            heapq.heappop(self.waiting)
+            self.queued[waiter.level] -= 1
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            waiter.grant()
+        return math.inf
+
+    def enqueue(self, tokens, waiter):
+        with self.lock:
+            heapq.heappush(self.waiting, (waiter.level, next(self.order), tokens, waiter))
+            self.queued[waiter.level] += 1
+            return self.dispatch()
+
+    def poll(self):
+        with self.lock:
+            return self.dispatch()
+
+    def admitted(self, waiter, started):
+        waited = time.monotonic() - started
+        metrics.queue_seconds.observe(f"llm:{self.name}", PRIORITY_NAMES[waiter.level], value=waited)
+        with self.lock:
+            self.stats["wait_seconds"] += waited
+
+    def abandon(self, waiter, tokens):
+        with self.lock:
+            if waiter.granted:
+                self.release(tokens, None)
+            elif not waiter.cancelled:
+                waiter.cancelled = True
+                self.queued[waiter.level] -= 1
+
+    def release(self, tokens, used_tokens):
+        """Free a concurrency slot, charging the difference between the
+        estimated and the real token usage. Called with the lock held."""
+        self.in_flight -= 1
+        if used_tokens is not None and self.tokens.rate:
+            self.tokens.take(used_tokens - tokens)
+        self.dispatch()
+
+    async def acquire(self, tokens):
+        waiter = _Waiter(_priority.get(), asyncio.get_running_loop())
+        started = time.monotonic()
+        delay = self.enqueue(tokens, waiter)
+        try:
+            while not waiter.granted:
+                try:
+                    timeout = None if math.isinf(delay) else delay
+                    await asyncio.wait_for(waiter.event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                delay = self.poll()
+        except BaseException:
+            self.abandon(waiter, tokens)
+            raise
+        self.admitted(waiter, started)
+
+    def acquire_sync(self, tokens):
+        waiter = _Waiter(_priority.get())
+        started = time.monotonic()
+        delay = self.enqueue(tokens, waiter)
+        try:
+            while not waiter.granted:
+                waiter.event.wait(None if math.isinf(delay) else delay)
+                delay = self.poll()
+        except BaseException:
+            self.abandon(waiter, tokens)
+            raise
+        self.admitted(waiter, started)
+
+    def back_off(self, error, attempt):
+        delay = retry_after(error)
+        if delay is None:
+            ceiling = min(config.LLM_BACKOFF_MAX_SECONDS, config.LLM_BACKOFF_BASE_SECONDS * 2**attempt)
+            delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        logging.warning("%s rate limited, holding calls for %.1fs", self.name, delay)
+        metrics.rate_limited.inc(self.name)
+        with self.lock:
+            self.stats["rate_limited"] += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "queued": {PRIORITY_NAMES[level]: count for level, count in self.queued.items()},
+                "in_flight": self.in_flight,
+                **self.stats,
+            }
+
+
+class LLMScheduler:
+    """Routes model calls through the limiter of their provider, retrying
+    the ones rejected with a 429 up to ``max_retries`` times."""
+
+    def __init__(self, limiters, max_retries):
+        self.limiters = limiters
+        self.max_retries = max_retries
+
+    @asynccontextmanager
+    async def slot(self, provider, tokens):
+        limiter = self.limiters[provider]
+        await limiter.acquire(tokens)
+        used = [None]
+        try:
+            yield used
+        finally:
+            with limiter.lock:
+                limiter.release(tokens, used[0])
+
+    async def run(self, provider, tokens, call, used_tokens=None):
+        """Await ``call()`` once the provider admits it. ``used_tokens`` maps
+        the result to the tokens it really used, when known."""
+        for attempt in itertools.count():
+            async with self.slot(provider, tokens) as used:
+                try:
+                    result = await call()
+                except Exception as e:
+                    if not rate_limited(e) or attempt >= self.max_retries:
+                        raise
+                    self.limiters[provider].back_off(e, attempt)
+                    continue
+                used[0] = used_tokens(result) if used_tokens else None
+                return result
+
+    async def stream(self, provider, tokens, open_stream):
+        """Iterate ``open_stream()`` once the provider admits it, holding the
+        concurrency slot until the stream ends. Retries happen before the
+        first chunk only."""
+        for attempt in itertools.count():
+            async with self.slot(provider, tokens):
+                stream = open_stream()
+                try:
+                    chunk = await next_chunk(stream)
+                except Exception as e:
+                    await stream.aclose()
+                    if not rate_limited(e) or attempt >= self.max_retries:
+                        raise
+                    self.limiters[provider].back_off(e, attempt)
+                    continue
+                try:
+                    while chunk is not None:
+                        yield chunk
+                        chunk = await next_chunk(stream)
+                finally:
+                    await stream.aclose()
+                return
+
+    def run_sync(self, provider, tokens, call, used_tokens=None):
+        """Blocking version of :meth:`run` for code outside an event loop."""
+        limiter = self.limiters[provider]
+        for attempt in itertools.count():
+            limiter.acquire_sync(tokens)
+            used = None
+            try:
+                result = call()
+                used = used_tokens(result) if used_tokens else None
+                return result
+            except Exception as e:
+                if not rate_limited(e) or attempt >= self.max_retries:
+                    raise
+                limiter.back_off(e, attempt)
+            finally:
+                with limiter.lock:
+                    limiter.release(tokens, used)
+
+    def metrics(self):
+        return {name: limiter.metrics() for name, limiter in self.limiters.items()}
+
+
+def provider_of(model):
+    return "anthropic" if "anthropic" in model._llm_type else "openai"
+
+
+scheduler = LLMScheduler(
+    {
+        "openai": ProviderLimiter(
+            "openai",
+            config.OPENAI_REQUESTS_PER_MINUTE,
+            config.OPENAI_TOKENS_PER_MINUTE,
+            config.OPENAI_MAX_CONCURRENT_REQUESTS,
+        ),
+        "anthropic": ProviderLimiter(
+            "anthropic",
+            config.ANTHROPIC_REQUESTS_PER_MINUTE,
+            config.ANTHROPIC_TOKENS_PER_MINUTE,
+            config.ANTHROPIC_MAX_CONCURRENT_REQUESTS,
+        ),
+    },
+    max_retries=config.LLM_MAX_RETRIES,
+)
+
+metrics.CollectedMetric(
+    "story_llm_queue_depth",
+    "Model calls waiting for their provider's limits.",
+    "gauge",
+    ("provider", "priority"),
+    lambda: [
+        ((name, PRIORITY_NAMES[level]), count)
+        for name, limiter in scheduler.limiters.items()
+        for level, count in limiter.queued.items()
+    ],
+)
+metrics.CollectedMetric(
+    "story_llm_in_flight",
+    "Model calls admitted and not finished yet.",
+    "gauge",
+    ("provider",),
+    lambda: [((name,), limiter.in_flight) for name, limiter in scheduler.limiters.items()],
+)
@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+registry = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                yield f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (last one +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, *labels, value):
+        with self.lock:
+            counts, total = self.values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[labels] = (counts, total + value)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            for labels, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    le = format_labels(self.labelnames, labels, [("le", bound)])
+                    yield f"{self.name}_bucket{le} {cumulative}"
+                yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}"
+                yield f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class CollectedMetric:
+    """A metric kept elsewhere, read from ``collect()`` at scrape time as
+    ``(label values, value)`` pairs."""
+
+    def __init__(self, name, documentation, kind, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = labelnames
+        self.collect = collect
+        registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in self.collect():
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+stage_seconds = Histogram(
+    "story_stage_seconds",
+    "Wall time of graph nodes, chains and model calls.",
+    ("kind", "stage"),
+)
+stage_runs = Counter(
+    "story_stage_runs_total",
+    "Finished graph nodes, chains and model calls.",
+    ("kind", "stage", "status"),
+)
+stage_tokens = Counter(
+    "story_stage_tokens_total",
+    "Tokens sent to and received from the models, as reported by the provider.",
+    ("stage", "direction"),
+)
+cache_requests = Counter(
+    "story_llm_cache_requests_total",
+    "Model calls answered from the LLM cache (hit) or by a provider (miss).",
+    ("stage", "result"),
+)
+queue_seconds = Histogram(
+    "story_queue_seconds",
+    "Time spent waiting for a generation slot or a provider's rate limits.",
+    ("queue", "priority"),
+)
+provider_seconds = Histogram(
+    "story_provider_seconds",
+    "Wall time of the requests a model role sent to each provider.",
+    ("stage", "provider", "outcome"),
+)
+rate_limited = Counter(
+    "story_provider_rate_limited_total",
+    "Requests a provider rejected with a 429.",
+    ("provider",),
+)
+
+@asynccontextmanager
+async def queued(lock, queue, priority):
+    """Hold ``lock``, recording how long it took to get it."""
+    start = time.perf_counter()
+    async with lock:
+        queue_seconds.observe(queue, priority, value=time.perf_counter() - start)
+        yield
+
+
+def record_tokens(stage, input_tokens, output_tokens):
+    stage_tokens.inc(stage, "input", amount=input_tokens)
+    stage_tokens.inc(stage, "output", amount=output_tokens)
+
+
+class StageMetricsHandler(BaseCallbackHandler):
+    """Times the graph nodes, the ``*_chain`` runnables and the named chat
+    models of a graph run, and counts their tokens and cache hits."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.runs = {}
+
+    def start(self, run_id, kind, stage):
+        self.runs[run_id] = {"kind": kind, "stage": stage, "start": time.perf_counter()}
+
+    def end(self, run_id, status):
+        run = self.runs.pop(run_id, None)
+        if run is not None:
+            stage_seconds.observe(run["kind"], run["stage"], value=time.perf_counter() - run["start"])
+            stage_runs.inc(run["kind"], run["stage"], status)
+        return run
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, name=None, **kwargs):
+        if name and not name.startswith("__") and name == (metadata or {}).get("langgraph_node"):
+            self.start(run_id, "node", name)
+        elif name and name.endswith("_chain"):
+            self.start(run_id, "chain", name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.end(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, "error")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        role = (metadata or {}).get("name")
+        if role:
+            self.start(run_id, "model", role)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self.end(run_id, "ok")
+        if run is None:
+            return
+        message = response.generations[0][0].message
+        # Fresh responses carry the id of their run (see HedgedChatModel), a
+        # cached one the id of the run that first produced it.
+        cached = message.id != f"run-{run_id}"
+        cache_requests.inc(run["stage"], "hit" if cached else "miss")
+        usage = message.usage_metadata
+        if usage and not cached:
+            record_tokens(run["stage"], usage["input_tokens"], usage["output_tokens"])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, "error")
+
+
+handler = StageMetricsHandler()
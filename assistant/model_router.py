@@ -0,0 +1,253 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import defaultdict
+from typing import List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import get_buffer_string
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import validator
+
+import config
+from assistant import metrics
+from assistant.llm_scheduler import estimate_tokens, next_chunk, provider_of, scheduler
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with exponential forgetting.
+
+    Buckets grow by ``growth`` from ``smallest`` seconds up; once ``window``
+    samples have been recorded all counts are halved, so the percentiles
+    follow a provider that gets slower or faster.
+    """
+
+    def __init__(self, smallest=0.01, largest=600.0, growth=1.2, window=1000):
+        self.bounds = [smallest]
+        while self.bounds[-1] < largest:
+            self.bounds.append(self.bounds[-1] * growth)
+        self.counts = [0.0] * (len(self.bounds) + 1)
+        self.count = 0.0
+        self.window = window
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        if self.count >= self.window:
+            self.counts = [count / 2 for count in self.counts]
+            self.count /= 2
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, in seconds."""
+        target = q * self.count
+        seen = 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.bounds[-1]
+
+
+# Keyed by (role, "generate") for complete responses and (role, "stream") for
+# the time to the first streamed chunk. Only the primary model is recorded.
+histograms = defaultdict(LatencyHistogram)
+
+
+def used_tokens(result):
+    usage = result.generations[0][0].message.usage_metadata
+    return usage["total_tokens"] if usage else None
+
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model for one role that races alternate models against a slow one.
+
+    ``models[0]`` is asked first. If it has not answered once the role's
+    ``percentile`` latency has passed, the next model is asked as well, and so
+    on; the first answer wins and the other requests are cancelled. A model
+    that fails hands over to the next one straight away. Until
+    ``min_samples`` latencies have been seen ``default_deadline`` is used.
+
+    When streaming, answering means producing the first chunk, after which
+    the rest of the response comes from the same model. Responses get the id
+    of this model's run, which tells them apart from cached responses in the
+    stage metrics.
+    """
+
+    role: str
+    models: List[BaseChatModel]
+    hedge: bool = config.MODEL_HEDGING_ENABLED
+    percentile: float = config.MODEL_HEDGE_PERCENTILE
+    min_samples: int = config.MODEL_HEDGE_MIN_SAMPLES
+    default_deadline: float = config.MODEL_HEDGE_DEFAULT_DEADLINE_SECONDS
+
+    @validator("models")
+    def at_least_one_model(cls, models):
+        if not models:
+            raise ValueError("a hedged chat model needs at least one model")
+        return models
+
+    @property
+    def _llm_type(self):
+        return "hedged-chat-model"
+
+    @property
+    def _identifying_params(self):
+        return {
+            "role": self.role,
+            "models": [
+                {"type": model._llm_type, **model._identifying_params}
+                for model in self.models
+            ],
+        }
+
+    def deadline(self, kind):
+        """Seconds to wait for a model before also asking the next one."""
+        if not self.hedge:
+            return None
+        histogram = histograms[(self.role, kind)]
+        if histogram.count < self.min_samples:
+            return self.default_deadline
+        return histogram.percentile(self.percentile)
+
+    async def race(self, kind, call, discard=None):
+        """Run ``call(model)`` for the models in turn, hedging and falling back.
+
+        Returns the first successful result, raising the last error if every
+        model failed. Other results that arrive together with it are passed to
+        the coroutine function ``discard``, to release what they hold.
+        """
+        histogram = histograms[(self.role, kind)]
+        deadline = self.deadline(kind)
+        start = time.monotonic()
+        running = {}
+        launched = 0
+        error = None
+
+        async def timed(model):
+            outcome = "error"
+            started = time.perf_counter()
+            try:
+                result = await call(model)
+                outcome = "ok"
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.provider_seconds.observe(self.role, provider_of(model), outcome, value=elapsed)
+
+        def launch():
+            nonlocal launched
+            running[asyncio.create_task(timed(self.models[launched]))] = launched
+            launched += 1
+
+        launch()
+        try:
+            while running:
+                hedgeable = deadline is not None and launched < len(self.models)
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=deadline if hedgeable else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    logging.info("Hedging %s after %.2fs", self.role, time.monotonic() - start)
+                    launch()
+                    continue
+                results = []
+                for task in done:
+                    index = running.pop(task)
+                    if task.exception() is None:
+                        results.append((index, task.result()))
+                        continue
+                    error = task.exception()
+                    logging.warning("%s model %d failed: %r", self.role, index, error)
+                if results:
+                    results.sort(key=lambda item: item[0])
+                    index, result = results[0]
+                    if discard:
+                        for _, other in results[1:]:
+                            await discard(other)
+                    if index == 0:
+                        histogram.record(time.monotonic() - start)
+                    return result
+                if not running and launched < len(self.models):
+                    launch()
+            raise error
+        finally:
+            for task, index in running.items():
+                task.cancel()
+                if index == 0:
+                    # Lower bound of the primary's latency, keeps the
+                    # histogram from only ever seeing its fast responses.
+                    histogram.record(time.monotonic() - start)
+            if discard:
+                # Cancelling does not undo a task that already finished.
+                for task in running:
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        await discard(task.result())
+
+    def estimate(self, model, messages):
+        max_tokens = getattr(model, "max_tokens", None) or config.LLM_DEFAULT_MAX_TOKENS
+        return estimate_tokens(get_buffer_string(messages), max_tokens)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        # Synchronous calls only fall back on errors, hedging needs the event loop.
+        error = None
+        for model in self.models:
+            try:
+                result = scheduler.run_sync(
+                    provider_of(model),
+                    self.estimate(model, messages),
+                    lambda: model.generate([messages], stop=stop, callbacks=[], **kwargs),
+                    used_tokens,
+                )
+                return ChatResult(generations=result.generations[0], llm_output=result.llm_output)
+            except Exception as e:
+                logging.warning("%s model failed: %r", self.role, e)
+                error = e
+        raise error
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        async def call(model):
+            # No callbacks: the events are reported once, by this model.
+            return await scheduler.run(
+                provider_of(model),
+                self.estimate(model, messages),
+                lambda: model.agenerate([messages], stop=stop, callbacks=[], **kwargs),
+                used_tokens,
+            )
+
+        result = await self.race("generate", call)
+        if run_manager:
+            for generation in result.generations[0]:
+                generation.message.id = f"run-{run_manager.run_id}"
+        return ChatResult(generations=result.generations[0], llm_output=result.llm_output)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async def first_chunk(model):
+            stream = scheduler.stream(
+                provider_of(model),
+                self.estimate(model, messages),
+                lambda: model.astream(messages, {"callbacks": []}, stop=stop, **kwargs),
+            )
+            try:
+                return await next_chunk(stream), stream
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def close(result):
+            await result[1].aclose()
+
+        chunk, stream = await self.race("stream", first_chunk, close)
+        try:
+            while chunk is not None:
+                # Left for the caller to set to the id of this model's run.
+                chunk.id = None
+                yield ChatGenerationChunk(message=chunk)
+                chunk = await next_chunk(stream)
+        finally:
+            await stream.aclose()
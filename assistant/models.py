@@ -0,0 +1,116 @@
+import asyncio
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from langchain_core.globals import set_llm_cache
+
+import config
+from assistant import http_pool, metrics
+from assistant.model_router import HedgedChatModel
+
+
+# Each role asks its first model and hedges or falls back to the next, see
+# HedgedChatModel.
+ROLE_MODELS = {
+    "story_title_writer": [("openai", "gpt-4"), ("anthropic", "claude-3-5-sonnet-20240620")],
+    "chapter_title_writer": [("openai", "gpt-4"), ("anthropic", "claude-3-5-sonnet-20240620")],
+    "brainstormer": [("openai", "gpt-4"), ("anthropic", "claude-3-5-sonnet-20240620")],
+    "story_outline_writer": [("anthropic", "claude-3-haiku-20240307"), ("openai", "gpt-4o-mini")],
+    "chapter_outline_writer": [("anthropic", "claude-3-haiku-20240307"), ("openai", "gpt-4o-mini")],
+    "chapter_writer": [("anthropic", "claude-3-5-sonnet-20240620"), ("openai", "gpt-4o")],
+    "summarizer": [("openai", "gpt-4o"), ("anthropic", "claude-3-5-sonnet-20240620")],
+    "character_description_writer": [("openai", "gpt-4"), ("anthropic", "claude-3-5-sonnet-20240620")],
+    "environment_description_writer": [("openai", "gpt-4"), ("anthropic", "claude-3-5-sonnet-20240620")],
+}
+
+
+@lru_cache(maxsize=None)
+def setup():
+    """Load the API keys and install the LLM cache, once, before the first model is built."""
+    load_dotenv(override=True)
+    if config.LLM_CACHE_ENABLED:
+        # Imported here, it opens the cache database.
+        from assistant.llm_cache import TieredLLMCache
+
+        llm_cache = TieredLLMCache(
+            config.LLM_CACHE_PATH,
+            memory_entries=config.LLM_CACHE_MEMORY_ENTRIES,
+            disk_bytes=config.LLM_CACHE_DISK_BYTES,
+        )
+        set_llm_cache(llm_cache)
+        metrics.CollectedMetric(
+            "story_llm_cache_lookups_total",
+            "LLM cache lookups by the tier that answered them.",
+            "counter",
+            ("result",),
+            lambda: [((result,), count) for result, count in llm_cache.stats.items()],
+        )
+
+
+@lru_cache(maxsize=None)
+def chat_model(provider, model):
+    """The client for ``model``, shared by every role that uses it, on the
+    provider's shared connection pool.
+
+    The provider packages are only imported here. Responses are cached once,
+    by the role model, and rate limits are retried by the llm_scheduler.
+    """
+    setup()
+    if provider == "anthropic":
+        import anthropic
+        from langchain_anthropic import ChatAnthropic
+
+        chat = ChatAnthropic(model=model, cache=False, max_retries=0)
+        # ChatAnthropic takes no HTTP client, so replace its SDK clients with
+        # ones on the shared pool, built as its validator builds them.
+        params = {
+            "api_key": chat.anthropic_api_key.get_secret_value(),
+            "base_url": chat.anthropic_api_url,
+            "max_retries": 0,
+            "default_headers": chat.default_headers,
+        }
+        if chat.default_request_timeout is None or chat.default_request_timeout > 0:
+            params["timeout"] = chat.default_request_timeout
+        object.__setattr__(chat, "_client", anthropic.Client(**params, http_client=http_pool.sync_client(provider)))
+        object.__setattr__(
+            chat, "_async_client", anthropic.AsyncClient(**params, http_client=http_pool.async_client(provider))
+        )
+        return chat
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model,
+        cache=False,
+        max_retries=0,
+        http_client=http_pool.sync_client(provider),
+        http_async_client=http_pool.async_client(provider),
+    )
+
+
+def base_url(chat):
+    if hasattr(chat, "anthropic_api_url"):
+        return chat.anthropic_api_url
+    return chat.openai_api_base or "https://api.openai.com/v1"
+
+
+@lru_cache(maxsize=None)
+def role_model(role):
+    """The chat model of ``role``, built on first use."""
+    return HedgedChatModel(
+        role=role,
+        models=[chat_model(provider, model) for provider, model in ROLE_MODELS[role]],
+        metadata={"name": role},
+    )
+
+
+async def prewarm(connections):
+    """Build every role model and open ``connections`` connections to each
+    provider, so the first story request pays for neither."""
+    for role in ROLE_MODELS:
+        role_model(role)
+    urls = {
+        provider: base_url(chat_model(provider, model))
+        for models in ROLE_MODELS.values()
+        for provider, model in models
+    }
+    await asyncio.gather(*(http_pool.warm(provider, url, connections) for provider, url in urls.items()))
@@ -1,38 +1,18 @@
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
+import asyncio
+import re
+from functools import lru_cache
+
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated, List, Dict
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import BaseMessage, HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
-
-from dotenv import load_dotenv
-from copy import deepcopy
-
-load_dotenv(override=True)
 
-story_title_writer = ChatOpenAI(model="gpt-4", metadata={"name": "story_title_writer"})
-chapter_title_writer = ChatOpenAI(
-    model="gpt-4", metadata={"name": "chapter_title_writer"}
-)
-brainstormer = ChatOpenAI(model="gpt-4", metadata={"name": "brainstormer"})
-story_outline_writer = ChatAnthropic(
-    model="claude-3-haiku-20240307", metadata={"name": "story_outline_writer"}
-)
-chapter_outline_writer = ChatAnthropic(
-    model="claude-3-haiku-20240307", metadata={"name": "chapter_outline_writer"}
-)
-chapter_writer = ChatAnthropic(
-    model="claude-3-5-sonnet-20240620", metadata={"name": "chapter_writer"}
-)
-summarizer = ChatOpenAI(model="gpt-4o", metadata={"name": "summarizer"})
-character_description_writer = ChatOpenAI(
-    model="gpt-4", metadata={"name": "character_description_writer"}
-)
-environment_description_writer = ChatOpenAI(
-    model="gpt-4", metadata={"name": "environment_description_writer"}
-)
+from assistant.chapter_tree import ROOT, ChapterTree
+from assistant.checkpointer import make_checkpointer
+from assistant.models import ROLE_MODELS, role_model
+from assistant.summary_index import hierarchical_summary
+import config
 
 
 class Chapter(TypedDict):
@@ -42,14 +22,6 @@ class Chapter(TypedDict):
     """Summary of the chapter."""
     title: str
     """Title of the chapter."""
-    children: list
-    """Direct children of the chapter."""
-    siblings: list
-    """Direct descendants of the chapter."""
-    cousins: list
-    """Chapters that share the same parent."""
-    parent: int
-    """Direct ancestor of the chapter."""
 
 
 def update_chapter_graph(old_chapter_graph, new_chapter_graph):
@@ -59,6 +31,13 @@ def update_chapter_graph(old_chapter_graph, new_chapter_graph):
         return old_chapter_graph
 
 
+def update_summary_index(old_summary_index, new_summary_index):
+    # Block summaries are only ever added, see summary_index.hierarchical_summary
+    if isinstance(new_summary_index, dict):
+        old_summary_index.update(new_summary_index)
+    return old_summary_index
+
+
 class State(TypedDict):
     personas: dict[str, str]
     """Different personas for different tasks."""
@@ -72,6 +51,8 @@ class State(TypedDict):
     """Prompt engineered context instructions for LLM."""
     chapter_graph: Annotated[dict[str, Chapter], update_chapter_graph]
     """Graph containing all of our chapter"""
+    chapter_tree: dict[str, list[int]]
+    """How the chapters relate to each other, see ChapterTree.to_dict."""
     chapter_id_viewing: str
     """What node in the graph the user is currently viewing."""
     chapter_id_current: str
@@ -80,8 +61,12 @@ class State(TypedDict):
     """User's instructions to edit a chapter."""
     continue_instructions: str
     """User's instructions proceed to the next chapter."""
+    continue_branches: int
+    """How many alternative next chapters to write at once, one per idea."""
     story_title: str = ""
     """Overall title of the story."""
+    summary_index: Annotated[dict[str, str], update_summary_index]
+    """Cached summaries of blocks of chapters, keyed by level and last chapter."""
 
 
 summarizer_messages = [
@@ -238,49 +223,63 @@ chapter_outline_writer_prompt = ChatPromptTemplate.from_messages(
 chapter_writer_prompt = ChatPromptTemplate.from_messages(chapter_writer_messages)
 
 
-summarizer_chain = summarizer_prompt | summarizer | StrOutputParser()
-character_description_chain = (
-    character_description_writer_prompt
-    | character_description_writer
-    | StrOutputParser()
-)
-environment_description_chain = (
-    environment_description_writer_prompt
-    | environment_description_writer
-    | StrOutputParser()
-)
-brainstormer_chain = brainstormer_prompt | brainstormer | StrOutputParser()
-# story_outline_chain = story_outline_writer_prompt | story_outline_writer | StrOutputParser()
-chapter_outline_chain = (
-    chapter_outline_writer_prompt | chapter_outline_writer | StrOutputParser()
-)
-chapter_writer_chain = chapter_writer_prompt | chapter_writer | StrOutputParser()
+CHAINS = {
+    "summarizer_chain": (summarizer_prompt, "summarizer"),
+    "character_description_chain": (character_description_writer_prompt, "character_description_writer"),
+    "environment_description_chain": (environment_description_writer_prompt, "environment_description_writer"),
+    "brainstormer_chain": (brainstormer_prompt, "brainstormer"),
+    "chapter_outline_chain": (chapter_outline_writer_prompt, "chapter_outline_writer"),
+    "chapter_writer_chain": (chapter_writer_prompt, "chapter_writer"),
+}
+
+
+@lru_cache(maxsize=None)
+def chain(name):
+    """The prompt | model | parser chain ``name``, built on first use. The run
+    name labels it in the stage metrics."""
+    prompt, role = CHAINS[name]
+    return (prompt | role_model(role) | StrOutputParser()).with_config(run_name=name)
+
+
+async def summarize_chapter(chapter_content):
+    return await chain("summarizer_chain").ainvoke({"chapters_str": chapter_content})
 
 
-def summarize_current_story(state, chapter_id):
-    # TODO: Rewrite summarization to use the summaries of the chapters in the graph
-    if chapter_id == "-1":
+def chapter_tree(state):
+    if state.get("chapter_tree"):
+        return ChapterTree.from_dict(state["chapter_tree"])
+    # Stories checkpointed before the tree was introduced
+    return ChapterTree.from_chapter_graph(state.get("chapter_graph") or {})
+
+
+async def summarize_current_story(state, tree, chapter_id):
+    """Summarise the story up to ``chapter_id`` from its cached chapter summaries.
+
+    Every chapter is summarised once when it is written, so this only calls
+    the summarizer for chapters that predate per-chapter summaries and for
+    new blocks of the hierarchical summary index.
+    """
+    if chapter_id == ROOT:
         return ""
-    current_chapter_id = chapter_id
-    chapters_currently_selected_text = [
-        state["chapter_graph"][current_chapter_id]["content"]
-    ]
-    while state["chapter_graph"][current_chapter_id]["parent"] != "-1":
-        chapters_currently_selected_text.append(
-            state["chapter_graph"][current_chapter_id]["content"]
-        )
-        current_chapter_id = state["chapter_graph"][current_chapter_id]["parent"]
-    chapters_str = "\n\n".join(
-        [
-            f"Chapter {i}\n\n{chapters_currently_selected_text[i]}"
-            for i in range(len(chapters_currently_selected_text))
-        ]
-    ).strip()
-    return summarizer_chain.invoke({"chapters_str": chapters_str})
-
-
-def write_chapter(user_message, chapters_summary, state):
-    brainstorm_ideas = brainstormer_chain.invoke(
+    path = tree.path(chapter_id)
+    chapters = [state["chapter_graph"][str(i)] for i in path]
+    missing = [chapter for chapter in chapters if not chapter.get("summary")]
+    summaries = await asyncio.gather(
+        *(summarize_chapter(chapter["content"]) for chapter in missing)
+    )
+    for chapter, summary in zip(missing, summaries):
+        chapter["summary"] = summary
+    return await hierarchical_summary(
+        path,
+        [chapter["summary"] for chapter in chapters],
+        state.setdefault("summary_index", {}),
+        config.SUMMARY_FANOUT,
+        summarize_chapter,
+    )
+
+
+async def brainstorm(user_message, chapters_summary, state):
+    return await chain("brainstormer_chain").ainvoke(
         {
             "story_summary": chapters_summary,
             "action": user_message,
@@ -289,7 +288,18 @@ def write_chapter(user_message, chapters_summary, state):
             "persona": state["personas"]["brainstorm"],
         }
     )
-    outline = chapter_outline_chain.invoke(
+
+
+def split_ideas(brainstorm_ideas):
+    """Split the brainstormer's numbered list into its individual ideas."""
+    ideas = re.split(r"^\s*\d+[.)]\s+", brainstorm_ideas, flags=re.MULTILINE)
+    return [idea.strip() for idea in ideas[1:] if idea.strip()]
+
+
+async def write_outlined_chapter(
+    user_message, chapters_summary, state, brainstorm_ideas, branch=0
+):
+    outline = await chain("chapter_outline_chain").ainvoke(
         {
             "story_summary": chapters_summary,
             "action": user_message,
@@ -300,7 +310,7 @@ def write_chapter(user_message, chapters_summary, state):
         }
     )
 
-    response = chapter_writer_chain.invoke(
+    response = await chain("chapter_writer_chain").ainvoke(
         {
             "story_summary": chapters_summary,
             "action": user_message,
@@ -308,38 +318,63 @@ def write_chapter(user_message, chapters_summary, state):
             "context_request": state["context_request"],
             "outline": outline,
             "persona": state["personas"]["chapter"],
-        }
+        },
+        # Lets streaming clients tell concurrently written branches apart
+        {"metadata": {"branch": branch}},
+    )
+    return response
+
+
+async def write_chapter(user_message, chapters_summary, state):
+    brainstorm_ideas = await brainstorm(user_message, chapters_summary, state)
+    return await write_outlined_chapter(
+        user_message, chapters_summary, state, brainstorm_ideas
+    )
+
+
+async def new_chapter(chapter_content):
+    chapter_title, chapter_summary = await asyncio.gather(
+        get_chapter_title(chapter_content), summarize_chapter(chapter_content)
     )
-    chapter_content = response
-    chapter_title = chapter_title_writer.invoke(
-        f"Please come up with a title for the following chapter: {chapter_content}. The title should be 6 words or less."
+    return Chapter(content=chapter_content, summary=chapter_summary, title=chapter_title)
+
+
+async def get_chapter_title(chapter_content):
+    return (
+        await role_model("chapter_title_writer").ainvoke(
+            f"Please come up with a title for the following chapter: {chapter_content}. The title should be 6 words or less."
+        )
     ).content.replace('"', "")
-    return chapter_content, chapter_title
 
 
-def get_title(state, first_chapter):
-    return story_title_writer.invoke(
-        f"Please come up with a short title, less than 6 words, for a story. The story has the following overall plot {state['instruction']}, and here is the first chapter {first_chapter}"
+async def get_title(state, first_chapter):
+    return (
+        await role_model("story_title_writer").ainvoke(
+            f"Please come up with a short title, less than 6 words, for a story. The story has the following overall plot {state['instruction']}, and here is the first chapter {first_chapter}"
+        )
     ).content.replace('"', "")
 
 
-def write_background(state):
+async def write_background(state):
     state["context_request"] = (
         f"I would like you to keep the following details in mind when writing {state['details']}"
     )
 
-    character_description = character_description_chain.invoke(
-        {
-            "context_request": state["context_request"],
-            "persona": state["personas"]["character"],
-        }
-    )
-
-    environment_description = environment_description_chain.invoke(
-        {
-            "context_request": state["context_request"],
-            "persona": state["personas"]["environment"],
-        }
+    # Characters and environment only depend on the user's details, so both
+    # descriptions are written at the same time.
+    character_description, environment_description = await asyncio.gather(
+        chain("character_description_chain").ainvoke(
+            {
+                "context_request": state["context_request"],
+                "persona": state["personas"]["character"],
+            }
+        ),
+        chain("environment_description_chain").ainvoke(
+            {
+                "context_request": state["context_request"],
+                "persona": state["personas"]["environment"],
+            }
+        ),
     )
 
     state["context_request"] = (
@@ -349,28 +384,24 @@ def write_background(state):
     return state
 
 
-def write_first_chapter(state):
-    state = write_background(state)
+async def write_first_chapter(state):
+    state = await write_background(state)
 
-    chapter_content, chapter_title = write_chapter(
+    chapter_content = await write_chapter(
         "Please write the first chapter of this story.",
         "no story up to this point, this is the first chapter!",
         state,
     )
+    chapter, state["story_title"] = await asyncio.gather(
+        new_chapter(chapter_content), get_title(state, chapter_content)
+    )
 
-    state["chapter_id_current"] = "1"
-    state["chapter_id_viewing"] = "1"
-    state["chapter_graph"] = {
-        "1": Chapter(
-            content=chapter_content,
-            title=chapter_title,
-            children=[],
-            siblings=[],
-            cousins=[],
-            parent="-1",
-        )
-    }
-    state["story_title"] = get_title(state, chapter_content)
+    tree = ChapterTree()
+    chapter_id = str(tree.add_continuation(ROOT))
+    state["chapter_id_current"] = chapter_id
+    state["chapter_id_viewing"] = chapter_id
+    state["chapter_tree"] = tree.to_dict()
+    state["chapter_graph"] = {chapter_id: chapter}
     return state
 
 
@@ -387,47 +418,24 @@ Here are some edits I want to make to that chapter:
 </EditInstructions>"""
 
 
-def edit_chapter(state):
-    chapters_summary = summarize_current_story(
-        state, state["chapter_graph"][state["chapter_id_viewing"]]["parent"]
-    )
+async def edit_chapter(state):
+    tree = chapter_tree(state)
+    viewing = int(state["chapter_id_viewing"])
+    chapters_summary = await summarize_current_story(state, tree, tree.parent(viewing))
     user_message = edit_prompt.format(
         chapters_summary=chapters_summary,
         draft=state["chapter_graph"][state["chapter_id_viewing"]]["content"],
         edit=state["rewrite_instructions"],
     )
 
-    chapter_content, chapter_title = write_chapter(
-        user_message, chapters_summary, state
-    )
+    chapter_content = await write_chapter(user_message, chapters_summary, state)
 
-    # create new chapter
-    state["chapter_graph"][str(int(state["chapter_id_current"]) + 1)] = Chapter(
-        content=chapter_content,
-        title=chapter_title,
-        children=[],
-        siblings=deepcopy(
-            state["chapter_graph"][state["chapter_id_viewing"]]["siblings"]
-            + [state["chapter_id_viewing"]]
-        ),
-        cousins=deepcopy(
-            state["chapter_graph"][state["chapter_id_viewing"]]["cousins"]
-        ),
-        parent=deepcopy(state["chapter_graph"][state["chapter_id_viewing"]]["parent"]),
-    )
-    # update siblings
-    for sibling in state["chapter_graph"][str(int(state["chapter_id_viewing"]) + 1)][
-        "siblings"
-    ]:
-        state["chapter_graph"][sibling]["siblings"].append(
-            str(int(state["chapter_id_current"]) + 1)
-        )
-
-    state["chapter_graph"][state["chapter_id_viewing"]]["siblings"].append(
-        str(int(state["chapter_id_current"]) + 1)
-    )
-    state["chapter_id_current"] = str(int(state["chapter_id_current"]) + 1)
-    state["chapter_id_viewing"] = deepcopy(state["chapter_id_current"])
+    # create new chapter as another version of the one being viewed
+    chapter_id = str(tree.add_rewrite(viewing))
+    state["chapter_graph"][chapter_id] = await new_chapter(chapter_content)
+    state["chapter_tree"] = tree.to_dict()
+    state["chapter_id_current"] = chapter_id
+    state["chapter_id_viewing"] = chapter_id
     return state
 
 
@@ -438,37 +446,42 @@ continue_prompt = """Here is what I want in the next chapter:
 </Instructions>"""
 
 
-def continue_chapter(state):
-    chapters_summary = summarize_current_story(state, state["chapter_id_viewing"])
+async def continue_chapter(state):
+    tree = chapter_tree(state)
+    viewing = int(state["chapter_id_viewing"])
+    chapters_summary = await summarize_current_story(state, tree, viewing)
     user_message = continue_prompt.format(
         chapters_summary=chapters_summary, instructions=state["continue_instructions"]
     )
 
-    chapter_content, chapter_title = write_chapter(
-        user_message, chapters_summary, state
+    brainstorm_ideas = await brainstorm(user_message, chapters_summary, state)
+    branches = min(state.get("continue_branches") or 1, config.MAX_BRANCHES)
+    ideas = split_ideas(brainstorm_ideas)[:branches] if branches > 1 else []
+    if len(ideas) < 2:
+        # A single chapter, the outline writer picks among all the ideas
+        ideas = [brainstorm_ideas]
+
+    # Speculatively write one alternative chapter per idea
+    branch_slots = asyncio.Semaphore(config.BRANCH_CONCURRENCY)
+
+    async def write_branch(branch, idea):
+        async with branch_slots:
+            chapter_content = await write_outlined_chapter(
+                user_message, chapters_summary, state, idea, branch
+            )
+            return await new_chapter(chapter_content)
+
+    chapters = await asyncio.gather(
+        *(write_branch(branch, idea) for branch, idea in enumerate(ideas))
     )
-    # create new chapter
-    state["chapter_graph"][str(int(state["chapter_id_current"]) + 1)] = Chapter(
-        content=chapter_content,
-        title=chapter_title,
-        children=[],
-        siblings=[],
-        cousins=deepcopy(
-            state["chapter_graph"][state["chapter_id_viewing"]]["children"]
-        ),
-        parent=deepcopy(state["chapter_id_viewing"]),
-    )
-    # update cousins
-    for child in state["chapter_graph"][state["chapter_id_viewing"]]["children"]:
-        state["chapter_graph"][child]["cousins"].append(
-            str(int(state["chapter_id_current"]) + 1)
-        )
-    # update children
-    state["chapter_graph"][state["chapter_id_viewing"]]["children"].append(
-        str(int(state["chapter_id_current"]) + 1)
-    )
-    state["chapter_id_current"] = str(int(state["chapter_id_current"]) + 1)
-    state["chapter_id_viewing"] = deepcopy(state["chapter_id_current"])
+
+    # create the new chapters following the one being viewed, as cousins of
+    # each other, and show the first one
+    chapter_ids = [str(tree.add_continuation(viewing)) for _ in chapters]
+    state["chapter_graph"].update(zip(chapter_ids, chapters))
+    state["chapter_tree"] = tree.to_dict()
+    state["chapter_id_current"] = chapter_ids[-1]
+    state["chapter_id_viewing"] = chapter_ids[0]
     return state
 
 
@@ -490,15 +503,32 @@ builder.add_edge("first", END)
 builder.add_edge("rewrite", END)
 builder.add_edge("continue", END)
 
-memory = MemorySaver()
-graph = builder.compile(checkpointer=memory)
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    """The story graph with the configured checkpointer, compiled on first use."""
+    return builder.compile(checkpointer=make_checkpointer())
+
+
+def __getattr__(name):
+    # Lazy module attributes: the compiled graph (used by langgraph.json), the
+    # role models and the chains.
+    if name == "graph":
+        return get_graph()
+    if name in ROLE_MODELS:
+        return role_model(name)
+    if name in CHAINS:
+        return chain(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
+    graph = get_graph()
     thread = {"configurable": {"thread_id": "1"}}
     
     personas = {"character": "J. K. Rowling", "environment": "H. P. Lovecraft", "brainstorm": "Lev Tolstoy", "outline": "Cristopher Nolan", "chapter": "Fyodor Dostoevsky"}
-    response = graph.invoke({"instruction": "A story about a sailor", "details": "a story should have three main characters", "personas": personas}, thread)
+    response = asyncio.run(graph.ainvoke({"instruction": "A story about a sailor", "details": "a story should have three main characters", "personas": personas}, thread))
     chapter_graph = response.get("chapter_graph")
     for chapter_id, chapter in chapter_graph.items():
         print(type(chapter))
@@ -513,13 +543,13 @@ if __name__ == "__main__":
     graph.update_state(thread, {"continue_instructions": "continue with the story"})
 
     
-    response = graph.invoke({"continue_instructions": "continue with the story"}, thread)
+    response = asyncio.run(graph.ainvoke({"continue_instructions": "continue with the story"}, thread))
     print(response)
 
 
     graph.update_state(thread, {"continue_instructions": "continue with the story"})
 
     
-    response = graph.invoke({"rewrite_instructions": "change the current location to Munich"}, thread)
+    response = asyncio.run(graph.ainvoke({"rewrite_instructions": "change the current location to Munich"}, thread))
     print(response)
 
@@ -0,0 +1,54 @@
+import asyncio
+
+
+def label(start, end):
+    return f"Chapter {start}" if start == end else f"Chapters {start}-{end}"
+
+
+def join_items(items):
+    return "\n\n".join(f"{label(start, end)}\n\n{text}" for start, end, text in items)
+
+
+async def hierarchical_summary(path, chapter_summaries, index, fanout, summarize):
+    """Summarise a story path with summaries of summaries at a fixed fan-out.
+
+    Going from the first chapter, every ``fanout`` consecutive chapter
+    summaries are summarised into one level-1 summary, every ``fanout`` level-1
+    summaries into one level-2 summary, and so on. The returned context holds
+    the highest-level summaries followed, at every level, by the at most
+    ``fanout - 1`` more recent items that do not fill a block yet, so its size
+    grows with the logarithm of the story depth.
+
+    ``index`` caches block summaries under ``"<fanout>:<level>:<last chapter
+    id>"``. A block is fully determined by the fan-out, its level and its
+    last chapter, and chapters are never edited in place (rewrites create new
+    chapters), so cached blocks stay valid and only blocks on a rewritten path
+    are summarised again. Blocks of another fan-out, from before a change of
+    SUMMARY_FANOUT, are not reused.
+    ``summarize`` is a coroutine function turning text into its summary.
+    """
+    if fanout < 2:
+        raise ValueError(f"fanout must be at least 2, not {fanout}")
+    # (first position, last position, text) of the items at the current level
+    items = [
+        (position, position, summary)
+        for position, summary in enumerate(chapter_summaries, start=1)
+    ]
+    recent = []
+    level = 0
+    while len(items) >= fanout:
+        level += 1
+        complete = len(items) - len(items) % fanout
+        blocks = [items[i : i + fanout] for i in range(0, complete, fanout)]
+        keys = [f"{fanout}:{level}:{path[block[-1][1] - 1]}" for block in blocks]
+        missing = [(key, block) for key, block in zip(keys, blocks) if key not in index]
+        summaries = await asyncio.gather(
+            *(summarize(join_items(block)) for _, block in missing)
+        )
+        for (key, _), summary in zip(missing, summaries):
+            index[key] = summary
+        recent = items[complete:] + recent
+        items = [
+            (block[0][0], block[-1][1], index[key]) for key, block in zip(keys, blocks)
+        ]
+    return join_items(items + recent)
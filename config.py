@@ -1,2 +1,129 @@
 # config.py
-OPENAI_API_KEY = "SECRET KEY"
\ No newline at end of file
+import os
+
+OPENAI_API_KEY = "SECRET KEY"
+
+# Upper bound on story generations a single API worker runs at the same time;
+# further requests wait for a free slot instead of piling onto the providers.
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "32"))
+
+# Story sessions: idle sessions are spilled from memory to SESSION_SPILL_DIR
+# after SESSION_TTL_SECONDS, or earlier (least recently used first) when more
+# than SESSION_MAX_COUNT sessions or SESSION_MAX_BYTES of checkpoints are held.
+# The byte budget only applies to the "memory" checkpoint backend; sqlite
+# checkpoints are on disk and take no session memory.
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", "sessions")
+
+# Story checkpoints: "sqlite" keeps them in CHECKPOINT_DB_PATH across restarts,
+# "memory" keeps them in RAM with the session spilling above. The SQLite store
+# is compacted to the latest CHECKPOINT_KEEP_LAST checkpoints per story and
+# stories untouched for CHECKPOINT_TTL_SECONDS are deleted, at most once every
+# CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS.
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints/stories.sqlite")
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "10"))
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(30 * 24 * 3600)))
+CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS", "300"))
+
+# Background generation jobs: JOB_WORKERS run jobs from a queue holding at most
+# JOB_QUEUE_SIZE waiting jobs. Finished jobs can be polled for
+# JOB_RESULT_TTL_SECONDS, the most recent JOB_RESULT_CACHE_SIZE of them.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(MAX_CONCURRENT_GENERATIONS)))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_RESULT_CACHE_SIZE = int(os.getenv("JOB_RESULT_CACHE_SIZE", "1000"))
+
+# Story summaries group this many chapter (or lower-level) summaries into each
+# summary of summaries, keeping the summary context O(log story depth).
+SUMMARY_FANOUT = int(os.getenv("SUMMARY_FANOUT", "4"))
+if SUMMARY_FANOUT < 2:
+    raise ValueError(f"SUMMARY_FANOUT must be at least 2, not {SUMMARY_FANOUT}")
+
+# LLM response cache shared by every chain: identical model, parameters and
+# prompt are answered from an LRU of LLM_CACHE_MEMORY_ENTRIES responses, then
+# from LLM_CACHE_PATH, which is trimmed to LLM_CACHE_DISK_BYTES.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite")
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_DISK_BYTES = int(os.getenv("LLM_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+# Continuing a story with branches > 1 writes up to MAX_BRANCHES alternative
+# chapters from different brainstormed ideas, BRANCH_CONCURRENCY at a time.
+MAX_BRANCHES = int(os.getenv("MAX_BRANCHES", "5"))
+BRANCH_CONCURRENCY = int(os.getenv("BRANCH_CONCURRENCY", "3"))
+if MAX_BRANCHES < 1:
+    raise ValueError(f"MAX_BRANCHES must be at least 1, not {MAX_BRANCHES}")
+if BRANCH_CONCURRENCY < 1:
+    raise ValueError(f"BRANCH_CONCURRENCY must be at least 1, not {BRANCH_CONCURRENCY}")
+
+# Every chat model role has alternate models. A model that fails hands over to
+# the next one; with hedging on, the next one is also asked once the request
+# takes longer than the role's MODEL_HEDGE_PERCENTILE latency (or
+# MODEL_HEDGE_DEFAULT_DEADLINE_SECONDS until MODEL_HEDGE_MIN_SAMPLES are seen).
+MODEL_HEDGING_ENABLED = os.getenv("MODEL_HEDGING_ENABLED", "true").lower() == "true"
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "0.95"))
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+MODEL_HEDGE_DEFAULT_DEADLINE_SECONDS = float(os.getenv("MODEL_HEDGE_DEFAULT_DEADLINE_SECONDS", "60"))
+
+# Every model call waits for its provider's request, token and concurrency
+# limits (per process, 0 disables the rate limits). Calls rejected with a 429
+# are retried up to LLM_MAX_RETRIES times after a jittered backoff growing from
+# LLM_BACKOFF_BASE_SECONDS to LLM_BACKOFF_MAX_SECONDS, unless the provider asks
+# for a specific delay.
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "300000"))
+OPENAI_MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "64"))
+ANTHROPIC_REQUESTS_PER_MINUTE = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "500"))
+ANTHROPIC_TOKENS_PER_MINUTE = int(os.getenv("ANTHROPIC_TOKENS_PER_MINUTE", "300000"))
+ANTHROPIC_MAX_CONCURRENT_REQUESTS = int(os.getenv("ANTHROPIC_MAX_CONCURRENT_REQUESTS", "64"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+# Response budget assumed for models without a max_tokens setting.
+LLM_DEFAULT_MAX_TOKENS = int(os.getenv("LLM_DEFAULT_MAX_TOKENS", "1024"))
+
+# Model provider HTTP connections: one keep-alive pool per provider, shared by
+# every model role and the story_generator client, of at most
+# LLM_POOL_MAX_CONNECTIONS connections, LLM_POOL_MAX_KEEPALIVE of them kept idle
+# for up to LLM_POOL_KEEPALIVE_SECONDS. The API builds the models and opens
+# LLM_PREWARM_CONNECTIONS connections per provider at startup (0 to skip).
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "32"))
+LLM_POOL_KEEPALIVE_SECONDS = float(os.getenv("LLM_POOL_KEEPALIVE_SECONDS", "60"))
+LLM_PREWARM_CONNECTIONS = int(os.getenv("LLM_PREWARM_CONNECTIONS", "4"))
+
+# Story log of the Streamlit app: one JSON object per line in STORY_LOG_PATH,
+# appended under an inter-process lock and fsynced after every story unless
+# STORY_LOG_FSYNC is false. A log in the old single JSON array format at
+# STORY_LOG_LEGACY_PATH is converted on first use. The story pickers list
+# STORY_PICKER_PAGE_SIZE stories per page; their search index is kept in
+# STORY_SEARCH_DB_PATH.
+STORY_LOG_PATH = os.getenv("STORY_LOG_PATH", "story_log.jsonl")
+STORY_LOG_LEGACY_PATH = os.getenv("STORY_LOG_LEGACY_PATH", "story_log.json")
+STORY_LOG_FSYNC = os.getenv("STORY_LOG_FSYNC", "true").lower() == "true"
+STORY_PICKER_PAGE_SIZE = int(os.getenv("STORY_PICKER_PAGE_SIZE", "50"))
+STORY_SEARCH_DB_PATH = os.getenv("STORY_SEARCH_DB_PATH", "story_search.sqlite")
+
+# Pacing analysis of the Streamlit app: "local" scores paragraphs from their
+# sentence length, dialogue, punctuation and new vocabulary; "llm" asks a model.
+PACING_MODE = os.getenv("PACING_MODE", "local")
+
+# Story variant pool of the Streamlit app: when enabled, generate_story keeps
+# up to STORY_POOL_SIZE stories for each of the STORY_POOL_MAX_KEYS most recent
+# parameter combinations and models, answers repeated combinations from them
+# ("round_robin" or "random") and writes replacements in the background with
+# STORY_POOL_REFILL_WORKERS threads.
+STORY_POOL_ENABLED = os.getenv("STORY_POOL_ENABLED", "false").lower() == "true"
+STORY_POOL_SIZE = int(os.getenv("STORY_POOL_SIZE", "3"))
+STORY_POOL_MAX_KEYS = int(os.getenv("STORY_POOL_MAX_KEYS", "128"))
+STORY_POOL_SELECTION = os.getenv("STORY_POOL_SELECTION", "round_robin")
+STORY_POOL_REFILL_WORKERS = int(os.getenv("STORY_POOL_REFILL_WORKERS", "2"))
+
+# Post-generation analyses of the Streamlit app (pacing, postscriptum): run
+# concurrently on STORY_ANALYSIS_WORKERS threads, with the results of the
+# STORY_ANALYSIS_CACHE_ENTRIES most recent ones kept by story hash for reruns.
+STORY_ANALYSIS_WORKERS = int(os.getenv("STORY_ANALYSIS_WORKERS", "4"))
+STORY_ANALYSIS_CACHE_ENTRIES = int(os.getenv("STORY_ANALYSIS_CACHE_ENTRIES", "256"))
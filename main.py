@@ -29,5 +29,5 @@ if st.button("Generate Story"):
         st.subheader("Pacing Analysis")
         st.write("Pacing scores per paragraph:", pacing_scores)
         img = plot_pacing(pacing_scores)
-        components.html(f'<img src="data:image/png;base64,{img}" alt="Pacing Analysis">')
+        components.html(f'<img src="data:image/svg+xml;base64,{img}" alt="Pacing Analysis">')
 
@@ -0,0 +1,224 @@
+import base64
+import re
+
+import numpy as np
+
+
+# Local pacing analysis. Every paragraph gets four features, computed for a
+# whole corpus at once, and a 0-10 pace score combining them: short sentences,
+# dialogue, dense punctuation and new vocabulary read as a faster pace.
+
+FEATURES = ("sentence_length", "dialogue_ratio", "punctuation_density", "lexical_novelty")
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+# Character classes as bit flags, by UTF-16 code unit.
+LETTER, SENTENCE_END, PUNCTUATION, QUOTE, BOUNDARY, APOSTROPHE = (1 << bit for bit in range(6))
+CLASSES = np.zeros(0x10000, dtype=np.uint8)
+for characters, flag in [
+    ("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ", LETTER),
+    (".!?…", SENTENCE_END),
+    (",;:!?…—–-", PUNCTUATION),
+    ("\"“”", QUOTE),
+    # What may follow the end of a sentence.
+    ("\0 \n\"”’)", BOUNDARY),
+    ("'’", APOSTROPHE),
+]:
+    CLASSES[[ord(character) for character in characters]] |= flag
+CLASSES[0xC0:] |= LETTER
+CLASSES[[ord(character) for character in "‘’“”—–…«»„"]] &= ~LETTER & 0xFF
+# Letters of a word contribute code * PRIME ** position to its hash.
+PRIME_POWERS = np.uint64(1_000_003) ** np.arange(64, dtype=np.uint64)
+
+# Feature values mapped to a pace of 0 and 1, and their weights in the score.
+SLOWEST = np.array([35.0, 0.0, 0.0, 0.2])
+FASTEST = np.array([6.0, 0.6, 0.35, 0.8])
+WEIGHTS = np.array([0.35, 0.25, 0.15, 0.25])
+
+
+def paragraphs(story):
+    """The non-empty paragraphs of ``story``, separated by blank lines, or
+    by line breaks if it has no blank lines."""
+    parts = PARAGRAPH_BREAK.split(story.strip())
+    if len(parts) == 1:
+        parts = story.strip().splitlines()
+    return [part.strip() for part in parts if part.strip()]
+
+
+def first_occurrences(keys):
+    """The index of the first occurrence of each distinct value of ``keys``;
+    like np.unique(keys, return_index=True), without its slower stable sort."""
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys)
+    ordered = keys[order]
+    groups = np.flatnonzero(np.concatenate([[True], ordered[1:] != ordered[:-1]]))
+    return np.minimum.reduceat(order, groups)
+
+
+def encode(texts):
+    """The paragraphs ``texts``, each preceded by a NUL, as UTF-16 code units,
+    with the position of each NUL and the length of each paragraph."""
+    text = np.frombuffer(("\0" + "\0".join(texts)).encode("utf-16-le", "surrogatepass"), dtype=np.uint16)
+    starts = np.flatnonzero(text == 0)
+    lengths = np.diff(np.append(starts, len(text))) - 1
+    return text, starts, lengths
+
+
+def paragraph_of(starts, positions):
+    """The paragraph of each of the text ``positions``."""
+    return np.searchsorted(starts, positions, side="right") - 1
+
+
+def per_paragraph(starts, positions):
+    """How many of the text ``positions`` fall in each paragraph."""
+    return np.bincount(paragraph_of(starts, positions), minlength=len(starts))
+
+
+def letters(classes):
+    """Which code units are part of a word. Apostrophes inside words, as in
+    "don't", belong to them."""
+    letter = (classes & LETTER) > 0
+    letter[1:-1] |= ((classes[1:-1] & APOSTROPHE) > 0) & letter[:-2] & letter[2:]
+    return letter
+
+
+def word_starts(letter):
+    """The position of the first letter of each word."""
+    start = letter.copy()
+    start[1:] &= ~letter[:-1]
+    return np.flatnonzero(start)
+
+
+def sentence_ends(classes):
+    """The positions ending a sentence: the last of a run of .!? followed by a
+    space, quote, bracket or the paragraph's end."""
+    ends = np.flatnonzero(classes & SENTENCE_END)
+    following = np.append(classes, BOUNDARY)[ends + 1]
+    return ends[((following & SENTENCE_END) == 0) & ((following & BOUNDARY) > 0)]
+
+
+def quoted_lengths(classes, starts, lengths):
+    """The code units of dialogue in each paragraph. Dialogue runs from a
+    paragraph's first, third, ... quote mark to the next one or the
+    paragraph's end."""
+    quotes = np.flatnonzero(classes & QUOTE)
+    quote_paragraph = paragraph_of(starts, quotes)
+    # The rank of each quote mark within its paragraph.
+    rank = np.arange(len(quotes)) - np.searchsorted(quote_paragraph, quote_paragraph)
+    opening = np.flatnonzero(rank % 2 == 0)
+    closing = opening + 1
+    closed = closing < len(quotes)
+    closed[closed] = quote_paragraph[closing[closed]] == quote_paragraph[opening[closed]]
+    paragraph_ends = (starts + lengths + 1)[quote_paragraph[opening]]
+    run_ends = np.where(closed, quotes[np.minimum(closing, len(quotes) - 1)] + 1, paragraph_ends)
+    return np.bincount(quote_paragraph[opening], weights=run_ends - quotes[opening], minlength=len(starts))
+
+
+def word_hashes(text, letter, starts):
+    """A case-insensitive hash of each word starting at ``starts``."""
+    positions = np.flatnonzero(letter)
+    if not len(positions):
+        return np.zeros(0, np.uint64)
+    first_letter = np.searchsorted(positions, starts)
+    word_lengths = np.diff(np.append(first_letter, len(positions)))
+    # Letters past the 64th all weigh like the 64th.
+    offset = np.minimum(np.arange(len(positions)) - np.repeat(first_letter, word_lengths), len(PRIME_POWERS) - 1)
+    codes = text[positions]
+    codes |= 32 * ((codes >= 65) & (codes <= 90)).astype(np.uint16)
+    return np.add.reduceat(codes * PRIME_POWERS[offset], first_letter)
+
+
+def novel_words(hashes, words, story_ids):
+    """The words new in each paragraph: a word is new in the paragraph of
+    its first use within its story."""
+    word_paragraph = np.repeat(np.arange(len(words)), words)
+    keys = hashes ^ (story_ids[word_paragraph].astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+    return np.bincount(word_paragraph[first_occurrences(keys)], minlength=len(words))
+
+
+def measure(stories):
+    """The features of every paragraph of ``stories``: an array of the story
+    index of each paragraph, and a (paragraphs, len(FEATURES)) array. All
+    paragraphs are measured at once, on the code points of their text."""
+    texts, story_ids = [], []
+    for story_id, story in enumerate(stories):
+        # NUL separates the paragraphs below.
+        parts = paragraphs(story.replace("\0", " "))
+        texts.extend(parts)
+        story_ids.extend([story_id] * len(parts))
+    story_ids = np.array(story_ids, dtype=np.int64)
+    if not texts:
+        return story_ids, np.zeros((0, len(FEATURES)))
+
+    text, starts, lengths = encode(texts)
+    classes = CLASSES[text]
+    letter = letters(classes)
+    starts_of_words = word_starts(letter)
+    words = per_paragraph(starts, starts_of_words)
+    sentences = per_paragraph(starts, sentence_ends(classes))
+    punctuation = per_paragraph(starts, np.flatnonzero(classes & PUNCTUATION))
+    quoted = quoted_lengths(classes, starts, lengths)
+    novel = novel_words(word_hashes(text, letter, starts_of_words), words, story_ids)
+
+    words_or_one = np.maximum(words, 1)
+    features = np.column_stack([
+        words / np.maximum(sentences, 1),
+        quoted / np.maximum(lengths, 1),
+        punctuation / words_or_one,
+        novel / words_or_one,
+    ])
+    return story_ids, features
+
+
+def scores(features):
+    """The 0-10 pace of each row of ``features``."""
+    normalized = np.clip((features - SLOWEST) / (FASTEST - SLOWEST), 0, 1)
+    return np.round(10 * normalized @ WEIGHTS, 2)
+
+
+def analyze(story):
+    """Per paragraph of ``story``, its pace score and features."""
+    _, features = measure([story])
+    return [
+        {"paragraph": number, "pace": float(pace), **dict(zip(FEATURES, map(float, row)))}
+        for number, (pace, row) in enumerate(zip(scores(features), features), 1)
+    ]
+
+
+def analyze_corpus(stories):
+    """The pace scores of the paragraphs of each of ``stories``, in one pass."""
+    story_ids, features = measure(stories)
+    bounds = np.cumsum(np.bincount(story_ids, minlength=len(stories)))[:-1]
+    return [paces.tolist() for paces in np.split(scores(features), bounds)]
+
+
+def plot(scores, width=640, height=240):
+    """A bar chart of per-paragraph pace ``scores`` as a base64-encoded SVG."""
+    left, bottom, top, right = 36, 28, 12, 8
+    plot_width, plot_height = width - left - right, height - top - bottom
+    step = plot_width / max(len(scores), 1)
+
+    def y(value):
+        # The height of ``value`` on the 0-10 axis.
+        return top + plot_height * (1 - value / 10)
+
+    label_every = -(-len(scores) // 30) or 1
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="11">',
+        f'<text x="{left + plot_width / 2}" y="{height - 4}" text-anchor="middle">Paragraph</text>',
+    ]
+    for tick in range(0, 11, 2):
+        parts.append(f'<line x1="{left}" x2="{left + plot_width}" y1="{y(tick):.1f}" y2="{y(tick):.1f}" stroke="#ddd"/>')
+        parts.append(f'<text x="{left - 6}" y="{y(tick) + 4:.1f}" text-anchor="end">{tick}</text>')
+    for index, score in enumerate(scores):
+        x = left + index * step
+        parts.append(
+            f'<rect x="{x + step * 0.15:.1f}" y="{y(score):.1f}" width="{step * 0.7:.1f}" '
+            f'height="{top + plot_height - y(score):.1f}" fill="#4c78a8"><title>{index + 1}: {score}</title></rect>'
+        )
+        if index % label_every == 0:
+            parts.append(f'<text x="{x + step / 2:.1f}" y="{top + plot_height + 14}" text-anchor="middle">{index + 1}</text>')
+    parts.append("</svg>")
+    return base64.b64encode("".join(parts).encode()).decode()
@@ -0,0 +1,126 @@
+"""Chapter tree inserts, relation/path queries and state size at scale.
+
+Compares ChapterTree with the per-chapter children/siblings/cousins lists the
+story graph used to maintain. Run from the repository root:
+
+    python -m scripts.bench_chapter_tree --chapters 10000
+"""
+import argparse
+import json
+import random
+import time
+from copy import deepcopy
+
+from assistant.chapter_tree import ROOT, ChapterTree
+
+
+def legacy_insert(chapter_graph, current, viewing, rewrite):
+    """The relation bookkeeping edit_chapter/continue_chapter used to do."""
+    new_id = str(int(current) + 1)
+    if rewrite:
+        chapter_graph[new_id] = {
+            "children": [],
+            "siblings": deepcopy(chapter_graph[viewing]["siblings"] + [viewing]),
+            "cousins": deepcopy(chapter_graph[viewing]["cousins"]),
+            "parent": deepcopy(chapter_graph[viewing]["parent"]),
+        }
+        for sibling in chapter_graph[new_id]["siblings"]:
+            if sibling != viewing:
+                chapter_graph[sibling]["siblings"].append(new_id)
+        chapter_graph[viewing]["siblings"].append(new_id)
+    else:
+        chapter_graph[new_id] = {
+            "children": [],
+            "siblings": [],
+            "cousins": deepcopy(chapter_graph[viewing]["children"]),
+            "parent": deepcopy(viewing),
+        }
+        for child in chapter_graph[viewing]["children"]:
+            chapter_graph[child]["cousins"].append(new_id)
+        chapter_graph[viewing]["children"].append(new_id)
+    return new_id
+
+
+def legacy_path(chapter_graph, chapter_id):
+    path = []
+    while chapter_id != "-1":
+        path.append(chapter_id)
+        chapter_id = chapter_graph[chapter_id]["parent"]
+    return path[::-1]
+
+
+def operations(num_chapters, rewrite_ratio, seed):
+    """Random (viewing index, is_rewrite) pairs describing how a story grows."""
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(1, i + 1), rng.random() < rewrite_ratio)
+        for i in range(1, num_chapters)
+    ]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def build_tree(ops):
+    tree = ChapterTree()
+    tree.add_continuation(ROOT)
+    for viewing, rewrite in ops:
+        if rewrite and viewing != 1:
+            tree.add_rewrite(viewing)
+        else:
+            tree.add_continuation(viewing)
+    return tree
+
+
+def build_legacy(ops):
+    chapter_graph = {"1": {"children": [], "siblings": [], "cousins": [], "parent": "-1"}}
+    current = "1"
+    for viewing, rewrite in ops:
+        current = legacy_insert(chapter_graph, current, str(viewing), rewrite and viewing != 1)
+    return chapter_graph
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=10000)
+    parser.add_argument("--rewrite-ratio", type=float, default=0.3)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ops = operations(args.chapters, args.rewrite_ratio, args.seed)
+    query_ids = [random.Random(args.seed).randrange(1, args.chapters + 1) for _ in range(args.queries)]
+
+    tree, tree_insert = timed(build_tree, ops)
+    legacy, legacy_insert_time = timed(build_legacy, ops)
+
+    def tree_relations():
+        for i in query_ids:
+            tree.children(i), tree.siblings(i), tree.cousins(i)
+
+    def tree_paths():
+        for i in query_ids:
+            tree.path(i)
+
+    def legacy_paths():
+        for i in query_ids:
+            legacy_path(legacy, str(i))
+
+    _, tree_relation_time = timed(tree_relations)
+    _, tree_path_time = timed(tree_paths)
+    _, legacy_path_time = timed(legacy_paths)
+    tree_blob, tree_dump = timed(json.dumps, tree.to_dict())
+    legacy_blob, legacy_dump = timed(json.dumps, legacy)
+    _, tree_load = timed(lambda: ChapterTree.from_dict(json.loads(tree_blob)).children(1))
+
+    print(f"{args.chapters} chapters, {args.queries} queries")
+    print(f"{'':<28} {'ChapterTree':>12} {'legacy lists':>12}")
+    print(f"{'inserts (ms total)':<28} {tree_insert * 1e3:>12.1f} {legacy_insert_time * 1e3:>12.1f}")
+    print(f"{'path queries (us each)':<28} {tree_path_time / args.queries * 1e6:>12.1f} {legacy_path_time / args.queries * 1e6:>12.1f}")
+    print(f"{'relation queries (us each)':<28} {tree_relation_time / args.queries * 1e6:>12.1f} {'stored':>12}")
+    print(f"{'serialized size (KB)':<28} {len(tree_blob) / 1e3:>12.1f} {len(legacy_blob) / 1e3:>12.1f}")
+    print(f"{'serialize (ms)':<28} {tree_dump * 1e3:>12.1f} {legacy_dump * 1e3:>12.1f}")
+    print(f"{'load + index (ms)':<28} {tree_load * 1e3:>12.1f} {'-':>12}")
@@ -0,0 +1,99 @@
+"""Checkpoint write/read latency as a story's chapter_graph grows.
+
+Every checkpoint holds the state the story graph writes: the chapters, their
+ChapterTree and the block summaries of a story of the given length. Database
+sizes include the SQLite write-ahead log.
+
+Run from the repository root:
+
+    python -m scripts.bench_checkpointer --chapters 10 50 100 200 500
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+import config
+from assistant.chapter_tree import ROOT, ChapterTree
+from assistant.checkpointer import SqliteCheckpointSaver, database_size
+
+
+def make_story_state(num_chapters, chapter_words):
+    """The graph state of a story of ``num_chapters`` continuations."""
+    content = " ".join(["word"] * chapter_words)
+    summary = content[: len(content) // 10]
+    tree = ChapterTree()
+    for chapter_id in range(1, num_chapters + 1):
+        tree.add_continuation(chapter_id - 1 if chapter_id > 1 else ROOT)
+    fanout = config.SUMMARY_FANOUT
+    # One block summary per full block of every level, as hierarchical_summary keeps.
+    summary_index = {}
+    level, blocks = 1, num_chapters // fanout
+    while blocks:
+        for block in range(1, blocks + 1):
+            summary_index[f"{fanout}:{level}:{block * fanout ** level}"] = summary
+        level, blocks = level + 1, blocks // fanout
+    return {
+        "chapter_graph": {
+            str(chapter_id): {"content": content, "summary": summary, "title": f"Chapter {chapter_id}"}
+            for chapter_id in range(1, num_chapters + 1)
+        },
+        "chapter_tree": tree.to_dict(),
+        "summary_index": summary_index,
+        "chapter_id_viewing": str(num_chapters),
+        "chapter_id_current": str(num_chapters),
+    }
+
+
+def bench(saver, num_chapters, chapter_words, repeats):
+    thread = {"configurable": {"thread_id": f"bench-{num_chapters}"}}
+    state = make_story_state(num_chapters, chapter_words)
+    writes, reads = [], []
+    for _ in range(repeats):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = state
+        start = time.perf_counter()
+        thread = saver.put(thread, checkpoint, {"source": "loop", "step": 1})
+        writes.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        saver.get_tuple({"configurable": {"thread_id": thread["configurable"]["thread_id"]}})
+        reads.append(time.perf_counter() - start)
+    return statistics.median(writes), statistics.median(reads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, nargs="+", default=[10, 50, 100, 200, 500])
+    parser.add_argument("--chapter-words", type=int, default=800)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--keep-last", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        savers = {
+            "memory": MemorySaver(),
+            "sqlite": SqliteCheckpointSaver.from_path(
+                str(Path(tmp) / "bench.sqlite"), keep_last=args.keep_last
+            ),
+        }
+        print(f"{'saver':<8} {'chapters':>8} {'write ms':>10} {'read ms':>10}")
+        for name, saver in savers.items():
+            for num_chapters in args.chapters:
+                write, read = bench(saver, num_chapters, args.chapter_words, args.repeats)
+                print(f"{name:<8} {num_chapters:>8} {write * 1000:>10.2f} {read * 1000:>10.2f}")
+
+        sqlite_saver = savers["sqlite"]
+        db_path = Path(tmp) / "bench.sqlite"
+        size_before = database_size(db_path)
+        start = time.perf_counter()
+        sqlite_saver.maintain()
+        elapsed = time.perf_counter() - start
+        print(
+            f"\ncompaction to {args.keep_last} checkpoints/thread: {elapsed * 1000:.1f} ms, "
+            f"{size_before / 1e6:.1f} MB -> {database_size(db_path) / 1e6:.1f} MB"
+        )
@@ -0,0 +1,282 @@
+"""Framework overhead of the story graph, with replayed fake models.
+
+Every chat model of the v2 graph is replaced by a deterministic local fake
+that answers with text from the logged stories, after a
+configurable latency. Each session writes a first chapter and then continues
+or rewrites it up to --depth chapters; sessions run --concurrency at a time.
+Reports per-node and per-model wall time, checkpoint writes, memory growth
+and throughput. Needs no network or API keys. Run from the repository root:
+
+    python -m scripts.bench_graph --sessions 20 --depth 10 --latency 0
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+# Must be set before the graph module reads its configuration.
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+os.environ["CHECKPOINT_BACKEND"] = "memory"
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+for provider in ("OPENAI", "ANTHROPIC"):
+    os.environ[f"{provider}_REQUESTS_PER_MINUTE"] = "0"
+    os.environ[f"{provider}_TOKENS_PER_MINUTE"] = "0"
+    os.environ[f"{provider}_MAX_CONCURRENT_REQUESTS"] = "1000000"
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, get_buffer_string
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.checkpoint.memory import MemorySaver
+
+import assistant.multi_agent_system_v2 as story_graph
+from assistant import metrics
+from assistant.checkpointer import SqliteCheckpointSaver, database_size
+from assistant.models import ROLE_MODELS, role_model
+from story_generator import get_logged_stories
+
+
+PERSONAS = {
+    "character": "J. K. Rowling",
+    "environment": "H. P. Lovecraft",
+    "brainstorm": "Lev Tolstoy",
+    "outline": "Cristopher Nolan",
+    "chapter": "Fyodor Dostoevsky",
+}
+
+
+# Word lists of the logged stories. Kept out of the model's fields, which
+# LangChain serialises on every call.
+CORPUS = []
+
+
+class ReplayChatModel(BaseChatModel):
+    """Answers with ``words`` words of a logged story chosen by hashing the
+    prompt, after ``latency`` seconds. Streams ``chunk_words`` at a time."""
+
+    role: str
+    latency: float = 0.0
+    words: int = 200
+    chunk_words: int = 5
+    seed: int = 0
+
+    @property
+    def _llm_type(self):
+        return "replay-chat-model"
+
+    def reply(self, messages):
+        prompt = get_buffer_string(messages)
+        digest = hashlib.sha256(f"{self.seed}:{self.role}:{prompt}".encode()).digest()
+        number = int.from_bytes(digest[:8], "big")
+        story = CORPUS[number % len(CORPUS)]
+        start = number // len(CORPUS) % len(story)
+        words = [story[(start + i) % len(story)] for i in range(self.words)]
+        if self.role == "brainstormer":
+            # Numbered ideas, so continuing with branches finds several.
+            step = max(1, len(words) // 5)
+            return "\n".join(
+                f"{i + 1}. {' '.join(words[j : j + step])}"
+                for i, j in enumerate(range(0, len(words), step))
+            )
+        return " ".join(words)
+
+    def usage(self, messages, text):
+        input_tokens = len(get_buffer_string(messages)) // 4
+        output_tokens = len(text) // 4
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def result(self, messages):
+        text = self.reply(messages)
+        message = AIMessage(content=text, usage_metadata=self.usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self.result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.result(messages)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        words = self.reply(messages).split(" ")
+        for i in range(0, len(words), self.chunk_words):
+            chunk = " ".join(words[i : i + self.chunk_words])
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk if i == 0 else " " + chunk))
+
+
+def install_fakes(latency, words, seed):
+    for role in ROLE_MODELS:
+        role_model(role).models = [
+            ReplayChatModel(role=role, latency=latency, words=words, seed=seed, cache=False)
+        ]
+    return list(ROLE_MODELS)
+
+
+class TimedCheckpointer:
+    """Records the time of every checkpoint write of ``saver``."""
+
+    def __init__(self, saver):
+        self.saver = saver
+        self.writes = []
+        put = saver.aput
+
+        async def timed_put(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await put(*args, **kwargs)
+            finally:
+                self.writes.append(time.perf_counter() - start)
+
+        saver.aput = timed_put
+
+
+def step_values(step, rng, rewrite_ratio, branches):
+    if step == 0:
+        return {
+            "instruction": "A story about a sailor",
+            "details": "a story should have three main characters",
+            "personas": PERSONAS,
+        }
+    # As /update/ sends them, clearing the other action's instructions.
+    if rng.random() < rewrite_ratio:
+        return {"rewrite_instructions": "change the current location to Munich", "continue_instructions": ""}
+    return {"continue_instructions": "continue with the story", "continue_branches": branches, "rewrite_instructions": ""}
+
+
+def action(values):
+    if "instruction" in values:
+        return "first"
+    return "rewrite" if values.get("rewrite_instructions") else "continue"
+
+
+async def run_session(graph, session, args, mode, requested):
+    rng = random.Random(f"{args.seed}:{session}")
+    thread = {"configurable": {"thread_id": f"bench-{session}"}, "callbacks": [metrics.handler]}
+    for step in range(args.depth):
+        values = step_values(step, rng, args.rewrite_ratio, args.branches)
+        requested[action(values)] += 1
+        if mode == "events":
+            async for _ in graph.astream_events(values, thread, version="v2"):
+                pass
+        else:
+            await graph.ainvoke(values, thread)
+
+
+async def run(graph, args):
+    """Run the sessions; returns how many runs of each node were requested."""
+    slots = asyncio.Semaphore(args.concurrency)
+    requested = Counter()
+
+    async def limited(session):
+        async with slots:
+            await run_session(graph, session, args, args.mode, requested)
+
+    await asyncio.gather(*(limited(session) for session in range(args.sessions)))
+    return requested
+
+
+def check_routing(requested, rewrite_ratio):
+    """Fail unless every run went to the node its request asked for and the
+    updates rewrote at about --rewrite-ratio, so a routing bug cannot skew
+    the measured mix of continues and rewrites."""
+    observed = {
+        node: metrics.stage_runs.values.get(("node", node, "ok"), 0) for node in requested
+    }
+    if observed != dict(requested):
+        raise SystemExit(f"graph runs were routed to {observed}, requested {dict(requested)}")
+    updates = requested["continue"] + requested["rewrite"]
+    if not updates:
+        return
+    ratio = requested["rewrite"] / updates
+    print(f"updates: {requested['continue']} continues, {requested['rewrite']} rewrites "
+          f"({ratio:.0%} rewrites, requested {rewrite_ratio:.0%})")
+    # Four standard errors of the binomial draw, plus rounding.
+    tolerance = 4 * math.sqrt(rewrite_ratio * (1 - rewrite_ratio) / updates) + 1 / updates
+    if abs(ratio - rewrite_ratio) > tolerance:
+        raise SystemExit(f"rewrite ratio {ratio:.2f} is off the requested {rewrite_ratio:.2f}")
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return statistics.mean(ordered), pick(0.5), pick(0.95)
+
+
+def histogram_mean(histogram, *labels):
+    counts, total = histogram.values[labels]
+    return sum(counts), total / sum(counts)
+
+
+def rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=10, help="graph runs per session")
+    parser.add_argument("--rewrite-ratio", type=float, default=0.3)
+    parser.add_argument("--branches", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per fake model call")
+    parser.add_argument("--words", type=int, default=200, help="words per fake model response")
+    parser.add_argument("--checkpointer", choices=["memory", "sqlite"], default="sqlite")
+    parser.add_argument("--mode", choices=["invoke", "events"], default="events")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace Python allocations (slow)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    CORPUS.extend(entry["story"].split() for entry in get_logged_stories() if entry["story"].strip())
+    roles = install_fakes(args.latency, args.words, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.sqlite"
+        saver = SqliteCheckpointSaver.from_path(str(db_path)) if args.checkpointer == "sqlite" else MemorySaver()
+        checkpoints = TimedCheckpointer(saver)
+        graph = story_graph.builder.compile(checkpointer=saver)
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        requested = asyncio.run(run(graph, args))
+        elapsed = time.perf_counter() - start
+        rss_after = rss_mb()
+        traced = tracemalloc.get_traced_memory() if args.tracemalloc else None
+        db_size = database_size(db_path)
+
+    check_routing(requested, args.rewrite_ratio)
+    runs = args.sessions * args.depth
+    print(f"{len(CORPUS)} logged stories, {len(roles)} fake roles, latency {args.latency * 1e3:.0f} ms, {args.words} words")
+    print(f"{args.sessions} sessions x depth {args.depth}, {args.concurrency} concurrent, {args.mode}, {args.checkpointer} checkpoints")
+    print()
+    print(f"{'stage':<40} {'runs':>6} {'mean ms':>9}")
+    for kind in ("node", "chain", "model"):
+        for labels in sorted(key for key in metrics.stage_seconds.values if key[0] == kind):
+            count, mean = histogram_mean(metrics.stage_seconds, *labels)
+            print(f"{kind + ' ' + labels[1]:<40} {count:>6} {mean * 1e3:>9.2f}")
+    print()
+    mean, p50, p95 = percentiles(checkpoints.writes)
+    print(f"checkpoint writes: {len(checkpoints.writes)}, mean {mean * 1e3:.2f} ms, p50 {p50 * 1e3:.2f} ms, p95 {p95 * 1e3:.2f} ms")
+    if args.checkpointer == "sqlite":
+        print(f"checkpoint database: {db_size / 1e6:.1f} MB")
+    print(f"max RSS: {rss_before:.0f} MB before, {rss_after:.0f} MB after")
+    if traced:
+        print(f"traced Python memory: {traced[0] / 1e6:.1f} MB now, {traced[1] / 1e6:.1f} MB peak")
+    print(f"throughput: {runs / elapsed:.1f} graph runs/s, {elapsed:.2f} s total")
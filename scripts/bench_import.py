@@ -0,0 +1,94 @@
+"""Import time of the story modules, each in a fresh interpreter.
+
+Times importing assistant.multi_agent_system_v2, app.api and src.run with no
+API keys in the environment, and separately the first use of the graph
+module: building every role model and compiling the graph. With
+--importtime, also prints the slowest modules reported by ``-X importtime``.
+Run from the repository root:
+
+    python -m scripts.bench_import --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+MODULES = ["assistant.multi_agent_system_v2", "app.api", "src.run"]
+
+# Run in the child interpreter; prints the timings as JSON.
+PROBE = """
+import json, time
+start = time.perf_counter()
+import {module}
+timings = {{"import": time.perf_counter() - start}}
+if {first_use}:
+    import assistant.multi_agent_system_v2 as story_graph
+    from assistant.models import ROLE_MODELS, role_model
+    start = time.perf_counter()
+    for role in ROLE_MODELS:
+        role_model(role)
+    timings["role models"] = time.perf_counter() - start
+    start = time.perf_counter()
+    story_graph.get_graph()
+    timings["graph"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def environment(first_use):
+    env = {key: value for key, value in os.environ.items() if not key.endswith("_API_KEY")}
+    # Importing must not need keys; building the clients does.
+    if first_use:
+        env.update(OPENAI_API_KEY="bench", ANTHROPIC_API_KEY="bench")
+    env["CHECKPOINT_BACKEND"] = "memory"
+    return env
+
+
+def probe(module, first_use):
+    code = PROBE.format(module=module, first_use=first_use)
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=environment(first_use), capture_output=True, text=True
+    )
+    if result.returncode:
+        raise SystemExit(f"importing {module} failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def importtime(module, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=environment(False), capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), int(parts[0]), parts[2].rstrip()))
+    for cumulative, own, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1e3:>8.1f} ms {own / 1e3:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="also show the slowest imported modules")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'module':<36} {'median ms':>10} {'min ms':>8}")
+    for module in MODULES:
+        times = [probe(module, False)["import"] for _ in range(args.repeat)]
+        print(f"{module:<36} {statistics.median(times) * 1e3:>10.0f} {min(times) * 1e3:>8.0f}")
+    first_use = [probe(MODULES[0], True) for _ in range(args.repeat)]
+    for step in ("role models", "graph"):
+        times = [timings[step] for timings in first_use]
+        print(f"{'first use: ' + step:<36} {statistics.median(times) * 1e3:>10.0f} {min(times) * 1e3:>8.0f}")
+
+    if args.importtime:
+        for module in MODULES:
+            print(f"\nslowest imports of {module} (cumulative, self):")
+            importtime(module, args.top)
@@ -0,0 +1,181 @@
+"""Load test the story API with concurrent writers and report its saturation.
+
+Each simulated writer starts a story on /stream/ and then continues or
+rewrites it on /update/ --depth times before starting the next one, with
+--sse-ratio of the requests streamed. The API's LLM cache is bypassed unless
+--use-cache is given, since the writers repeat the same prompts. Every --users level runs for
+--duration seconds; per level it reports throughput, p50/p95/p99 latency,
+the streamed time to first token and the error rate. Run the API against
+scripts.stub_llm_server and then, from the repository root:
+
+    python -m scripts.load_test --url http://127.0.0.1:8000 --users 1 2 4 8 16 32
+"""
+import argparse
+import asyncio
+import csv
+import json
+import random
+import time
+
+import httpx
+
+
+PERSONAS = {
+    "character": "J. K. Rowling",
+    "environment": "H. P. Lovecraft",
+    "brainstorm": "Lev Tolstoy",
+    "outline": "Cristopher Nolan",
+    "chapter": "Fyodor Dostoevsky",
+}
+
+
+class Sample:
+    def __init__(self, kind, latency, ok, first_token=None):
+        self.kind = kind
+        self.latency = latency
+        self.ok = ok
+        self.first_token = first_token
+
+
+async def read_events(response):
+    """Yield the ``(event, data)`` pairs of a Server-Sent Events response."""
+    event = None
+    async for line in response.aiter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+async def request(client, kind, sse, url, **kwargs):
+    """Send one request; returns its Sample and the response's session id."""
+    start = time.perf_counter()
+    first_token = None
+    session_id = None
+    ok = False
+    try:
+        if not sse:
+            response = await client.post(url, **kwargs)
+            ok = response.status_code == 200
+            session_id = response.json().get("session_id") if ok else None
+        else:
+            async with client.stream("POST", url, **kwargs) as response:
+                if response.status_code == 200:
+                    async for event, data in read_events(response):
+                        if event == "session":
+                            session_id = data["session_id"]
+                        elif event == "token" and first_token is None:
+                            first_token = time.perf_counter() - start
+                        elif event == "error":
+                            break
+                        elif event == "done":
+                            ok = True
+    except httpx.HTTPError:
+        ok = False
+    return Sample(kind, time.perf_counter() - start, ok, first_token), session_id
+
+
+async def writer(client, args, rng, deadline, samples):
+    while time.monotonic() < deadline:
+        sse = rng.random() < args.sse_ratio
+        body = {
+            "instruction": "A story about a sailor",
+            "details": "a story should have three main characters",
+            "personas": PERSONAS,
+            "no_cache": not args.use_cache,
+        }
+        sample, session_id = await request(client, "stream", sse, "/stream/", json=body, params={"sse": sse})
+        samples.append(sample)
+        for _ in range(args.depth):
+            if session_id is None or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+            action = "rewrite" if rng.random() < args.rewrite_ratio else "continue"
+            sse = rng.random() < args.sse_ratio
+            params = {
+                "action_type": action,
+                "instructions": f"{action} the story",
+                "session_id": session_id,
+                "sse": sse,
+                "no_cache": not args.use_cache,
+            }
+            sample, _ = await request(client, action, sse, "/update/", params=params)
+            samples.append(sample)
+
+
+def quantile(values, q):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_level(args, users):
+    samples = []
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        deadline = time.monotonic() + args.duration
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(writer(client, args, random.Random(f"{args.seed}:{users}:{i}"), deadline, samples) for i in range(users))
+        )
+        elapsed = time.perf_counter() - start
+    done = [sample for sample in samples if sample.ok]
+    latencies = [sample.latency for sample in done]
+    first_tokens = [sample.first_token for sample in done if sample.first_token is not None]
+    return {
+        "users": users,
+        "requests": len(samples),
+        "throughput": len(done) / elapsed,
+        "p50": quantile(latencies, 0.5),
+        "p95": quantile(latencies, 0.95),
+        "p99": quantile(latencies, 0.99),
+        "first_token_p50": quantile(first_tokens, 0.5),
+        "first_token_p95": quantile(first_tokens, 0.95),
+        "error_rate": 1 - len(done) / len(samples) if samples else 0.0,
+    }
+
+
+def saturation(results):
+    """The first level that added less than 10% throughput over the previous
+    one, i.e. where more writers only add queueing."""
+    for previous, result in zip(results, results[1:]):
+        if result["throughput"] < previous["throughput"] * 1.1:
+            return previous["users"]
+    return None
+
+
+async def main(args):
+    results = []
+    print(f"{'users':>6} {'reqs':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'ttft p50':>9} {'ttft p95':>9} {'errors':>7}")
+    for users in args.users:
+        result = await run_level(args, users)
+        results.append(result)
+        print(
+            f"{users:>6} {result['requests']:>6} {result['throughput']:>7.2f} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+            f"{result['p99']:>7.2f} {result['first_token_p50']:>9.2f} {result['first_token_p95']:>9.2f} {result['error_rate']:>7.1%}"
+        )
+    knee = saturation(results)
+    if knee:
+        print(f"throughput stops scaling beyond about {knee} concurrent writers")
+    if args.csv:
+        with open(args.csv, "w", newline="") as file:
+            table = csv.DictWriter(file, fieldnames=list(results[0]))
+            table.writeheader()
+            table.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=60, help="seconds per level")
+    parser.add_argument("--depth", type=int, default=5, help="updates per story")
+    parser.add_argument("--rewrite-ratio", type=float, default=0.3)
+    parser.add_argument("--sse-ratio", type=float, default=0.5)
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between a writer's requests")
+    parser.add_argument("--use-cache", action="store_true", help="let the API answer repeated prompts from its LLM cache")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--csv", help="also write the results to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
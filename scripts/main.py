@@ -1,14 +1,297 @@
-# from assistant.multi_agent_system_v2 import graph
+"""Generate stories in bulk, for evaluation datasets, and stream them to a JSON Lines file.
 
-# if __name__ == "__main__":
-#     for s in graph.stream({"instruction": "A story about a detective", "details": "a detective named Sherlock Holmes"}):
-#         if "__end__" not in s:
-#             print(s)
-#             print("----")
+The "grid" command writes one story per combination of the given story
+parameters (the options of the story creator UI), --repeats times each, with
+the story generator. The "jobs" command runs the story graph once per line of
+a JSON Lines file of {"id", "instruction", "details", "personas"} objects
+(the /stream/ request body; "id" defaults to the line number) and keeps the
+chapter it writes.
 
-#     instruction = input("Enter instruction: ")
-#     for s in graph.stream({"instruction": instruction}):
-#         if "__end__" not in s:
-#             print(s)
-#             print("----")
+At most --concurrency stories are generated at once, at batch priority. Each
+result is appended to --output as soon as it is done, with its parameters,
+tokens and estimated cost; a rerun with the same output skips the stories it
+already holds, so an interrupted run resumes where it stopped, and retries
+the failed ones. Throughput and cost are reported at the end. From the
+repository root:
 
+    python -m scripts.main grid --output stories.jsonl --models gpt-4o-2024-05-13 gpt-3.5-turbo \\
+        --moral-themes Honesty Fairness --num-characters 1 3 --concurrency 8
+    python -m scripts.main jobs requests.jsonl --output chapters.jsonl --concurrency 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from assistant import metrics
+from assistant.llm_scheduler import BATCH, priority
+
+
+# USD per million input and output tokens, for the cost estimate; --prices
+# overrides or extends them.
+PRICES = {
+    "gpt-4o-2024-05-13": (5.0, 15.0),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "claude-3-5-sonnet-20240620": (3.0, 15.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+}
+
+# The grid options and their defaults, as in ui_elements.display_ui.
+GRID = {
+    "model": ("--models", ["gpt-4o-2024-05-13"]),
+    "length": ("--lengths", ["Short"]),
+    "fiction_level": ("--fiction-levels", ["Complete fiction"]),
+    "reality_level": ("--reality-levels", ["Completely fantastical"]),
+    "informativeness": ("--informativeness", ["Information"]),
+    "moral_theme": ("--moral-themes", ["Honesty"]),
+    "ip_avoidance": ("--ip-avoidance", ["Completely original"]),
+    "num_characters": ("--num-characters", [1]),
+}
+
+
+class Usage:
+    """Input and output tokens by model."""
+
+    def __init__(self):
+        self.tokens = Counter()
+
+    def add(self, model, input_tokens, output_tokens):
+        self.tokens[model, "input"] += input_tokens
+        self.tokens[model, "output"] += output_tokens
+
+    def update(self, other):
+        self.tokens.update(other.tokens)
+
+    def total(self, direction):
+        return sum(count for (_, kind), count in self.tokens.items() if kind == direction)
+
+    def cost(self, prices):
+        """The estimated cost in USD, and the models without a price."""
+        cost, unpriced = 0.0, set()
+        for (model, direction), count in self.tokens.items():
+            if model not in prices:
+                unpriced.add(model)
+                continue
+            cost += count * prices[model][direction == "output"] / 1_000_000
+        return cost, unpriced
+
+    def to_dict(self):
+        models = {}
+        for (model, direction), count in self.tokens.items():
+            models.setdefault(model, {})[direction] = count
+        return models
+
+
+class UsageHandler(BaseCallbackHandler):
+    """Counts the tokens of the role models of one graph run, by the model
+    that answered; cached responses cost nothing."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.usage = Usage()
+        self.roles = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        role = (metadata or {}).get("name")
+        if role:
+            self.roles[run_id] = role
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        from assistant.models import ROLE_MODELS
+
+        role = self.roles.pop(run_id, None)
+        if role is None:
+            return
+        message = response.generations[0][0].message
+        usage = message.usage_metadata
+        if usage and message.id == f"run-{run_id}":
+            metadata = message.response_metadata
+            model = metadata.get("model_name") or metadata.get("model") or ROLE_MODELS[role][0][1]
+            self.usage.add(model, usage["input_tokens"], usage["output_tokens"])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.roles.pop(run_id, None)
+
+
+def grid_jobs(args):
+    names = list(GRID)
+    for values in itertools.product(*(getattr(args, name) for name in names)):
+        parameters = dict(zip(names, values))
+        for repeat in range(args.repeats):
+            yield f"{'|'.join(map(str, values))}#{repeat}", parameters
+
+
+def file_jobs(path):
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                job = json.loads(line)
+                yield str(job.get("id", number)), job
+
+
+def write_grid_story(job_id, parameters, log_stories):
+    import story_generator
+
+    story_parameters = {name: value for name, value in parameters.items() if name != "model"}
+    prompt = story_generator.construct_prompt(**story_parameters)
+    response = story_generator.complete_story(parameters["model"], prompt)
+    story = response.choices[0].message.content.strip()
+    usage = Usage()
+    if response.usage:
+        usage.add(response.model or parameters["model"], response.usage.prompt_tokens, response.usage.completion_tokens)
+    if log_stories:
+        story_generator.log_story(prompt, story, job_id, story_parameters)
+    return {"prompt": prompt, "story": story}, usage
+
+
+async def run_grid_job(job_id, parameters, args):
+    return await asyncio.to_thread(write_grid_story, job_id, parameters, args.log_stories)
+
+
+@lru_cache(maxsize=None)
+def story_graph():
+    from assistant.multi_agent_system_v2 import builder
+
+    # No checkpointer: every job is a single run on a fresh state.
+    return builder.compile()
+
+
+async def run_graph_job(job_id, job, args):
+    missing = [key for key in ("instruction", "details", "personas") if key not in job]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    values = {key: job[key] for key in ("instruction", "details", "personas")}
+    handler = UsageHandler()
+    state = await story_graph().ainvoke(values, {"callbacks": [metrics.handler, handler]})
+    chapter = state["chapter_graph"][state["chapter_id_viewing"]]
+    return {"story_title": state.get("story_title", ""), "chapter": chapter}, handler.usage
+
+
+def completed(path):
+    """The ids of the jobs ``path`` holds a result of."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Cut short by an interrupted run; that job runs again.
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def open_output(path):
+    output = open(path, "a", encoding="utf-8")
+    if output.tell():
+        with open(path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                # End the line an interrupted run left partial.
+                output.write("\n")
+    return output
+
+
+async def run(args, jobs, run_job, prices):
+    done = completed(args.output)
+    pending = [(job_id, job) for job_id, job in jobs if job_id not in done]
+    print(f"{len(pending)} stories to generate, {len(done)} already in {args.output}")
+    semaphore = asyncio.Semaphore(args.concurrency)
+    usage = Usage()
+    counts = Counter()
+    start = time.perf_counter()
+
+    async def generate(output, job_id, job):
+        async with semaphore:
+            job_start = time.perf_counter()
+            record = {"id": job_id, "parameters": job}
+            try:
+                result, job_usage = await run_job(job_id, job, args)
+            except Exception as error:
+                record.update(status="error", error=f"{type(error).__name__}: {error}")
+            else:
+                usage.update(job_usage)
+                cost, _ = job_usage.cost(prices)
+                record.update(status="ok", **result, usage=job_usage.to_dict(), cost=round(cost, 6))
+            record["seconds"] = round(time.perf_counter() - job_start, 3)
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        counts[record["status"]] += 1
+        print(f"[{sum(counts.values())}/{len(pending)}] {job_id}: {record['status']} in {record['seconds']:.1f}s"
+              + (f" ({record['error']})" if record["status"] == "error" else ""))
+
+    with open_output(args.output) as output, priority(BATCH):
+        await asyncio.gather(*(generate(output, job_id, job) for job_id, job in pending))
+    elapsed = time.perf_counter() - start
+
+    cost, unpriced = usage.cost(prices)
+    output_tokens = usage.total("output")
+    print(f"\n{counts['ok']} stories written, {counts['error']} failed, in {elapsed:.1f}s")
+    if elapsed and counts["ok"]:
+        print(f"throughput: {counts['ok'] / elapsed * 60:.2f} stories/min, {output_tokens / elapsed:.0f} output tokens/s")
+    print(f"tokens: {usage.total('input')} in, {output_tokens} out")
+    print(f"estimated cost: ${cost:.4f}" + (f" (${cost / counts['ok']:.4f} per story)" if counts["ok"] else ""))
+    if unpriced:
+        print(f"not priced (see --prices): {', '.join(sorted(unpriced))}")
+
+
+def main(args):
+    prices = dict(PRICES)
+    if args.prices:
+        with open(args.prices) as file:
+            prices.update({model: tuple(price) for model, price in json.load(file).items()})
+    if args.command == "grid":
+        jobs, run_job = list(grid_jobs(args)), run_grid_job
+    else:
+        jobs, run_job = list(file_jobs(args.jobs)), run_graph_job
+    ids = Counter(job_id for job_id, _ in jobs)
+    duplicates = [job_id for job_id, count in ids.items() if count > 1]
+    if duplicates:
+        raise SystemExit(f"duplicate job ids: {', '.join(duplicates[:10])}")
+
+    async def start():
+        # Grid stories are generated in threads, at most --concurrency at once.
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency))
+        await run(args, jobs, run_job, prices)
+
+    asyncio.run(start())
+
+
+if __name__ == "__main__":
+    from story_generator import PARAMETER_PROMPTS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    grid = commands.add_parser("grid", help="one story per combination of story parameters")
+    for name, (flag, default) in GRID.items():
+        grid.add_argument(
+            flag,
+            dest=name,
+            nargs="+",
+            default=default,
+            type=int if name == "num_characters" else str,
+            choices=list(PARAMETER_PROMPTS[name]) if name in PARAMETER_PROMPTS else None,
+        )
+    grid.add_argument("--repeats", type=int, default=1, help="stories per combination")
+    grid.add_argument("--log-stories", action="store_true", help="also append the stories to the story log")
+    jobs = commands.add_parser("jobs", help="one story graph run per line of a JSON Lines file")
+    jobs.add_argument("jobs", help="JSON Lines file of instruction/details/personas objects")
+    for command in (grid, jobs):
+        command.add_argument("--output", required=True, help="JSON Lines file the results are appended to")
+        command.add_argument("--concurrency", type=int, default=4, help="stories generated at once")
+        command.add_argument("--prices", help='JSON file of {"model": [input, output]} USD per million tokens')
+    main(parser.parse_args())
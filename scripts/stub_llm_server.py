@@ -0,0 +1,179 @@
+"""Local stand-in for the OpenAI and Anthropic chat APIs, for load tests.
+
+Serves /v1/chat/completions and /v1/messages, streaming or not, with text
+taken from the logged stories. Latency, output speed and 429s can
+be injected. Point the story API at it with
+
+    OPENAI_API_BASE=http://127.0.0.1:9000/v1 OPENAI_BASE_URL=http://127.0.0.1:9000/v1 \\
+    ANTHROPIC_API_URL=http://127.0.0.1:9000 uvicorn src.run:app
+
+and start it from the repository root:
+
+    python -m scripts.stub_llm_server --port 9000 --latency 0.5 --tokens-per-second 80
+"""
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse, StreamingResponse
+
+from story_generator import get_logged_stories
+
+
+app = FastAPI()
+settings = argparse.Namespace()
+corpus = []
+recent_requests = collections.deque()
+
+
+def prompt_text(body):
+    parts = [body.get("system") or ""]
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def completion_words(prompt):
+    rng = random.Random(prompt)
+    story = rng.choice(corpus)
+    start = rng.randrange(len(story))
+    return [story[(start + i) % len(story)] for i in range(settings.words)]
+
+
+def rate_limited():
+    """Whether to answer this request with a 429."""
+    now = time.monotonic()
+    while recent_requests and now - recent_requests[0] > 60:
+        recent_requests.popleft()
+    if settings.rpm and len(recent_requests) >= settings.rpm:
+        return True
+    recent_requests.append(now)
+    return random.random() < settings.rate_limit
+
+
+async def first_token_delay():
+    await asyncio.sleep(max(0.0, settings.latency * random.uniform(1 - settings.jitter, 1 + settings.jitter)))
+
+
+async def word_delay():
+    if settings.tokens_per_second:
+        await asyncio.sleep(1 / settings.tokens_per_second)
+
+
+def sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def too_many_requests(body):
+    return JSONResponse(body, status_code=429, headers={"retry-after": str(settings.retry_after)})
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await request.json()
+    if rate_limited():
+        return too_many_requests({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+    prompt = prompt_text(body)
+    words = completion_words(prompt)
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(words), "total_tokens": len(prompt) // 4 + len(words)}
+    head = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": body.get("model", "stub")}
+
+    if not body.get("stream"):
+        await first_token_delay()
+        for _ in words:
+            await word_delay()
+        return {
+            **head,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    def chunk(delta, finish_reason=None):
+        return sse({**head, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+    async def events():
+        await first_token_delay()
+        yield chunk({"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            yield chunk({"content": word if i == 0 else " " + word})
+            await word_delay()
+        yield chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield sse({**head, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/messages")
+async def anthropic_messages(request: Request):
+    body = await request.json()
+    if rate_limited():
+        return too_many_requests({"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limit reached"}})
+    prompt = prompt_text(body)
+    words = completion_words(prompt)
+    message = {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub"),
+        "stop_sequence": None,
+    }
+
+    if not body.get("stream"):
+        await first_token_delay()
+        for _ in words:
+            await word_delay()
+        return {
+            **message,
+            "content": [{"type": "text", "text": " ".join(words)}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(words)},
+        }
+
+    async def events():
+        await first_token_delay()
+        start = {**message, "content": [], "stop_reason": None, "usage": {"input_tokens": len(prompt) // 4, "output_tokens": 1}}
+        yield sse({"type": "message_start", "message": start}, "message_start")
+        yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        for i, word in enumerate(words):
+            delta = {"type": "text_delta", "text": word if i == 0 else " " + word}
+            yield sse({"type": "content_block_delta", "index": 0, "delta": delta}, "content_block_delta")
+            await word_delay()
+        yield sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        yield sse(
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": len(words)}},
+            "message_delta",
+        )
+        yield sse({"type": "message_stop"}, "message_stop")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds until the first token")
+    parser.add_argument("--jitter", type=float, default=0.3, help="relative spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="output speed, 0 for instant")
+    parser.add_argument("--words", type=int, default=300, help="words per response")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--rpm", type=int, default=0, help="answer requests beyond this many a minute with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.parse_args(namespace=settings)
+
+    corpus.extend(entry["story"].split() for entry in get_logged_stories() if entry["story"].strip())
+    uvicorn.run(app, host=settings.host, port=settings.port, log_level="warning")
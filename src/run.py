@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import router as api_router
+from starlette.responses import PlainTextResponse
+from app.api import lifespan, router as api_router
+from assistant import metrics
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 # CORS middleware setup. For more details refer to https://fastapi.tiangolo.com/tutorial/cors/
 app.add_middleware(
     CORSMiddleware,
@@ -13,6 +15,11 @@ app.add_middleware(
 )
 app.include_router(api_router)
 
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,45 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from assistant import metrics
+
+
+class AnalysisCache:
+    """Runs story analyses in worker threads and remembers the results of the
+    ``max_entries`` most recent ones, by analysis, story hash and arguments.
+
+    Submitting an analysis that is already running or done returns its
+    future, so Streamlit reruns neither wait for nor pay for it again; one
+    that failed or was cancelled is run again.
+    """
+
+    def __init__(self, max_entries, workers):
+        self.max_entries = max_entries
+        self.futures = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="story-analysis")
+
+    def submit(self, name, function, story, *args):
+        """The future of ``function(story, *args)``, started if needed."""
+        # Stories may hold lone surrogates, which pacing.measure accepts.
+        digest = hashlib.sha256(story.encode("utf-8", "surrogatepass")).hexdigest()
+        key = (name, digest, args)
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None and not future.cancelled() and not (future.done() and future.exception()):
+                self.futures.move_to_end(key)
+                result = "hit"
+            else:
+                future = self.executor.submit(function, story, *args)
+                self.futures[key] = future
+                while len(self.futures) > self.max_entries:
+                    self.futures.popitem(last=False)
+                result = "miss"
+        metrics.cache_requests.inc(name, result)
+        return future
+
+
+analyses = AnalysisCache(config.STORY_ANALYSIS_CACHE_ENTRIES, config.STORY_ANALYSIS_WORKERS)
@@ -4,15 +4,22 @@ import pandas as pd
 import numpy as np
 import logging
 import cv2
+import time
 
-from story_generator import generate_story, log_story, analyze_pacing, get_logged_stories, postscriptum_generator
-from ui_elements import display_ui, display_story_segments, display_analysis_options
+from story_generator import generate_story, log_story, analyze_pacing, plot_pacing, postscriptum_generator
+from story_analysis import analyses
+from ui_elements import display_ui, display_story_picker, display_story_segments, display_analysis_options
 import streamlit.components.v1 as components
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+
+API_URL = "http://api:8000"
+JOB_POLL_INTERVAL = 1
+ANALYSIS_POLL_INTERVAL = 1
+
 # Set the page configuration
 st.set_page_config(
     page_title="Creative Writer", page_icon="👩‍🎨", initial_sidebar_state="auto", menu_items={}
@@ -52,34 +59,50 @@ if prompt := st.chat_input("Write your answer here..."):
     with st.chat_message("user"):
         st.markdown(prompt, unsafe_allow_html=True)
 
-    # Perform API call
-    assistant_response = None    
-    try:        
-        # assistant_response = requests.get(        
-        #     "http://api:8000/api/query/",        
-        #     params={"text_query": prompt},        
-        #     timeout=config.ASSISTANT_TIMEOUT,        
-        # )        
-        assistant_response = requests.post("http://api:8000/stream/", json={"instruction": prompt, "details": "test", "personas": personas}, timeout=1800,)        
-        assistant_response.raise_for_status()  
-        # Raises a HTTPError for bad responses   
-    except requests.exceptions.HTTPError as e:        
-        st.error(f"Server returned an error: {e.response.status_code}, {e.response.text}")    
-    except requests.exceptions.ConnectionError:        
-        st.error("Failed to connect to the server. Please check your connection.")    
-    except requests.exceptions.Timeout:        
-        st.error("Server took too long to respond. Please try again later.")    
-    except requests.exceptions.RequestException as e:        
-        st.error(f"An error occurred: {e}")
-
-    # Display assistant response in chat message container    
-    with st.chat_message("assistant"):        
-        message_placeholder = st.empty()        
-        if assistant_response.status_code == 200:            
-            message_placeholder.markdown(assistant_response.json()["content"], unsafe_allow_html=True)            
-            st.session_state.messages.append({"role": "assistant", "content": assistant_response.json()["content"]})        
-        else:            
-            message_placeholder.error(f"Failed to get a response from the server: {assistant_response.status_code}") 
+    # Perform API call and render the chapter while it is being written
+    with st.chat_message("assistant"):
+        status_placeholder = st.empty()
+        message_placeholder = st.empty()
+        content = ""
+        try:
+            if "session_id" in st.session_state:
+                # Continue the story this browser session has been writing
+                request = dict(url=f"{API_URL}/jobs/update/", params={"action_type": "continue", "instructions": prompt, "session_id": st.session_state.session_id})
+            else:
+                request = dict(url=f"{API_URL}/jobs/stream/", json={"instruction": prompt, "details": "test", "personas": personas})
+            job = requests.post(**request, timeout=30)
+            job.raise_for_status()
+            # Raises a HTTPError for bad responses
+            job = job.json()
+            session_id = job["session_id"]
+            while job["status"] in ("queued", "running"):
+                time.sleep(JOB_POLL_INTERVAL)
+                job = requests.get(f"{API_URL}/jobs/{job['job_id']}", timeout=30)
+                job.raise_for_status()
+                job = job.json()
+                if job["progress"]:
+                    status_placeholder.caption(f"{job['progress']['node']}: {job['progress']['status']}")
+                if job["content"]:
+                    message_placeholder.markdown(job["content"] + "▌", unsafe_allow_html=True)
+            if job["status"] == "succeeded":
+                content = job["content"]
+                # Only a session with a chapter can be continued.
+                st.session_state.session_id = session_id
+            else:
+                st.error(f"Story generation {job['status']}: {job['error']}")
+        except requests.exceptions.HTTPError as e:
+            st.error(f"Server returned an error: {e.response.status_code}, {e.response.text}")
+        except requests.exceptions.ConnectionError:
+            st.error("Failed to connect to the server. Please check your connection.")
+        except requests.exceptions.Timeout:
+            st.error("Server took too long to respond. Please try again later.")
+        except requests.exceptions.RequestException as e:
+            st.error(f"An error occurred: {e}")
+
+        status_placeholder.empty()
+        if content:
+            message_placeholder.markdown(content, unsafe_allow_html=True)
+            st.session_state.messages.append({"role": "assistant", "content": content})
 
 with st.sidebar:
     tab1, tab2, tab3 = st.tabs(["Customization", "Agent Configuration", "Worldbuilding"])
@@ -98,16 +121,7 @@ with st.sidebar:
         num_characters = st.slider("Number of Characters", 1, 20, 1)
         story_title = st.text_input("Enter a title for your story")
 
-        logged_stories = get_logged_stories()
-        story_options = [f"{i+1}: {entry.get('title', 'Untitled')} ({entry['timestamp']})" for i, entry in enumerate(logged_stories)]
-        selected_story = st.selectbox("Select a previously generated story to continue developing", ["None"] + story_options)
-
-        if selected_story != "None":
-            selected_story_index = story_options.index(selected_story) - 1
-            selected_story_entry = logged_stories[selected_story_index]
-            st.write("Selected Story Title:", selected_story_entry.get('title', 'Untitled'))
-            st.write("Selected Story Prompt:", selected_story_entry['prompt'])
-            st.write("Selected Story:", selected_story_entry['story'])
+        display_story_picker()
 
     with tab2:
         st.write("Agent Configuration")
@@ -136,12 +150,50 @@ with st.sidebar:
             personas["outline"] = outline_input
             personas["chapter"] = chapter_input
 
+def show_analysis(name, future):
+    if future.exception():
+        logging.error("The %s analysis failed", name, exc_info=future.exception())
+        st.error(f"The {name} analysis failed: {future.exception()}")
+    elif name == "pacing":
+        pacing_scores = future.result()
+        st.write("Pacing scores per paragraph:", pacing_scores)
+        img = plot_pacing(pacing_scores)
+        components.html(f'<img src="data:image/svg+xml;base64,{img}" alt="Pacing Analysis">')
+    else:
+        st.write(future.result())
+
+@st.fragment(run_every=ANALYSIS_POLL_INTERVAL)
+def await_analysis(future):
+    # Only this fragment reruns while the analysis runs; once it is done the
+    # page reruns and shows it.
+    if future.done():
+        st.rerun()
+    st.caption("Analyzing...")
+
+def display_analysis(name, future):
+    if future.done():
+        show_analysis(name, future)
+    else:
+        await_analysis(future)
+
 # Main section for story generation and modification
 if st.button("Generate Story"):
     if not story_title:
         story_title = "Untitled Story"
-        
-    story = generate_story(model, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters, story_title)
+    parameters = (length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters)
+    story = generate_story(model, *parameters, story_title)
+    # Kept for the reruns triggered by the widgets below.
+    st.session_state.generated_story = {"story": story, "title": story_title, "parameters": parameters}
+
+if "generated_story" in st.session_state:
+    generated = st.session_state.generated_story
+    story, story_title = generated["story"], generated["title"]
+    # Analyses start as soon as the story exists and run concurrently, without
+    # holding up the page; each is shown once it is done.
+    postscriptum = analyses.submit(
+        "postscriptum_generator", postscriptum_generator, story, story_title, *generated["parameters"]
+    )
+
     st.write(story)
     
     modified_story = display_story_segments(story)
@@ -153,17 +205,12 @@ if st.button("Generate Story"):
     pacing_analysis = display_analysis_options()
 
     if pacing_analysis:
-        pacing_scores = analyze_pacing(modified_story)
         st.subheader("Pacing Analysis")
-        st.write("Pacing scores per paragraph:", pacing_scores)
-        img = plot_pacing(pacing_scores)
-        components.html(f'<img src="data:image/png;base64,{img}" alt="Pacing Analysis">')
+        display_analysis("pacing", analyses.submit("analyze_pacing", analyze_pacing, modified_story))
 
     with st.sidebar:
         with tab3:
             st.write("### Book Cover")
 
-            postscriptum = postscriptum_generator(story, story_title, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters)
-
             st.write("### Analysis")
-            st.write(postscriptum)
\ No newline at end of file
+            display_analysis("postscriptum", postscriptum)
@@ -1,37 +1,77 @@
 import openai
+import re
+import config
 from config import OPENAI_API_KEY
-import json
-import os
+from assistant import http_pool, metrics
+from assistant.llm_scheduler import estimate_tokens, scheduler
+import pacing
+import story_log
+from story_pool import VariantPool
+import time
 from datetime import datetime
 
-import io
-import base64
 
-
-LOG_FILE = "story_log.json"
-
-def log_story(prompt, story, story_title):
+# 429s are retried by the shared scheduler, not by the client, which uses the
+# connection pool of the story graph's OpenAI models.
+openai.max_retries = 0
+openai.http_client = http_pool.sync_client("openai")
+
+# Recent stories per parameter combination and model, see VariantPool.
+variant_pool = VariantPool(
+    "generate_story",
+    size=config.STORY_POOL_SIZE,
+    max_keys=config.STORY_POOL_MAX_KEYS,
+    selection=config.STORY_POOL_SELECTION,
+    workers=config.STORY_POOL_REFILL_WORKERS,
+) if config.STORY_POOL_ENABLED else None
+
+
+def chat_completion(stage, model, messages, max_tokens):
+    """Create an OpenAI chat completion once the shared scheduler admits it,
+    recording its time and tokens under ``stage``."""
+    prompt = "\n".join(message["content"] for message in messages)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = scheduler.run_sync(
+            "openai",
+            estimate_tokens(prompt, max_tokens),
+            lambda: openai.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens),
+            lambda response: response.usage.total_tokens if response.usage else None,
+        )
+        status = "ok"
+    finally:
+        metrics.stage_seconds.observe("story_generator", stage, value=time.perf_counter() - start)
+        metrics.stage_runs.inc("story_generator", stage, status)
+    if response.usage:
+        metrics.record_tokens(stage, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response
+
+def log_story(prompt, story, story_title, parameters=None):
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "title": story_title if story_title else "Untitled",
         "prompt": prompt if prompt else "N/A",
         "story": story
     }
-    
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'w') as file:
-            json.dump([log_entry], file, indent=4)
-    else:
-        with open(LOG_FILE, 'r+') as file:
-            data = json.load(file)
-            data.append(log_entry)
-            file.seek(0)
-            json.dump(data, file, indent=4)
+    if parameters:
+        # The story parameters it was generated with, for the search facets.
+        log_entry["parameters"] = parameters
+    story_log.append(log_entry)
+    # Imported here, story_search reads the prompt sentences of this module.
+    import story_search
+    story_search.update()
+
+def analyze_pacing(story, mode=None):
+    """A pace score per paragraph of ``story``. The "local" mode computes it
+    from the text, see pacing.py; the "llm" mode asks gpt-3.5-turbo."""
+    if (mode or config.PACING_MODE) == "local":
+        return pacing.analyze_corpus([story])[0]
 
-def analyze_pacing(story):
     openai.api_key = OPENAI_API_KEY
 
-    response = openai.ChatCompletion.create(
+    response = chat_completion(
+        "analyze_pacing",
         model="gpt-3.5-turbo",
         messages=[
             {"role": "system", "content": "You are a story pacing analyzer."},
@@ -40,52 +80,57 @@ def analyze_pacing(story):
         max_tokens=500
     )
 
-    pacing_scores = response['choices'][0]['message']['content'].strip().split('\n')
-    pacing_scores = [float(score.split(': ')[-1]) for score in pacing_scores if ':' in score]
+    # Lines like "Paragraph 1: 7.5"; any other line is skipped.
+    pacing_scores = response.choices[0].message.content.strip().split('\n')
+    pacing_scores = [re.search(r":\s*(-?\d+(?:\.\d+)?)", score) for score in pacing_scores]
+    pacing_scores = [float(score[1]) for score in pacing_scores if score]
 
     return pacing_scores
 
+def plot_pacing(pacing_scores):
+    """A bar chart of the pace scores, as a base64-encoded SVG image."""
+    return pacing.plot(pacing_scores)
 
 
-def map_user_inputs(length, fiction_level, reality_level, informativeness, ip_avoidance):
-    length_map = {
+
+# The prompt sentence of every choice of the story parameters.
+PARAMETER_PROMPTS = {
+    "length": {
         'Short': "Length: Up to 500 words.\n",
         'Medium-form': "Length: 500-2000 words.\n",
         'Long-form': "Length: 2000+ words.\n"
-    }
-
-    fiction_level_map = {
+    },
+    "fiction_level": {
         'Complete fiction': "This is a completely fictional story.\n",
         'Based on true story': "This story is based on a true story.\n",
         'Non-fiction': "This is a non-fiction story.\n"
-    }
-
-    reality_level_map = {
+    },
+    "reality_level": {
         'Completely fantastical': "The story is completely fantastical.\n",
         'Semi-realistic': "The story is semi-realistic.\n",
         'Realistic': "The story is realistic.\n"
-    }
-
-    informativeness_map = {
+    },
+    "informativeness": {
         'Information': "The story provides accurate information.\n",
         'Misinformation': "The story provides misinformation.\n"
-    }
-
-    ip_avoidance_map = {
+    },
+    "ip_avoidance": {
         'Completely original': "The story must be completely original.\n",
         'Inspired by genre': "The story is inspired by a specific genre.\n",
         'Inspired by author': "The story is inspired by a specific author.\n",
         'Inspired by particular work': "The story is inspired by a particular work.\n",
         'Derivative (i.e., fan fiction)': "The story is a fan fiction.\n",
         'Plagiarism': "The story is a plagiarism.\n"
-    }
+    },
+}
 
+def map_user_inputs(length, fiction_level, reality_level, informativeness, ip_avoidance):
     prompt_parts = [
-        length_map.get(length, ""),
-        fiction_level_map.get(fiction_level, ""),
-        reality_level_map.get(reality_level, ""),
-        informativeness_map.get(informativeness, ""),
-        ip_avoidance_map.get(ip_avoidance, "")
+        PARAMETER_PROMPTS["length"].get(length, ""),
+        PARAMETER_PROMPTS["fiction_level"].get(fiction_level, ""),
+        PARAMETER_PROMPTS["reality_level"].get(reality_level, ""),
+        PARAMETER_PROMPTS["informativeness"].get(informativeness, ""),
+        PARAMETER_PROMPTS["ip_avoidance"].get(ip_avoidance, "")
     ]
     
     return prompt_parts
@@ -101,12 +146,11 @@ def construct_prompt(length, fiction_level, reality_level, informativeness, mora
     
     return prompt
 
-def generate_story(model, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters, story_title):
-    prompt = construct_prompt(length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters)
-    
+def complete_story(model, prompt):
     openai.api_key = OPENAI_API_KEY
 
-    response = openai.chat.completions.create(
+    return chat_completion(
+        "generate_story",
         model=model,
         messages=[
             {"role": "system", "content": "You are a creative story writer."},
@@ -114,19 +158,34 @@ def generate_story(model, length, fiction_level, reality_level, informativeness,
         ],
         max_tokens=2000
     )
-    
-    story = response.choices[0].message.content.strip()
 
-    log_story(prompt, story, story_title)
+def write_story(model, prompt):
+    return complete_story(model, prompt).choices[0].message.content.strip()
+
+def generate_story(model, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters, story_title):
+    prompt = construct_prompt(length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters)
+    
+    if variant_pool:
+        key = (model, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters)
+        story = variant_pool.get(key, lambda: write_story(model, prompt))
+    else:
+        story = write_story(model, prompt)
+
+    parameters = {
+        "length": length,
+        "fiction_level": fiction_level,
+        "reality_level": reality_level,
+        "informativeness": informativeness,
+        "moral_theme": moral_theme,
+        "ip_avoidance": ip_avoidance,
+        "num_characters": num_characters,
+    }
+    log_story(prompt, story, story_title, parameters)
     
     return story
 
 def get_logged_stories():
-    if not os.path.exists(LOG_FILE):
-        return []
-
-    with open(LOG_FILE, 'r') as file:
-        return json.load(file)
+    return story_log.read()
 
 def split_story_into_segments(story):
     segments = story.split('. ')
@@ -137,7 +196,8 @@ def left(s, amount):
 
 def postscriptum_generator(story, story_title, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters):
         ps_prompt = f"Provide an analysis of the story in tabular format with columns 'parameter' and 'description', describing how each parameter is addressed in the story titled '{story_title}' with the following parameters: length = {length}, fiction level = {fiction_level}, reality level = {reality_level}, informativeness = {informativeness}, moral theme = {moral_theme}, IP avoidance = {ip_avoidance}, and number of characters = {num_characters}. Here is the story: {story}"
-        ps_response = openai.chat.completions.create(
+        ps_response = chat_completion(
+            "postscriptum_generator",
             model="gpt-4o-2024-05-13",
             messages=[
                 {"role": "system", "content": "You are a story analyzer assistant."},
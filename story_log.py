@@ -0,0 +1,226 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import config
+
+
+# The story log holds one JSON object per line and is only ever appended to,
+# so a crash can at most leave a partial last line, which readers skip. The
+# sidecar index <log>.idx holds one line per log line with its byte offset and
+# length and the story's title, timestamp and prompt hash, so pickers need not
+# parse story bodies. The index is derived: it is brought up to date with the
+# log on every append and read, and rebuilt when missing.
+
+
+@contextmanager
+def locked(path):
+    """Hold the inter-process lock of the log at ``path``."""
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def encode(entry):
+    return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def sync(file):
+    file.flush()
+    if config.STORY_LOG_FSYNC:
+        os.fsync(file.fileno())
+
+
+def legacy_path_of(path):
+    """The legacy log of the log at ``path``: STORY_LOG_LEGACY_PATH for the
+    configured log, the same name with a .json extension for any other."""
+    if path == config.STORY_LOG_PATH:
+        return config.STORY_LOG_LEGACY_PATH
+    return os.path.splitext(path)[0] + ".json"
+
+
+def migrate(path=None, legacy_path=None):
+    """Convert the legacy log, a single JSON array, to the line log once; the
+    legacy file is kept as ``<legacy_path>.migrated``."""
+    path = path or config.STORY_LOG_PATH
+    legacy_path = legacy_path or legacy_path_of(path)
+    if legacy_path == path or os.path.exists(path) or not os.path.exists(legacy_path):
+        return
+    with locked(path):
+        if os.path.exists(path):
+            return
+        with open(legacy_path, encoding="utf-8") as file:
+            entries = json.load(file)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.writelines(encode(entry) for entry in entries)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+    logging.info("Migrated %d stories from %s to %s", len(entries), legacy_path, path)
+
+
+def append(entry, path=None):
+    """Append ``entry`` to the log and its index."""
+    path = path or config.STORY_LOG_PATH
+    migrate(path)
+    record = encode(entry)
+    with locked(path):
+        with open(path, "a+b") as file:
+            # End a line cut short by a crash, so the entry starts on its own.
+            if file.seek(0, os.SEEK_END):
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    record = b"\n" + record
+            file.write(record)
+            sync(file)
+        index_of(path).catch_up()
+
+
+def size(path=None):
+    """The log's size in bytes, which grows with every append."""
+    path = path or config.STORY_LOG_PATH
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def summary(entry, offset, length):
+    prompt = entry.get("prompt") or ""
+    return {
+        "offset": offset,
+        "length": length,
+        "title": entry.get("title", "Untitled"),
+        "timestamp": entry.get("timestamp", ""),
+        "prompt_hash": hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16],
+    }
+
+
+class StoryIndex:
+    """The index of the log at ``path``, read incrementally: a refresh only
+    parses the index lines added since the last one."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.lock = threading.RLock()
+        self.records = []
+        # Bytes of the index read so far, and of the log it covers.
+        self.position = 0
+        self.covered = 0
+
+    def reset(self):
+        self.records = []
+        self.position = 0
+        self.covered = 0
+
+    def refresh(self):
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) < self.position:
+            self.reset()
+            if not os.path.exists(self.index_path):
+                return
+        with open(self.index_path, "rb") as file:
+            file.seek(self.position)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                record = json.loads(line)
+                self.position += len(line)
+                self.covered = record["offset"] + record["length"]
+                if not record.get("corrupt"):
+                    self.records.append(record)
+
+    def catch_up(self):
+        """Index the log lines past the index; call with the log locked."""
+        with self.lock:
+            self._catch_up()
+
+    def _catch_up(self):
+        self.refresh()
+        log_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if self.covered > log_size:
+            # The log was replaced; index it afresh.
+            self.reset()
+        if self.covered == log_size:
+            return
+        added = []
+        with open(self.path, "rb") as file:
+            file.seek(self.covered)
+            offset = self.covered
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    added.append(summary(json.loads(line), offset, len(line)))
+                except ValueError:
+                    added.append({"offset": offset, "length": len(line), "corrupt": True})
+                offset += len(line)
+        with open(self.index_path, "ab") as file:
+            # Drop a partial last line left by a crash.
+            file.truncate(self.position)
+            file.writelines(encode(record) for record in added)
+        self.refresh()
+
+    def entries(self):
+        """The summaries of all complete entries, oldest first."""
+        with self.lock:
+            self.refresh()
+            log_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if self.covered == log_size:
+                return list(self.records)
+        # The log lock is always taken before self.lock, as append() does;
+        # the other order deadlocks against it.
+        with locked(self.path):
+            self.catch_up()
+        with self.lock:
+            return list(self.records)
+
+
+indexes = {}
+
+
+def index_of(path):
+    if path not in indexes:
+        indexes.setdefault(path, StoryIndex(path))
+    return indexes[path]
+
+
+def index(path=None):
+    """The summaries (title, timestamp, prompt_hash, offset, length) of all
+    entries of the log, oldest first, without reading the story bodies."""
+    path = path or config.STORY_LOG_PATH
+    migrate(path)
+    return index_of(path).entries()
+
+
+def load(record, path=None):
+    """The full entry of the index ``record``."""
+    path = path or config.STORY_LOG_PATH
+    with open(path, "rb") as file:
+        file.seek(record["offset"])
+        return json.loads(file.read(record["length"]))
+
+
+def read(path=None):
+    """All complete entries of the log, oldest first."""
+    path = path or config.STORY_LOG_PATH
+    migrate(path)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "rb") as file:
+        for number, line in enumerate(file, 1):
+            if not line.endswith(b"\n"):
+                # Still being written, or cut short by a crash.
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logging.warning("Skipping the corrupt line %d of %s", number, path)
+    return entries
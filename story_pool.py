@@ -0,0 +1,85 @@
+import logging
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from assistant import metrics
+from assistant.llm_scheduler import BATCH, priority
+
+
+class VariantPool:
+    """Up to ``size`` generated variants for each of the ``max_keys`` most
+    recently requested keys.
+
+    A request for a key with variants is answered from them at once, picked
+    round-robin or at random, and one new variant is generated in the
+    background to replace the one served; a key without variants is generated
+    while the caller waits and then filled up to ``size`` in the background.
+    Background generations run at batch priority, one per key at a time.
+    """
+
+    def __init__(self, stage, size, max_keys, selection="round_robin", workers=2):
+        self.stage = stage
+        self.size = size
+        self.max_keys = max_keys
+        self.selection = selection
+        self.variants = OrderedDict()
+        self.refilling = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{stage}-pool")
+
+    def pick(self, variants):
+        # The variant served goes last, where the next new one replaces it.
+        if self.selection == "random":
+            variant = random.choice(variants)
+            variants.remove(variant)
+            variants.append(variant)
+            return variant
+        variants.rotate(-1)
+        return variants[-1]
+
+    def get(self, key, generate):
+        """A variant for ``key``; ``generate()`` makes a new one."""
+        with self.lock:
+            variants = self.variants.get(key)
+            if variants:
+                self.variants.move_to_end(key)
+                variant = self.pick(variants)
+        if variants:
+            metrics.cache_requests.inc(self.stage, "hit")
+            self.refill(key, generate, 1)
+            return variant
+        metrics.cache_requests.inc(self.stage, "miss")
+        variant = generate()
+        self.add(key, variant)
+        self.refill(key, generate, self.size - 1)
+        return variant
+
+    def add(self, key, variant):
+        with self.lock:
+            variants = self.variants.setdefault(key, deque())
+            if len(variants) >= self.size:
+                variants.pop()
+            variants.append(variant)
+            self.variants.move_to_end(key)
+            while len(self.variants) > self.max_keys:
+                self.variants.popitem(last=False)
+
+    def refill(self, key, generate, count):
+        with self.lock:
+            if count < 1 or key in self.refilling:
+                return
+            self.refilling.add(key)
+        self.executor.submit(self._refill, key, generate, count)
+
+    def _refill(self, key, generate, count):
+        try:
+            with priority(BATCH):
+                for _ in range(count):
+                    self.add(key, generate())
+        except Exception:
+            logging.exception("Refilling the %s pool failed", self.stage)
+        finally:
+            with self.lock:
+                self.refilling.discard(key)
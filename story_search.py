@@ -0,0 +1,149 @@
+import re
+import sqlite3
+from contextlib import closing
+
+import config
+import story_log
+from story_generator import PARAMETER_PROMPTS
+
+
+# Full-text and faceted search over the story log, in a SQLite database kept
+# next to it. Stories are numbered by their position in the log, as in the
+# story pickers. The FTS5 table is contentless: it only maps words to story
+# numbers, the texts stay in the log. update() adds the stories logged since
+# the last update, so the index grows with the log.
+
+FACETS = ["length", "fiction_level", "reality_level", "informativeness", "moral_theme", "ip_avoidance", "num_characters"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS stories (
+    number INTEGER PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    {", ".join(f"facet_{facet} TEXT" for facet in FACETS)}
+);
+{"".join(f"CREATE INDEX IF NOT EXISTS stories_{facet} ON stories (facet_{facet});" for facet in FACETS)}
+CREATE VIRTUAL TABLE IF NOT EXISTS stories_text USING fts5(
+    title, prompt, story, content='', prefix='2 3', tokenize='porter unicode61'
+);
+"""
+
+# The parameter each prompt sentence stands for, for stories logged without
+# their parameters.
+SENTENCES = {
+    sentence.strip(): (facet, choice)
+    for facet, choices in PARAMETER_PROMPTS.items()
+    for choice, sentence in choices.items()
+}
+THEME = re.compile(r"The story should convey the theme of (.+)\.")
+CHARACTERS = re.compile(r"The story features (\d+) main characters\.")
+
+
+def connect(path=config.STORY_SEARCH_DB_PATH):
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def facets_of(entry):
+    """The story parameters of a log entry, read from its prompt if it was
+    logged without them."""
+    values = dict.fromkeys(FACETS)
+    for line in (entry.get("prompt") or "").splitlines():
+        line = line.strip()
+        if line in SENTENCES:
+            facet, choice = SENTENCES[line]
+            values[facet] = choice
+        elif match := THEME.fullmatch(line):
+            values["moral_theme"] = match[1]
+        elif match := CHARACTERS.fullmatch(line):
+            values["num_characters"] = match[1]
+    values.update((facet, entry["parameters"][facet]) for facet in FACETS if facet in entry.get("parameters", {}))
+    return {facet: None if value is None else str(value) for facet, value in values.items()}
+
+
+def update(log_path=config.STORY_LOG_PATH, db_path=config.STORY_SEARCH_DB_PATH):
+    """Index the stories logged since the last update; returns how many."""
+    records = story_log.index(log_path)
+    with closing(connect(db_path)) as connection, connection:
+        # Taken before reading the count, so concurrent updates add each story once.
+        connection.execute("BEGIN IMMEDIATE")
+        last = connection.execute("SELECT number, offset FROM stories ORDER BY number DESC LIMIT 1").fetchone()
+        if last and (last["number"] > len(records) or records[last["number"] - 1]["offset"] != last["offset"]):
+            # The log was replaced; index it afresh.
+            connection.execute("DELETE FROM stories")
+            connection.execute("INSERT INTO stories_text (stories_text) VALUES ('delete-all')")
+            last = None
+        start = last["number"] if last else 0
+        for number, record in enumerate(records[start:], start + 1):
+            entry = story_log.load(record, log_path)
+            facets = facets_of(entry)
+            connection.execute(
+                f"INSERT INTO stories (number, offset, length, title, timestamp, {', '.join('facet_' + facet for facet in FACETS)}) "
+                f"VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(FACETS))})",
+                (number, record["offset"], record["length"], record["title"], record["timestamp"], *facets.values()),
+            )
+            connection.execute(
+                "INSERT INTO stories_text (rowid, title, prompt, story) VALUES (?, ?, ?, ?)",
+                (number, entry.get("title", ""), entry.get("prompt", ""), entry.get("story", "")),
+            )
+    return len(records) - start
+
+
+def result(row):
+    story = {key: row[key] for key in ("number", "offset", "length", "title", "timestamp")}
+    story["facets"] = {facet: row[f"facet_{facet}"] for facet in FACETS}
+    return story
+
+
+def match_query(text):
+    """An FTS5 query matching stories with all words of ``text``, the last one
+    as a prefix, so results follow the user's typing."""
+    words = re.findall(r"\w+", text)
+    terms = [f'"{word}"' for word in words]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(text="", limit=50, offset=0, by_relevance=False, db_path=config.STORY_SEARCH_DB_PATH, **facets):
+    """Stories matching the keywords ``text`` in their title, prompt or body
+    and the given facet values (e.g. ``moral_theme="Honesty"``), newest first.
+    Ranking by relevance instead scores every match, which is slower for
+    common words. Each result has the number, title, timestamp and facets of
+    a story, and the offset and length story_log.load() reads its entry with."""
+    unknown = set(facets) - set(FACETS)
+    if unknown:
+        raise ValueError(f"Unknown story facets: {', '.join(sorted(unknown))}")
+    filters = "".join(f" AND stories.facet_{facet} = ?" for facet in facets)
+    parameters = [str(value) for value in facets.values()]
+    query = match_query(text)
+    if query:
+        order = "stories_text.rank" if by_relevance else "stories_text.rowid DESC"
+        sql = (
+            "SELECT stories.* FROM stories_text JOIN stories ON stories.number = stories_text.rowid "
+            f"WHERE stories_text MATCH ?{filters} ORDER BY {order} LIMIT ? OFFSET ?"
+        )
+        parameters.insert(0, query)
+    else:
+        sql = f"SELECT * FROM stories WHERE 1{filters} ORDER BY number DESC LIMIT ? OFFSET ?"
+    with closing(connect(db_path)) as connection:
+        return [result(row) for row in connection.execute(sql, [*parameters, limit, offset])]
+
+
+def facet_counts(db_path=config.STORY_SEARCH_DB_PATH):
+    """``{facet: {value: number of stories}}`` over all indexed stories."""
+    with closing(connect(db_path)) as connection:
+        return {
+            facet: {
+                row[0]: row[1]
+                for row in connection.execute(
+                    f"SELECT facet_{facet}, COUNT(*) FROM stories WHERE facet_{facet} IS NOT NULL "
+                    f"GROUP BY facet_{facet} ORDER BY facet_{facet}"
+                )
+            }
+            for facet in FACETS
+        }
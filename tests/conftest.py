@@ -0,0 +1,135 @@
+import asyncio
+import atexit
+import os
+import shutil
+import tempfile
+from collections import Counter
+from typing import Any
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Tests never reach a provider or share the LLM cache with the app.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+# Nor do they write checkpoints or spilled sessions into the working directory.
+STATE_DIR = tempfile.mkdtemp(prefix="story-tests-")
+atexit.register(shutil.rmtree, STATE_DIR, True)
+os.environ["CHECKPOINT_DB_PATH"] = os.path.join(STATE_DIR, "stories.sqlite")
+os.environ["SESSION_SPILL_DIR"] = os.path.join(STATE_DIR, "sessions")
+
+PERSONAS = {
+    "character": "a novelist",
+    "environment": "a set designer",
+    "brainstorm": "a plotter",
+    "outline": "an editor",
+    "chapter": "a writer",
+}
+
+
+class Gate:
+    """Holds the calls of ``roles`` until ``count`` of them are in flight."""
+
+    def __init__(self, roles, count):
+        self.roles = set(roles)
+        self.count = count
+        self.entered = 0
+        self.open = None
+
+    async def enter(self):
+        # Created here, on the loop of the calls.
+        if self.open is None:
+            self.open = asyncio.Event()
+        self.entered += 1
+        if self.entered >= self.count:
+            self.open.set()
+        await asyncio.wait_for(self.open.wait(), 10)
+
+
+class ModelCalls:
+    """The calls of the fake role models: how many each role got, how many of
+    them were in flight at once at most, and which roles were in flight
+    together."""
+
+    def __init__(self):
+        self.count = Counter()
+        self.in_flight = Counter()
+        self.peak = Counter()
+        self.overlapping = set()
+        self.gates = []
+
+    def gate(self, roles, count):
+        """Make the calls of ``roles`` wait until ``count`` of them are in
+        flight at once; they time out if that never happens."""
+        self.gates.append(Gate(roles, count))
+
+    async def answer(self, role):
+        self.count[role] += 1
+        text = f"{role} {self.count[role]}"
+        if role == "brainstormer":
+            text = "1. a storm\n2. a wedding\n3. a duel"
+        self.overlapping.update(frozenset((role, other)) for other, count in self.in_flight.items() if count and other != role)
+        self.in_flight[role] += 1
+        self.peak[role] = max(self.peak[role], self.in_flight[role])
+        try:
+            for gate in self.gates:
+                if role in gate.roles:
+                    await gate.enter()
+            await asyncio.sleep(0)
+        finally:
+            self.in_flight[role] -= 1
+        return text
+
+
+class FakeRoleModel(BaseChatModel):
+    role: str
+    calls: Any
+
+    @property
+    def _llm_type(self):
+        return "fake-role"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise AssertionError(f"{self.role} was called synchronously")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = await self.calls.answer(self.role)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = await self.calls.answer(self.role)
+        for word in text.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+@pytest.fixture
+def role_models(monkeypatch):
+    """Replace the models of every role with fakes answering "<role> <n>" for
+    their n-th call, without rate limits, and return their calls."""
+    import config
+    from assistant.llm_scheduler import TokenBucket, scheduler
+    from assistant.models import ROLE_MODELS, role_model
+
+    monkeypatch.setattr(config, "LLM_CACHE_ENABLED", False)
+    for limiter in scheduler.limiters.values():
+        monkeypatch.setattr(limiter, "requests", TokenBucket(0))
+        monkeypatch.setattr(limiter, "tokens", TokenBucket(0))
+    calls = ModelCalls()
+    for role in ROLE_MODELS:
+        model = role_model(role)
+        monkeypatch.setattr(model, "models", [FakeRoleModel(role=role, calls=calls)])
+        monkeypatch.setattr(model, "cache", False)
+    return calls
+
+
+@pytest.fixture
+def story_graph(role_models):
+    """The story graph on the fake role models, with in-memory checkpoints."""
+    from langgraph.checkpoint.memory import MemorySaver
+
+    from assistant.multi_agent_system_v2 import builder
+
+    return builder.compile(checkpointer=MemorySaver())
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import router as api_router, update_values
+from assistant.multi_agent_system_v2 import router
+from conftest import PERSONAS
+
+
+@pytest.mark.parametrize("actions", [
+    ["rewrite", "continue"],
+    ["continue", "rewrite", "continue", "rewrite"],
+    ["rewrite", "rewrite", "continue", "continue"],
+])
+def test_each_update_is_routed_to_its_action(actions):
+    # The state a session's thread accumulates over its updates.
+    state = {"chapter_graph": {"1": {}}}
+    for action in actions:
+        state.update(update_values(action, f"{action} the story", 1))
+        assert router(state) == action
+
+
+def test_a_session_is_started_continued_and_viewed(role_models):
+    app = FastAPI()
+    app.include_router(api_router)
+    client = TestClient(app)
+
+    request = {"instruction": "a story", "details": "about a lighthouse", "personas": PERSONAS}
+    first = client.post("/stream/", json=request).json()
+    session_id = first["session_id"]
+    update = {"action_type": "continue", "instructions": "go on", "session_id": session_id}
+    second = client.post("/update/", params=update).json()
+    viewed = client.post("/view/", params={"session_id": session_id, "chapter_id": first["chapter_id"]}).json()
+
+    assert second["parent"] == first["chapter_id"]
+    assert viewed["content"] == first["content"]
+    assert client.post("/view/", params={"session_id": session_id, "chapter_id": "99"}).status_code == 404
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+
+from scripts import main as cli
+
+
+def args(output, **options):
+    defaults = {name: default for name, (_, default) in cli.GRID.items()}
+    defaults.update(output=str(output), concurrency=2, repeats=1, log_stories=False)
+    return argparse.Namespace(**{**defaults, **options})
+
+
+def records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_grid_jobs_cover_every_combination_and_repeat(tmp_path):
+    jobs = list(cli.grid_jobs(args(tmp_path, num_characters=[1, 3], moral_theme=["Honesty", "Fairness"], repeats=2)))
+
+    assert len(jobs) == 8
+    assert len({job_id for job_id, _ in jobs}) == 8
+    assert {(job["num_characters"], job["moral_theme"]) for _, job in jobs} == {
+        (1, "Honesty"), (1, "Fairness"), (3, "Honesty"), (3, "Fairness"),
+    }
+
+
+def test_file_jobs_default_to_their_line_number(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text('{"id": "first"}\n\n{"instruction": "x"}\n')
+
+    assert [job_id for job_id, _ in cli.file_jobs(path)] == ["first", "3"]
+
+
+def test_usage_is_priced_per_model():
+    usage = cli.Usage()
+    usage.add("gpt-4o-mini", 1_000_000, 2_000_000)
+    usage.add("local", 10, 10)
+
+    cost, unpriced = usage.cost(cli.PRICES)
+    assert cost == 0.15 + 2 * 0.6
+    assert unpriced == {"local"}
+    assert usage.to_dict()["gpt-4o-mini"] == {"input": 1_000_000, "output": 2_000_000}
+
+
+def test_only_successful_complete_results_count_as_done(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "a", "status": "ok"}\n{"id": "b", "status": "error"}\n{"id": "c", "stat')
+
+    assert cli.completed(path) == {"a"}
+    with cli.open_output(path) as output:
+        output.write(json.dumps({"id": "c", "status": "ok"}) + "\n")
+    assert cli.completed(path) == {"a", "c"}
+
+
+def test_a_rerun_resumes_with_the_missing_and_failed_jobs(tmp_path):
+    output = tmp_path / "out.jsonl"
+    runs = []
+
+    async def run_job(job_id, job, options):
+        runs.append(job_id)
+        if job["fail"]:
+            raise RuntimeError("down")
+        usage = cli.Usage()
+        usage.add("gpt-4o-mini", 100, 1000)
+        return {"story": job_id}, usage
+
+    jobs = [("a", {"fail": False}), ("b", {"fail": True})]
+    asyncio.run(cli.run(args(output), jobs, run_job, cli.PRICES))
+    jobs = [("a", {"fail": False}), ("b", {"fail": False}), ("c", {"fail": False})]
+    asyncio.run(cli.run(args(output), jobs, run_job, cli.PRICES))
+
+    assert sorted(runs[:2]) == ["a", "b"]
+    assert sorted(runs[2:]) == ["b", "c"]
+    written = records(output)
+    assert sorted((record["id"], record["status"]) for record in written[2:]) == [("b", "ok"), ("c", "ok")]
+    assert next(record for record in written if record["status"] == "error")["error"] == "RuntimeError: down"
+    assert written[-1]["cost"] == round((100 * 0.15 + 1000 * 0.6) / 1_000_000, 6)
@@ -0,0 +1,54 @@
+from assistant.chapter_tree import ROOT, ChapterTree
+
+
+def story():
+    # 1 -> 2 (rewritten as 3), 2 -> 4 and 2 -> 5 (rewritten as 6)
+    tree = ChapterTree()
+    tree.add_continuation(ROOT)
+    tree.add_continuation(1)
+    tree.add_rewrite(2)
+    tree.add_continuation(2)
+    tree.add_continuation(2)
+    tree.add_rewrite(5)
+    return tree
+
+
+def relations(tree, chapter_id):
+    return tree.parent(chapter_id), tree.children(chapter_id), tree.siblings(chapter_id), tree.cousins(chapter_id)
+
+
+def test_relations():
+    tree = story()
+    assert relations(tree, 1) == (ROOT, [2], [], [])
+    assert relations(tree, 2) == (1, [4, 5], [3], [])
+    assert relations(tree, 3) == (1, [], [2], [])
+    assert relations(tree, 4) == (2, [], [], [5])
+    assert relations(tree, 6) == (2, [], [5], [4])
+    assert tree.path(6) == [1, 2, 6]
+
+
+def test_relations_are_the_same_whether_indexed_before_or_after_adding():
+    indexed = ChapterTree()
+    indexed.add_continuation(ROOT)
+    indexed.children(1)
+    for add, chapter_id in [("add_continuation", 1), ("add_rewrite", 2), ("add_continuation", 2),
+                            ("add_continuation", 2), ("add_rewrite", 5)]:
+        getattr(indexed, add)(chapter_id)
+    tree = story()
+    assert [relations(indexed, i) for i in range(1, 7)] == [relations(tree, i) for i in range(1, 7)]
+
+
+def test_round_trips():
+    tree = story()
+    copy = ChapterTree.from_dict(tree.to_dict())
+    assert [relations(copy, i) for i in range(1, 7)] == [relations(tree, i) for i in range(1, 7)]
+
+
+def test_rebuilt_from_per_chapter_relation_lists():
+    tree = story()
+    chapter_graph = {
+        str(i): {"parent": str(tree.parent(i)), "siblings": [str(s) for s in tree.siblings(i)]}
+        for i in range(1, 7)
+    }
+    rebuilt = ChapterTree.from_chapter_graph(chapter_graph)
+    assert rebuilt.to_dict() == tree.to_dict()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import TypedDict
+
+from langgraph.graph import END, StateGraph
+
+from assistant.checkpointer import SpillingMemorySaver, SqliteCheckpointSaver
+
+
+class State(TypedDict):
+    chapters: list
+
+
+def make_graph(saver):
+    async def write(state):
+        return {"chapters": state.get("chapters", []) + [len(state.get("chapters", []))]}
+
+    builder = StateGraph(State)
+    builder.add_node("write", write)
+    builder.set_entry_point("write")
+    builder.add_edge("write", END)
+    return builder.compile(checkpointer=saver)
+
+
+def thread(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+async def write_chapters(graph, thread_id, count):
+    for _ in range(count):
+        state = await graph.aget_state(thread(thread_id))
+        await graph.ainvoke({"chapters": state.values.get("chapters", [])}, thread(thread_id))
+
+
+def checkpoints(saver, thread_id):
+    return len(list(saver.list(thread(thread_id))))
+
+
+def test_sessions_survive_reopening_the_database(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    asyncio.run(write_chapters(make_graph(SqliteCheckpointSaver.from_path(path)), "story", 3))
+    graph = make_graph(SqliteCheckpointSaver.from_path(path))
+    assert asyncio.run(graph.aget_state(thread("story"))).values["chapters"] == [0, 1, 2]
+
+
+def test_compaction_keeps_the_latest_checkpoints_of_every_thread(tmp_path):
+    saver = SqliteCheckpointSaver.from_path(str(tmp_path / "checkpoints.sqlite"))
+    graph = make_graph(saver)
+    asyncio.run(write_chapters(graph, "a", 3))
+    asyncio.run(write_chapters(graph, "b", 1))
+    assert checkpoints(saver, "a") > 2
+    saver.compact(2)
+    assert checkpoints(saver, "a") == 2
+    assert checkpoints(saver, "b") == 2
+    assert asyncio.run(graph.aget_state(thread("a"))).values["chapters"] == [0, 1, 2]
+
+
+def test_threads_not_written_for_the_ttl_expire(tmp_path):
+    saver = SqliteCheckpointSaver.from_path(str(tmp_path / "checkpoints.sqlite"), ttl_seconds=60)
+    graph = make_graph(saver)
+    asyncio.run(write_chapters(graph, "old", 1))
+    asyncio.run(write_chapters(graph, "new", 1))
+    with saver.cursor() as cur:
+        cur.execute("UPDATE threads SET updated_at = ? WHERE thread_id = 'old'", (time.time() - 120,))
+    saver.maintain()
+    assert not saver.has_thread("old")
+    assert checkpoints(saver, "old") == 0
+    assert saver.has_thread("new")
+
+
+def test_spilled_threads_are_restored_intact(tmp_path):
+    saver = SpillingMemorySaver(tmp_path / "spill")
+    graph = make_graph(saver)
+    asyncio.run(write_chapters(graph, "story", 2))
+    size = saver.thread_size("story")
+    assert size > 0
+    saver.spill("story")
+    assert saver.thread_size("story") == 0
+    assert saver.has_thread("story")
+    saver.restore("story")
+    assert saver.thread_size("story") == size
+    assert asyncio.run(graph.aget_state(thread("story"))).values["chapters"] == [0, 1]
+    saver.delete_thread("story")
+    assert not saver.has_thread("story")
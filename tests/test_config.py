@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def load_config(**env):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run(
+        [sys.executable, "-c", "import config"], cwd=root, env={**os.environ, **env}, capture_output=True, text=True
+    )
+
+
+@pytest.mark.parametrize("name, value", [
+    ("SUMMARY_FANOUT", "1"),
+    ("MAX_BRANCHES", "0"),
+    ("BRANCH_CONCURRENCY", "0"),
+])
+def test_settings_that_would_stall_generations_are_rejected(name, value):
+    result = load_config(**{name: value})
+
+    assert result.returncode != 0
+    assert f"ValueError: {name} must be at least" in result.stderr
+
+
+def test_the_defaults_load():
+    assert load_config().returncode == 0
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+import httpx
+
+from assistant import http_pool
+from assistant.models import chat_model
+
+
+def mock_client(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_pool, "clients", {("test", "async"): client})
+    return client
+
+
+def test_models_of_a_provider_share_its_pool():
+    first, second = chat_model("openai", "gpt-4o-mini"), chat_model("openai", "gpt-3.5-turbo")
+    assert first.http_async_client is second.http_async_client is http_pool.async_client("openai")
+    assert first.http_client is http_pool.sync_client("openai")
+
+    claude = chat_model("anthropic", "claude-3-haiku-20240307")
+    assert claude._async_client._client is http_pool.async_client("anthropic")
+    assert claude._client._client is http_pool.sync_client("anthropic")
+
+
+def test_warming_opens_the_connections(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(404)
+
+    mock_client(monkeypatch, handler)
+    asyncio.run(http_pool.warm("test", "https://llm.test/v1", 3))
+
+    assert [request.method for request in requests] == ["HEAD"] * 3
+
+
+def test_warming_failures_are_only_logged(monkeypatch, caplog):
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    mock_client(monkeypatch, handler)
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(http_pool.warm("test", "https://llm.test/v1", 2))
+
+    assert "Pre-warming test connections" in caplog.text
+
+
+def test_closing_drops_the_clients(monkeypatch):
+    client = mock_client(monkeypatch, lambda request: httpx.Response(200))
+    asyncio.run(http_pool.close())
+
+    assert client.is_closed
+    assert http_pool.clients == {}
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from app.jobs import CANCELLED, FAILED, RUNNING, SUCCEEDED, JobManager, QueueFullError
+
+
+def run_with(manager_args, scenario):
+    async def main():
+        manager = JobManager(**manager_args)
+        await manager.start()
+        try:
+            return await scenario(manager)
+        finally:
+            await manager.stop()
+
+    return asyncio.run(main())
+
+
+async def until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("condition not reached")
+
+
+def manager_args(run, workers=1, queue_size=10, result_ttl=60, max_results=100):
+    return {"run": run, "workers": workers, "queue_size": queue_size, "result_ttl": result_ttl, "max_results": max_results}
+
+
+async def write(job):
+    job.record("node", {"node": "first", "status": "running"})
+    for token in ("Once ", "upon"):
+        job.record("token", {"token": token, "branch": 0})
+        job.record("token", {"token": "ignored", "branch": 1})
+    job.record("chapter", {"content": "Once upon a time", "chapter_id": "1"})
+
+
+def test_jobs_run_in_the_background_and_report_their_result():
+    async def scenario(manager):
+        job = manager.submit("session", {"instruction": "a story"})
+        await until(lambda: job.status == SUCCEEDED)
+        return job
+
+    job = run_with(manager_args(write), scenario)
+    assert job.result == {"content": "Once upon a time", "chapter_id": "1", "session_id": "session"}
+    assert job.content == "Once upon"
+    assert job.to_dict()["content"] == "Once upon a time"
+
+
+def test_failures_are_reported():
+    async def fail(job):
+        raise RuntimeError("provider down")
+
+    async def scenario(manager):
+        job = manager.submit("session", {})
+        await until(lambda: job.status == FAILED)
+        return job
+
+    assert run_with(manager_args(fail), scenario).error == "provider down"
+
+
+def test_queued_and_running_jobs_can_be_cancelled():
+    started = []
+
+    async def slow(job):
+        started.append(job.job_id)
+        await asyncio.sleep(10)
+
+    async def scenario(manager):
+        running = manager.submit("a", {})
+        queued = manager.submit("b", {})
+        await until(lambda: running.status == RUNNING)
+        manager.cancel(queued.job_id)
+        manager.cancel(running.job_id)
+        await until(lambda: running.status == CANCELLED)
+        await asyncio.sleep(0.02)
+        return running, queued
+
+    running, queued = run_with(manager_args(slow), scenario)
+    assert queued.status == CANCELLED
+    assert started == [running.job_id]
+
+
+def test_a_full_queue_rejects_jobs():
+    async def scenario(manager):
+        manager.submit("a", {})
+        with pytest.raises(QueueFullError):
+            manager.submit("b", {})
+
+    run_with(manager_args(write, workers=0, queue_size=1), scenario)
+
+
+def test_only_the_most_recent_finished_jobs_are_kept():
+    async def scenario(manager):
+        jobs = [manager.submit("session", {}) for _ in range(3)]
+        await until(lambda: all(job.status == SUCCEEDED for job in jobs))
+        return jobs, [manager.get(job.job_id) for job in jobs]
+
+    jobs, found = run_with(manager_args(write, max_results=2), scenario)
+    assert found == [None, jobs[1], jobs[2]]
+
+
+def test_finished_jobs_expire():
+    async def scenario(manager):
+        job = manager.submit("session", {})
+        await until(lambda: job.status == SUCCEEDED)
+        await asyncio.sleep(0.02)
+        return manager.get(job.job_id)
+
+    assert run_with(manager_args(write, result_ttl=0.01), scenario) is None
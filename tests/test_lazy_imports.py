@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+PROBE = """
+import json, sys
+import assistant.multi_agent_system_v2 as story_graph
+loaded = [name for name in ("langchain_openai", "langchain_anthropic", "assistant.llm_cache") if name in sys.modules]
+print(json.dumps(loaded))
+"""
+
+
+def test_the_graph_module_imports_without_keys_or_providers():
+    env = {name: value for name, value in os.environ.items() if not name.endswith("_API_KEY")}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=root, env=env, capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout) == []
+
+
+def test_the_api_imports_without_compiling_the_graph(tmp_path):
+    probe = "import app.api, assistant.multi_agent_system_v2 as g; print(g.get_graph.cache_info().currsize)"
+    env = {**os.environ, "CHECKPOINT_DB_PATH": str(tmp_path / "stories.sqlite")}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", probe], cwd=root, env=env, capture_output=True, text=True, check=True)
+
+    assert result.stdout.split() == ["0"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_models_and_chains_are_built_once_on_first_use(role_models):
+    import assistant.multi_agent_system_v2 as story_graph
+    from assistant.models import role_model
+
+    assert story_graph.chapter_writer is role_model("chapter_writer")
+    assert story_graph.chain("summarizer_chain") is story_graph.chain("summarizer_chain")
+    assert story_graph.summarizer_chain is story_graph.chain("summarizer_chain")
@@ -0,0 +1,64 @@
+import itertools
+import types
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from assistant import llm_cache
+from assistant.llm_cache import TieredLLMCache, bypass_cache
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Distinct access times, so least recently used is well defined.
+    ticks = itertools.count()
+    monkeypatch.setattr(llm_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def response(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+def text(value):
+    return value[0].message.content
+
+
+def test_memory_tier_evicts_the_least_recently_used(tmp_path):
+    cache = TieredLLMCache(tmp_path / "cache.sqlite", memory_entries=2, disk_bytes=10**9)
+    for prompt in "abc":
+        cache.update(prompt, "model", response(prompt))
+    assert list(cache.memory) == [llm_cache.cache_key(prompt, "model") for prompt in "bc"]
+    # Evicted from memory, still answered from disk and promoted.
+    assert text(cache.lookup("a", "model")) == "a"
+    assert cache.stats == {"memory_hits": 0, "disk_hits": 1, "misses": 0}
+    assert text(cache.lookup("a", "model")) == "a"
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_disk_tier_is_trimmed_least_recently_used_first(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = TieredLLMCache(path, memory_entries=0, disk_bytes=10**9)
+    cache.update("a", "model", response("a"))
+    entry = cache.disk_size
+    cache.disk_bytes = 2 * entry
+    cache.update("b", "model", response("b"))
+    cache.lookup("a", "model")
+    cache.update("c", "model", response("c"))
+    assert cache.disk_size <= cache.disk_bytes
+    assert cache.lookup("b", "model") is None
+    assert text(cache.lookup("a", "model")) == "a"
+    assert text(cache.lookup("c", "model")) == "c"
+    # The size is recomputed from the file on reopening.
+    assert TieredLLMCache(path, memory_entries=0, disk_bytes=10**9).disk_size == cache.disk_size
+
+
+def test_keys_depend_on_the_model_and_bypass_skips_the_cache(tmp_path):
+    cache = TieredLLMCache(tmp_path / "cache.sqlite", memory_entries=10, disk_bytes=10**9)
+    cache.update("prompt", "model-a", response("a"))
+    assert cache.lookup("prompt", "model-b") is None
+    with bypass_cache():
+        assert cache.lookup("prompt", "model-a") is None
+        cache.update("prompt", "model-c", response("c"))
+    assert cache.lookup("prompt", "model-c") is None
+    assert text(cache.lookup("prompt", "model-a")) == "a"
@@ -0,0 +1,120 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from assistant.llm_scheduler import BATCH, INTERACTIVE, LLMScheduler, ProviderLimiter, next_chunk, priority
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = types.SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+def make_scheduler(max_concurrent=4, max_retries=2):
+    return LLMScheduler({"test": ProviderLimiter("test", 0, 0, max_concurrent)}, max_retries)
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    async def call():
+        calls.append(time.monotonic())
+        if len(calls) <= errors:
+            raise RateLimitError(0.1)
+        return result
+
+    return call, calls
+
+
+def test_a_429_holds_back_the_provider_and_is_retried():
+    scheduler = make_scheduler()
+    call, calls = failing(1)
+    assert asyncio.run(scheduler.run("test", 10, call)) == "ok"
+    limiter = scheduler.limiters["test"]
+    assert len(calls) == 2
+    # The retry waited for the Retry-After of the 429.
+    assert calls[1] - calls[0] >= 0.1
+    assert limiter.stats["rate_limited"] == 1
+    assert limiter.in_flight == 0
+
+
+def test_rate_limits_are_raised_after_the_last_retry():
+    scheduler = make_scheduler(max_retries=1)
+    call, calls = failing(5)
+    with pytest.raises(RateLimitError):
+        asyncio.run(scheduler.run("test", 10, call))
+    assert len(calls) == 2
+    assert scheduler.limiters["test"].in_flight == 0
+
+
+def test_other_errors_are_not_retried():
+    scheduler = make_scheduler()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run("test", 10, call))
+    assert calls == [1]
+
+
+def test_waiting_calls_are_admitted_by_priority():
+    scheduler = make_scheduler(max_concurrent=1)
+    order = []
+
+    async def call(name, hold=0.0):
+        order.append(name)
+        await asyncio.sleep(hold)
+
+    async def at(level, name, hold=0.0):
+        with priority(level):
+            await scheduler.run("test", 1, lambda: call(name, hold))
+
+    async def scenario():
+        first = asyncio.create_task(at(BATCH, "running", 0.05))
+        await asyncio.sleep(0.01)
+        batch = asyncio.create_task(at(BATCH, "batch"))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(at(INTERACTIVE, "interactive"))
+        await asyncio.gather(first, batch, interactive)
+
+    asyncio.run(scenario())
+    assert order == ["running", "interactive", "batch"]
+
+
+def test_streams_retry_before_their_first_chunk_and_release_their_slot():
+    scheduler = make_scheduler()
+    opened = []
+
+    async def chunks():
+        opened.append(1)
+        if len(opened) == 1:
+            raise RateLimitError(0.01)
+        for chunk in ("a", "b"):
+            yield chunk
+
+    async def read():
+        stream = scheduler.stream("test", 1, chunks)
+        return [chunk async for chunk in stream]
+
+    assert asyncio.run(read()) == ["a", "b"]
+    assert len(opened) == 2
+    assert scheduler.limiters["test"].in_flight == 0
+
+
+def test_next_chunk_returns_none_at_the_end():
+    async def chunks():
+        yield "a"
+
+    async def read():
+        stream = chunks()
+        return [await next_chunk(stream), await next_chunk(stream)]
+
+    assert asyncio.run(read()) == ["a", None]
@@ -0,0 +1,65 @@
+import asyncio
+
+from assistant import metrics
+from conftest import PERSONAS
+
+
+def unregistered(metric):
+    metrics.registry.remove(metric)
+    return metric
+
+
+def test_counters_render_by_label():
+    counter = unregistered(metrics.Counter("test_total", "Things.", ("stage", "status")))
+    counter.inc("writer", "ok")
+    counter.inc("writer", "ok", amount=2)
+    counter.inc('say "hi"\n', "error")
+
+    assert list(counter.render()) == [
+        "# HELP test_total Things.",
+        "# TYPE test_total counter",
+        'test_total{stage="say \\"hi\\"\\n",status="error"} 1',
+        'test_total{stage="writer",status="ok"} 3',
+    ]
+
+
+def test_histograms_render_cumulative_buckets():
+    histogram = unregistered(metrics.Histogram("test_seconds", "Time.", ("stage",), buckets=(0.1, 1)))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe("writer", value=value)
+
+    assert list(histogram.render())[2:] == [
+        'test_seconds_bucket{stage="writer",le="0.1"} 2',
+        'test_seconds_bucket{stage="writer",le="1"} 3',
+        'test_seconds_bucket{stage="writer",le="+Inf"} 4',
+        'test_seconds_sum{stage="writer"} 3.65',
+        'test_seconds_count{stage="writer"} 4',
+    ]
+
+
+def test_queued_records_the_wait_for_the_lock():
+    async def main():
+        async with metrics.queued(asyncio.Lock(), "test", "interactive"):
+            pass
+
+    asyncio.run(main())
+
+    counts, _ = metrics.queue_seconds.values[("test", "interactive")]
+    assert sum(counts) >= 1
+
+
+def test_graph_runs_are_timed_by_node_chain_and_model(story_graph):
+    runs = dict(metrics.stage_runs.values)
+    misses = metrics.cache_requests.values.get(("chapter_writer", "miss"), 0)
+    values = {"instruction": "a story", "details": "about a lighthouse", "personas": PERSONAS}
+    asyncio.run(story_graph.ainvoke(values, {"configurable": {"thread_id": "story"}, "callbacks": [metrics.handler]}))
+
+    def finished(*labels):
+        return metrics.stage_runs.values.get(labels, 0) - runs.get(labels, 0)
+
+    assert finished("node", "first", "ok") == 1
+    assert finished("chain", "character_description_chain", "ok") == 1
+    assert finished("model", "chapter_writer", "ok") == 1
+    assert metrics.cache_requests.values[("chapter_writer", "miss")] == misses + 1
+    assert not metrics.handler.runs
+    assert "story_stage_seconds_bucket" in metrics.render()
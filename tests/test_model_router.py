@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from assistant import llm_scheduler
+from assistant.model_router import HedgedChatModel, histograms
+
+
+def fake(text):
+    return GenericFakeChatModel(messages=iter([AIMessage(content=text)] * 10))
+
+
+def hedged(*models, hedge=True):
+    return HedgedChatModel(role="test", models=list(models), hedge=hedge, min_samples=10**6, default_deadline=0.01)
+
+
+def test_results_arriving_with_the_winner_are_discarded():
+    model = hedged(fake("primary"), fake("alternate"))
+    primary, alternate = model.models
+    discarded = []
+
+    async def scenario():
+        answer = asyncio.Event()
+
+        async def call(chat):
+            # Both models answer at the same moment, after the hedge.
+            await answer.wait()
+            return chat
+
+        async def discard(result):
+            discarded.append(result)
+
+        asyncio.get_running_loop().call_later(0.05, answer.set)
+        return await model.race("generate", call, discard)
+
+    assert asyncio.run(scenario()) is primary
+    assert discarded == [alternate]
+
+
+def test_a_failing_model_falls_back_to_the_next():
+    model = hedged(fake("primary"), fake("alternate"), hedge=False)
+
+    async def call(chat):
+        if chat is model.models[0]:
+            raise RuntimeError("down")
+        return chat
+
+    assert asyncio.run(model.race("generate", call)) is model.models[1]
+
+
+def test_streams_come_from_the_model_that_answered_first():
+    model = hedged(fake("a b c"), fake("x y z"))
+
+    async def read():
+        return "".join([chunk.content async for chunk in model.astream("hello")])
+
+    assert asyncio.run(read()) == "a b c"
+    assert llm_scheduler.scheduler.limiters["openai"].in_flight == 0
+
+
+class SlowModel(BaseChatModel):
+    """Streams ``text`` word by word after ``delay`` seconds, and records
+    whether its stream was cancelled and closed."""
+
+    text: str
+    delay: float
+    events: list
+
+    @property
+    def _llm_type(self):
+        return "slow"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+            for word in self.text.split(" "):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        except asyncio.CancelledError:
+            self.events.append("cancelled")
+            raise
+        finally:
+            self.events.append("closed")
+
+
+def test_a_slow_primary_is_hedged_and_its_stream_closed():
+    role = "slow-primary"
+    # The primary's 95th percentile latency: about 50 ms.
+    for _ in range(20):
+        histograms[(role, "stream")].record(0.05)
+    model = HedgedChatModel(
+        role=role,
+        models=[SlowModel(text="primary", delay=10, events=[]), SlowModel(text="alternate answer", delay=0, events=[])],
+        hedge=True,
+        min_samples=20,
+        default_deadline=60,
+    )
+    primary, alternate = model.models
+
+    async def read():
+        return "".join([chunk.content async for chunk in model.astream("hello")])
+
+    start = time.monotonic()
+    assert asyncio.run(read()) == "alternate answer "
+    assert time.monotonic() - start < 5
+    assert primary.events == ["cancelled", "closed"]
+    assert alternate.events == ["closed"]
+
+
+def test_a_role_needs_a_model():
+    with pytest.raises(ValueError):
+        HedgedChatModel(role="nobody", models=[])
@@ -0,0 +1,51 @@
+import base64
+
+import pytest
+
+import pacing
+
+
+STORY = """The night was long and quiet, and the old keeper climbed the stairs of the lighthouse slowly, one step after another, thinking of the ships that had passed.
+
+"Run!" she shouted. "Now!" They ran. Rocks fell. Waves broke.
+
+The keeper waited."""
+
+
+def test_short_sentences_and_dialogue_read_faster():
+    slow, fast, _ = pacing.analyze(STORY)
+    assert fast["pace"] > slow["pace"]
+    assert slow["dialogue_ratio"] == 0
+    assert fast["dialogue_ratio"] > 0.1
+    assert fast["sentence_length"] < slow["sentence_length"]
+
+
+def test_features_are_counted_per_paragraph():
+    _, features = pacing.measure(["One two three. Four five!\n\nSix, seven; eight?"])
+    sentence_length, dialogue, punctuation, novelty = features.T
+    assert sentence_length.tolist() == [2.5, 3.0]
+    assert dialogue.tolist() == [0.0, 0.0]
+    # "!" and "?" end sentences and count as punctuation.
+    assert punctuation.tolist() == pytest.approx([1 / 5, 3 / 3])
+    assert novelty.tolist() == [1.0, 1.0]
+
+
+def test_words_are_only_new_on_their_first_use_in_a_story():
+    _, features = pacing.measure(["Red fish. Blue fish.\n\nRed fish.", "Red fish."])
+    assert features[:, 3].tolist() == [0.75, 0.0, 1.0]
+
+
+def test_a_corpus_is_scored_like_its_stories_one_by_one():
+    stories = [STORY, "", "Just one line without a break", "Apostrophes don't split words."]
+    assert pacing.analyze_corpus(stories) == [[entry["pace"] for entry in pacing.analyze(story)] for story in stories]
+
+
+@pytest.mark.parametrize("text", ["Before\0after.\n\nNext\0 one.", "\0", "Lone \ud800 surrogate."])
+def test_any_text_can_be_analyzed(text):
+    assert len(pacing.analyze(text)) == len(pacing.paragraphs(text.replace("\0", " ")))
+
+
+def test_plot_is_an_svg_bar_per_paragraph():
+    svg = base64.b64decode(pacing.plot([1.0, 5.5, 9.0])).decode()
+    assert svg.startswith("<svg")
+    assert svg.count("<rect") == 3
@@ -0,0 +1,105 @@
+import asyncio
+from typing import TypedDict
+
+import pytest
+from langgraph.graph import END, StateGraph
+
+from app.sessions import SessionStore, UnknownSessionError
+from assistant.checkpointer import SpillingMemorySaver
+
+
+class State(TypedDict):
+    chapters: list
+
+
+def make_graph(saver, delay=0.0):
+    async def write(state):
+        await asyncio.sleep(delay)
+        return {"chapters": state.get("chapters", []) + [len(state.get("chapters", []))]}
+
+    builder = StateGraph(State)
+    builder.add_node("write", write)
+    builder.set_entry_point("write")
+    builder.add_edge("write", END)
+    return builder.compile(checkpointer=saver)
+
+
+def make_store(tmp_path, **limits):
+    saver = SpillingMemorySaver(tmp_path / "spill")
+    limits = {"ttl_seconds": 3600, "max_sessions": 100, "max_bytes": 10**9, **limits}
+    return saver, SessionStore(saver, **limits)
+
+
+async def write(store, graph, session_id):
+    async with store.use(session_id) as thread:
+        state = await graph.aget_state(thread)
+        return await graph.ainvoke({"chapters": state.values.get("chapters", [])}, thread)
+
+
+def test_unknown_sessions_are_rejected(tmp_path):
+    _, store = make_store(tmp_path)
+
+    async def use(session_id):
+        async with store.use(session_id):
+            pass
+
+    with pytest.raises(UnknownSessionError):
+        asyncio.run(use("0" * 32))
+    assert not store.exists("../../etc/passwd")
+
+
+def test_sessions_over_budget_are_spilled_and_restored(tmp_path):
+    saver, store = make_store(tmp_path, max_sessions=1)
+    graph = make_graph(saver)
+
+    async def scenario():
+        first = store.create()
+        await write(store, graph, first)
+        second = store.create()
+        await write(store, graph, second)
+        assert list(store.resident) == [second]
+        assert not saver.storage.get(first)
+        assert store.exists(first)
+        # The evicted session continues where it stopped.
+        return await write(store, graph, first)
+
+    assert asyncio.run(scenario())["chapters"] == [0, 1]
+    assert len(store.resident) == 1
+
+
+def test_new_sessions_are_kept_within_bounds(tmp_path):
+    _, store = make_store(tmp_path, max_sessions=2)
+    session_ids = [store.create() for _ in range(5)]
+
+    assert list(store.resident) == session_ids[-2:]
+    assert not store.exists(session_ids[0])
+
+
+def test_idle_sessions_expire(tmp_path):
+    saver, store = make_store(tmp_path, ttl_seconds=0)
+    graph = make_graph(saver)
+
+    async def scenario():
+        session_id = store.create()
+        await write(store, graph, session_id)
+        return session_id
+
+    session_id = asyncio.run(scenario())
+    assert session_id not in store.resident
+    assert (tmp_path / "spill" / f"{session_id}.pkl").exists()
+
+
+def test_concurrent_generations_of_a_session_run_one_at_a_time(tmp_path):
+    saver, store = make_store(tmp_path, ttl_seconds=0)
+    graph = make_graph(saver, delay=0.05)
+
+    async def scenario():
+        session_id = store.create()
+        await asyncio.gather(*(write(store, graph, session_id) for _ in range(3)))
+        async with store.use(session_id) as thread:
+            return (await graph.aget_state(thread)).values["chapters"], session_id
+
+    chapters, session_id = asyncio.run(scenario())
+    # Each generation saw the chapters of the previous one instead of forking.
+    assert chapters == [0, 1, 2]
+    assert not store.active and not store.locks
@@ -0,0 +1,78 @@
+import threading
+
+from story_analysis import AnalysisCache
+
+
+def test_analyses_run_concurrently_and_once_per_story():
+    cache = AnalysisCache(max_entries=10, workers=4)
+    calls = []
+    # Each analysis waits for the other, so both must run at once.
+    both_running = threading.Barrier(2, timeout=10)
+    release = threading.Event()
+
+    def analyze(story, kind):
+        calls.append((story, kind))
+        both_running.wait()
+        release.wait(10)
+        return f"{kind} of {story}"
+
+    pacing = cache.submit("pacing", analyze, "a story", "pacing")
+    postscriptum = cache.submit("postscriptum", analyze, "a story", "postscriptum")
+    # A rerun asks again while they run.
+    assert cache.submit("pacing", analyze, "a story", "pacing") is pacing
+    release.set()
+    assert [pacing.result(), postscriptum.result()] == ["pacing of a story", "postscriptum of a story"]
+    assert cache.submit("pacing", analyze, "a story", "pacing") is pacing
+    assert len(calls) == 2
+
+
+def test_stories_with_lone_surrogates_are_analysed():
+    cache = AnalysisCache(max_entries=10, workers=1)
+    assert cache.submit("analysis", len, "a \ud800 story").result() == 9
+
+
+def test_cancelled_analyses_run_again():
+    cache = AnalysisCache(max_entries=10, workers=1)
+    release = threading.Event()
+    cache.submit("busy", lambda story: release.wait(10), "story")
+    queued = cache.submit("analysis", len, "story")
+    assert queued.cancel()
+
+    again = cache.submit("analysis", len, "story")
+    release.set()
+    assert again is not queued
+    assert again.result() == 5
+
+
+def test_results_are_kept_by_story_and_arguments():
+    cache = AnalysisCache(max_entries=10, workers=1)
+    first = cache.submit("analysis", len, "a story")
+    assert cache.submit("analysis", len, "another story") is not first
+    assert cache.submit("analysis", lambda story, extra: extra, "a story", 1) is not first
+
+
+def test_failed_analyses_run_again():
+    cache = AnalysisCache(max_entries=10, workers=1)
+    attempts = []
+
+    def flaky(story):
+        attempts.append(story)
+        if len(attempts) == 1:
+            raise RuntimeError("provider down")
+        return "ok"
+
+    assert isinstance(cache.submit("flaky", flaky, "story").exception(), RuntimeError)
+    assert cache.submit("flaky", flaky, "story").result() == "ok"
+    assert cache.submit("flaky", flaky, "story").result() == "ok"
+    assert len(attempts) == 2
+
+
+def test_the_least_recently_used_results_are_evicted():
+    cache = AnalysisCache(max_entries=2, workers=1)
+    first = cache.submit("analysis", len, "one")
+    second = cache.submit("analysis", len, "two")
+    cache.submit("analysis", len, "one")
+    cache.submit("analysis", len, "three")
+    assert len(cache.futures) == 2
+    assert cache.submit("analysis", len, "one") is first
+    assert cache.submit("analysis", len, "two") is not second
@@ -0,0 +1,71 @@
+import asyncio
+
+from conftest import PERSONAS
+
+START = {"instruction": "a story", "details": "about a lighthouse", "personas": PERSONAS}
+
+
+def thread(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def run(graph, *updates, thread_id="story"):
+    async def main():
+        state = None
+        for values in updates:
+            state = await graph.ainvoke(values, thread(thread_id))
+        return state
+
+    return asyncio.run(main())
+
+
+def test_stories_are_written_concurrently_without_blocking(story_graph, role_models):
+    # The fake models fail any synchronous call, and the chapter writers wait
+    # for each other.
+    role_models.gate(["chapter_writer"], 3)
+
+    async def main():
+        return await asyncio.gather(*(story_graph.ainvoke(START, thread(f"story-{i}")) for i in range(3)))
+
+    states = asyncio.run(main())
+
+    assert [state["chapter_id_viewing"] for state in states] == ["1", "1", "1"]
+    assert role_models.peak["chapter_writer"] == 3
+
+
+def test_characters_and_environment_are_written_at_the_same_time(story_graph, role_models):
+    role_models.gate(["character_description_writer", "environment_description_writer"], 2)
+    state = run(story_graph, START)
+
+    assert "character_description_writer 1" in state["context_request"]
+    assert "environment_description_writer 1" in state["context_request"]
+    assert frozenset(("character_description_writer", "environment_description_writer")) in role_models.overlapping
+
+
+def test_each_chapter_is_summarised_once(story_graph, role_models):
+    go_on = {"continue_instructions": "go on", "continue_branches": 1, "rewrite_instructions": ""}
+    state = run(story_graph, START, go_on, go_on, go_on)
+
+    chapters = state["chapter_graph"]
+    assert len(chapters) == 4
+    assert role_models.count["summarizer"] == 4
+    assert sorted(chapter["summary"] for chapter in chapters.values()) == [f"summarizer {n}" for n in range(1, 5)]
+
+
+def test_branches_are_written_from_the_brainstormed_ideas(story_graph, role_models, monkeypatch):
+    import config
+    from assistant.chapter_tree import ChapterTree
+
+    monkeypatch.setattr(config, "BRANCH_CONCURRENCY", 2)
+    run(story_graph, START)
+    role_models.gate(["chapter_writer"], 2)
+    # The fake brainstormer has three ideas, fewer than the branches asked for.
+    branch = {"continue_instructions": "go on", "continue_branches": 5, "rewrite_instructions": ""}
+    state = run(story_graph, branch)
+
+    tree = ChapterTree.from_dict(state["chapter_tree"])
+    assert tree.children(1) == [2, 3, 4]
+    assert state["chapter_id_viewing"] == "2"
+    assert role_models.count["brainstormer"] == 2
+    assert role_models.count["chapter_writer"] == 1 + 3
+    assert role_models.peak["chapter_writer"] == 2
@@ -0,0 +1,135 @@
+import json
+import threading
+
+import config
+import story_log
+
+
+def entry(number):
+    return {"title": f"Story {number}", "prompt": f"prompt {number}", "story": f"Once upon a time {number}"}
+
+
+def test_entries_are_read_back_in_order(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    for number in range(3):
+        story_log.append(entry(number), path)
+    assert story_log.read(path) == [entry(number) for number in range(3)]
+
+
+def test_a_torn_last_line_is_skipped_and_ended_by_the_next_append(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    story_log.append(entry(0), path)
+    with open(path, "ab") as file:
+        file.write(b'{"title": "cut sho')
+    assert story_log.read(path) == [entry(0)]
+    story_log.append(entry(1), path)
+    # The torn line now ends as a corrupt line of its own.
+    assert story_log.read(path) == [entry(0), entry(1)]
+
+
+def test_corrupt_lines_are_skipped(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    story_log.append(entry(0), path)
+    with open(path, "ab") as file:
+        file.write(b"not json\n")
+    story_log.append(entry(1), path)
+    assert story_log.read(path) == [entry(0), entry(1)]
+
+
+def test_the_legacy_json_log_is_migrated_once(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    legacy_path = tmp_path / "log.json"
+    legacy_path.write_text(json.dumps([entry(0), entry(1)]))
+    story_log.migrate(path, str(legacy_path))
+    assert story_log.read(path) == [entry(0), entry(1)]
+    assert not legacy_path.exists()
+    assert (tmp_path / "log.json.migrated").exists()
+
+
+def test_a_log_migrates_only_its_own_legacy_log(tmp_path, monkeypatch):
+    default_legacy_path = tmp_path / "story_log.json"
+    default_legacy_path.write_text(json.dumps([entry(0)]))
+    monkeypatch.setattr(config, "STORY_LOG_PATH", str(tmp_path / "story_log.jsonl"))
+    monkeypatch.setattr(config, "STORY_LOG_LEGACY_PATH", str(default_legacy_path))
+    (tmp_path / "other.json").write_text(json.dumps([entry(1)]))
+
+    story_log.append(entry(2), str(tmp_path / "other.jsonl"))
+    assert story_log.read(str(tmp_path / "other.jsonl")) == [entry(1), entry(2)]
+    assert default_legacy_path.exists()
+    assert story_log.read() == [entry(0)]
+    assert not default_legacy_path.exists()
+
+
+def test_concurrent_appends_keep_every_entry_whole(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+
+    def write(writer):
+        for number in range(25):
+            story_log.append(entry(f"{writer}-{number}"), path)
+
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    titles = sorted(entry["title"] for entry in story_log.read(path))
+    assert titles == sorted(f"Story {writer}-{number}" for writer in range(4) for number in range(25))
+
+
+def test_the_index_locates_every_entry(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    for number in range(3):
+        story_log.append(entry(number), path)
+    records = story_log.index(path)
+    assert [record["title"] for record in records] == ["Story 0", "Story 1", "Story 2"]
+    assert [story_log.load(record, path) for record in records] == [entry(number) for number in range(3)]
+
+
+def test_the_index_catches_up_with_lines_it_missed_and_skips_corrupt_ones(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    story_log.append(entry(0), path)
+    with open(path, "ab") as file:
+        file.write(b"not json\n")
+        file.write(story_log.encode(entry(1)))
+    assert [record["title"] for record in story_log.index(path)] == ["Story 0", "Story 1"]
+
+
+def test_the_index_is_rebuilt_when_missing_or_torn(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    for number in range(2):
+        story_log.append(entry(number), path)
+    index_path = tmp_path / "log.jsonl.idx"
+    # Cut the last index line short, as a crash would.
+    index_path.write_bytes(index_path.read_bytes()[:-5])
+    fresh = story_log.StoryIndex(path)
+    assert [record["title"] for record in fresh.entries()] == ["Story 0", "Story 1"]
+    index_path.unlink()
+    assert [record["title"] for record in story_log.StoryIndex(path).entries()] == ["Story 0", "Story 1"]
+
+
+def test_concurrent_appends_and_index_reads_do_not_deadlock(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    story_log.append(entry("first"), path)
+    done = threading.Event()
+    seen = []
+
+    def write(writer):
+        for number in range(50):
+            story_log.append(entry(f"{writer}-{number}"), path)
+
+    def read():
+        while not done.is_set():
+            seen.append(len(story_log.index(path)))
+
+    writers = [threading.Thread(target=write, args=(writer,), daemon=True) for writer in range(4)]
+    readers = [threading.Thread(target=read, daemon=True) for _ in range(2)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join(timeout=10)
+    done.set()
+    for thread in readers:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in writers + readers), "appends and index reads deadlocked"
+    assert len(story_log.index(path)) == 201
+    assert seen and max(seen) <= 201
@@ -0,0 +1,81 @@
+import itertools
+import time
+
+from story_pool import VariantPool
+
+
+def settle(pool):
+    """Wait for the background refills of ``pool``."""
+    deadline = time.monotonic() + 10
+    while pool.refilling:
+        assert time.monotonic() < deadline, "refill did not finish"
+        time.sleep(0.01)
+
+
+def generator():
+    numbers = itertools.count(1)
+    return lambda: f"story {next(numbers)}"
+
+
+def test_a_new_key_is_generated_then_filled_in_the_background():
+    pool = VariantPool("test", size=3, max_keys=10)
+    generate = generator()
+
+    assert pool.get("key", generate) == "story 1"
+    settle(pool)
+    assert list(pool.variants["key"]) == ["story 1", "story 2", "story 3"]
+
+
+def test_variants_are_served_round_robin_and_replaced():
+    pool = VariantPool("test", size=3, max_keys=10)
+    generate = generator()
+    pool.get("key", generate)
+    settle(pool)
+
+    assert pool.get("key", generate) == "story 1"
+    settle(pool)
+    # The variant served is replaced by a new one, the others wait their turn.
+    assert list(pool.variants["key"]) == ["story 2", "story 3", "story 4"]
+    assert [pool.get("key", generate) for _ in range(2)] == ["story 2", "story 3"]
+
+
+def test_variants_are_served_at_random():
+    pool = VariantPool("test", size=3, max_keys=10, selection="random")
+    generate = generator()
+    pool.get("key", generate)
+    settle(pool)
+
+    served = pool.get("key", generate)
+    settle(pool)
+    assert served in {"story 1", "story 2", "story 3"}
+    assert served not in pool.variants["key"]
+    assert len(pool.variants["key"]) == 3
+
+
+def test_only_the_most_recent_keys_are_kept():
+    pool = VariantPool("test", size=1, max_keys=2)
+    generate = generator()
+    for key in ("a", "b", "a", "c"):
+        pool.get(key, generate)
+        settle(pool)
+
+    assert list(pool.variants) == ["a", "c"]
+
+
+def test_failed_refills_are_retried_on_the_next_request():
+    pool = VariantPool("test", size=3, max_keys=10)
+    answers = iter(["story 1", RuntimeError("down"), "story 2", "story 3"])
+
+    def generate():
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    pool.get("key", generate)
+    settle(pool)
+    assert list(pool.variants["key"]) == ["story 1"]
+
+    assert pool.get("key", generate) == "story 1"
+    settle(pool)
+    assert list(pool.variants["key"]) == ["story 1", "story 2"]
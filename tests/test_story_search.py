@@ -0,0 +1,85 @@
+import pytest
+
+import story_log
+import story_search
+from story_generator import construct_prompt
+
+
+def log(tmp_path, stories):
+    path = str(tmp_path / "log.jsonl")
+    for title, story, moral_theme in stories:
+        parameters = {
+            "length": "Short", "fiction_level": "Complete fiction", "reality_level": "Realistic",
+            "informativeness": "Information", "moral_theme": moral_theme,
+            "ip_avoidance": "Completely original", "num_characters": 2,
+        }
+        prompt = construct_prompt(**parameters)
+        story_log.append({"title": title, "prompt": prompt, "story": story, "parameters": parameters}, path)
+    return path
+
+
+@pytest.fixture
+def paths(tmp_path):
+    path = log(tmp_path, [
+        ("The Lighthouse", "A keeper guards the lighthouse through the storm.", "Honesty"),
+        ("Market Day", "Two traders argue about fairness at the market.", "Fairness"),
+        ("Night Shift", "The keeper of the bakery works until dawn.", "Honesty"),
+    ])
+    db_path = str(tmp_path / "search.sqlite")
+    story_search.update(path, db_path)
+    return path, db_path
+
+
+def titles(results):
+    return [result["title"] for result in results]
+
+
+def test_keywords_match_newest_first_with_the_last_word_as_a_prefix(paths):
+    _, db_path = paths
+    assert titles(story_search.search("keeper", db_path=db_path)) == ["Night Shift", "The Lighthouse"]
+    assert titles(story_search.search("keeper light", db_path=db_path)) == ["The Lighthouse"]
+    assert titles(story_search.search("", db_path=db_path)) == ["Night Shift", "Market Day", "The Lighthouse"]
+
+
+def test_facets_filter_and_are_counted(paths):
+    _, db_path = paths
+    assert titles(story_search.search(db_path=db_path, moral_theme="Fairness")) == ["Market Day"]
+    assert titles(story_search.search("keeper", db_path=db_path, moral_theme="Fairness")) == []
+    counts = story_search.facet_counts(db_path)
+    assert counts["moral_theme"] == {"Fairness": 1, "Honesty": 2}
+    assert counts["num_characters"] == {"2": 3}
+    with pytest.raises(ValueError):
+        story_search.search(db_path=db_path, colour="red")
+
+
+def test_results_locate_their_log_entries(paths):
+    path, db_path = paths
+    [result] = story_search.search("fairness", db_path=db_path)
+    assert result["facets"]["moral_theme"] == "Fairness"
+    assert story_log.load(result, path)["title"] == "Market Day"
+
+
+def test_updates_index_only_new_stories_and_reindex_a_replaced_log(tmp_path, paths):
+    path, db_path = paths
+    assert story_search.update(path, db_path) == 0
+    story_log.append({"title": "Late", "prompt": "", "story": "A late story"}, path)
+    assert story_search.update(path, db_path) == 1
+    # Another log at the same path: everything is indexed again.
+    (tmp_path / "other").mkdir()
+    replaced = log(tmp_path / "other", [("Only", "Just one story.", "Honesty")])
+    story_log.indexes.pop(path, None)
+    (tmp_path / "log.jsonl.idx").unlink()
+    (tmp_path / "log.jsonl").write_bytes(open(replaced, "rb").read())
+    assert story_search.update(path, db_path) == 1
+    assert titles(story_search.search(db_path=db_path)) == ["Only"]
+
+
+def test_parameters_are_read_from_the_prompt_of_older_entries():
+    prompt = construct_prompt("Short", "Non-fiction", "Realistic", "Misinformation", "Perseverance", "Plagiarism", 4)
+    facets = story_search.facets_of({"prompt": prompt})
+    assert facets["fiction_level"] == "Non-fiction"
+    assert facets["informativeness"] == "Misinformation"
+    assert facets["moral_theme"] == "Perseverance"
+    assert facets["num_characters"] == "4"
+    # The length is not part of the prompt.
+    assert facets["length"] is None
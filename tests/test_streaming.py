@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from app.streaming import graph_events, sse_format, sse_stream
+from conftest import PERSONAS
+
+THREAD = {"configurable": {"thread_id": "story"}}
+START = {"instruction": "a story", "details": "about a lighthouse", "personas": PERSONAS}
+
+
+def collect(events):
+    async def read():
+        return [event async for event in events]
+
+    return asyncio.run(read())
+
+
+def parse(frame):
+    event, data = frame.strip().split("\n")
+    return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def test_events_report_nodes_and_tokens_then_end_with_the_chapter(story_graph):
+    events = collect(graph_events(story_graph, START, THREAD))
+
+    assert events[0] == ("node", {"node": "first", "status": "start"})
+    assert ("node", {"node": "first", "status": "end"}) in events
+    assert ("node", {"node": "chapter_writer", "status": "end"}) in events
+    kind, chapter = events[-1]
+    assert kind == "chapter"
+    assert chapter["chapter_id"] == "1"
+    assert chapter["parent"] == "-1"
+    tokens = [data for kind, data in events if kind == "token"]
+    assert len(tokens) > 1
+    assert {token["node"] for token in tokens} == {"chapter_writer"}
+    assert "".join(token["token"] for token in tokens) == chapter["content"]
+
+
+def test_branch_tokens_are_told_apart(story_graph):
+    collect(graph_events(story_graph, START, THREAD))
+    values = {"continue_instructions": "go on", "continue_branches": 3, "rewrite_instructions": ""}
+    events = collect(graph_events(story_graph, values, THREAD))
+
+    assert {data["branch"] for kind, data in events if kind == "token"} == {0, 1, 2}
+
+
+def test_frames_are_server_sent_events():
+    assert sse_format("chapter", {"title": "Één"}) == 'event: chapter\ndata: {"title": "\\u00c9\\u00e9n"}\n\n'
+
+
+def test_the_stream_ends_with_done_after_the_chapter(story_graph):
+    frames = collect(sse_stream(story_graph, START, THREAD, asyncio.Semaphore(1)))
+
+    assert [parse(frame)[0] for frame in frames[-2:]] == ["chapter", "done"]
+
+
+def test_failures_are_reported_in_the_stream(story_graph):
+    # The first chapter is missing its personas.
+    frames = collect(sse_stream(story_graph, {"instruction": "a story", "details": ""}, THREAD, asyncio.Semaphore(1)))
+
+    assert [parse(frame)[0] for frame in frames[-2:]] == ["error", "done"]
+    assert parse(frames[-2])[1]["detail"]
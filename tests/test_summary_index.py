@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from assistant.summary_index import hierarchical_summary
+
+
+def summarize_with(calls):
+    async def summarize(text):
+        calls.append(text)
+        return f"summary {len(calls)}"
+
+    return summarize
+
+
+def test_context_holds_the_highest_levels_and_the_recent_items():
+    calls = []
+    path = [str(number) for number in range(1, 11)]
+    summaries = [f"chapter {number}" for number in range(1, 11)]
+    index = {}
+    context = asyncio.run(hierarchical_summary(path, summaries, index, 3, summarize_with(calls)))
+    # Chapters 1-9 make three level-1 blocks and one level-2 block; chapter 10
+    # does not fill a block yet.
+    assert sorted(index) == ["3:1:3", "3:1:6", "3:1:9", "3:2:9"]
+    assert len(calls) == 4
+    assert context.startswith("Chapters 1-9\n\n")
+    assert context.endswith("Chapter 10\n\nchapter 10")
+
+
+def test_cached_blocks_are_not_summarised_again():
+    calls = []
+    path = [str(number) for number in range(1, 8)]
+    summaries = [f"chapter {number}" for number in range(1, 8)]
+    index = {}
+    asyncio.run(hierarchical_summary(path[:6], summaries[:6], index, 3, summarize_with(calls)))
+    calls.clear()
+    asyncio.run(hierarchical_summary(path, summaries, index, 3, summarize_with(calls)))
+    assert calls == []
+
+
+def test_blocks_of_another_fanout_are_not_reused():
+    calls = []
+    path = [str(number) for number in range(1, 7)]
+    summaries = [f"chapter {number}" for number in range(1, 7)]
+    index = {}
+    asyncio.run(hierarchical_summary(path, summaries, index, 3, summarize_with(calls)))
+    calls.clear()
+    context = asyncio.run(hierarchical_summary(path, summaries, index, 2, summarize_with(calls)))
+
+    # Chapters 1-2, 3-4 and 5-6, then 1-4: none of them is a block of three.
+    assert len(calls) == 4
+    assert calls[0].startswith("Chapter 1\n\nchapter 1\n\nChapter 2\n\n")
+    assert context.startswith("Chapters 1-4\n\n")
+    assert context.endswith("Chapters 5-6\n\n" + index["2:1:6"])
+
+
+@pytest.mark.parametrize("fanout", [1, 0, -1])
+def test_a_fanout_below_two_is_rejected(fanout):
+    with pytest.raises(ValueError):
+        asyncio.run(hierarchical_summary(["1", "2"], ["a", "b"], {}, fanout, summarize_with([])))
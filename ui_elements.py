@@ -1,5 +1,8 @@
 import streamlit as st
-from story_generator import get_logged_stories, split_story_into_segments
+import config
+import story_log
+import story_search
+from story_generator import split_story_into_segments
 
 def display_ui():
     st.write("## Story Parameters")
@@ -21,19 +24,59 @@ def display_ui():
         story_title = st.text_input("Enter a title for your story")
 
         # Option to select and retrieve previous stories
-        logged_stories = get_logged_stories()
-        story_options = [f"{i+1}: {entry.get('title', 'Untitled')} ({entry['timestamp']})" for i, entry in enumerate(logged_stories)]
-        selected_story = st.selectbox("Select a previously generated story to continue developing", ["None"] + story_options)
-
-        if selected_story != "None":
-            selected_story_index = story_options.index(selected_story) - 1
-            selected_story_entry = logged_stories[selected_story_index]
-            st.write("Selected Story Title:", selected_story_entry.get('title', 'Untitled'))
-            st.write("Selected Story Prompt:", selected_story_entry['prompt'])
-            st.write("Selected Story:", selected_story_entry['story'])
+        display_story_picker()
 
     return model, length, fiction_level, reality_level, informativeness, moral_theme, ip_avoidance, num_characters, story_title
 
+@st.cache_data(max_entries=1)
+def facet_counts(log_size):
+    """The facet counts of the logged stories, computed again only once the
+    log has grown to ``log_size`` bytes. log_story keeps the search index up
+    to date; stories logged by other processes are indexed here."""
+    story_search.update()
+    return story_search.facet_counts()
+
+def display_story_picker():
+    """Pick a logged story, newest first, a page at a time, optionally
+    searching their texts and filtering by story parameters. The picker only
+    reads the log's indexes; the body of the picked story is loaded alone."""
+    query = st.text_input("Search previous stories")
+    filters = {}
+    with st.expander("Filter previous stories"):
+        for facet, counts in facet_counts(story_log.size()).items():
+            choice = st.selectbox(
+                facet.replace("_", " ").capitalize(),
+                ["Any"] + list(counts),
+                format_func=lambda value, counts=counts: value if value == "Any" else f"{value} ({counts[value]})",
+            )
+            if choice != "Any":
+                filters[facet] = choice
+
+    page_size = config.STORY_PICKER_PAGE_SIZE
+    if query or filters:
+        page = st.number_input("Page of matching stories", min_value=1, value=1)
+        stories = story_search.search(query, limit=page_size, offset=(page - 1) * page_size, **filters)
+        if not stories:
+            st.write("No matching stories.")
+    else:
+        logged = story_log.index()
+        pages = max(1, -(-len(logged) // page_size))
+        page = st.number_input("Page of previous stories", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+        last = len(logged) - (page - 1) * page_size
+        stories = [dict(logged[number - 1], number=number) for number in range(last, max(0, last - page_size), -1)]
+    stories = {story["number"]: story for story in stories}
+    selected = st.selectbox(
+        "Select a previously generated story to continue developing",
+        [None] + list(stories),
+        format_func=lambda number: "None" if number is None else f"{number}: {stories[number]['title']} ({stories[number]['timestamp']})",
+    )
+
+    if selected is not None:
+        selected_story_entry = story_log.load(stories[selected])
+        st.write("Selected Story Title:", selected_story_entry.get('title', 'Untitled'))
+        st.write("Selected Story Prompt:", selected_story_entry['prompt'])
+        st.write("Selected Story:", selected_story_entry['story'])
+
 def display_story_segments(story):
     st.subheader("Modify your story:")
     segments = split_story_into_segments(story)